@@ -3,7 +3,7 @@
 
 {
     'name': "Bus Tickets - Core",
-    'version': '18.0.9.1.0',
+    'version': '18.0.9.8.0',
     'summary': "Core models and logic for the Bus Ticket System.",
     'author': "BUS-Tickets.info & IT Enterprise Solutions s.r.o.",
     'website': "https://bus-ticket.info",
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 # soubor: bus_ticket_core/controllers/__init__.py
 # -*- coding: utf-8 -*-
+from . import api_auth
 from . import main_api
 from . import order_api
 from . import public_api
\ No newline at end of file
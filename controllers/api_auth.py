@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/controllers/api_auth.py
+import logging
+from odoo.http import request
+
+_logger = logging.getLogger(__name__)
+
+
+def authenticate_by_description():
+    """Ověří požadavek podle JMÉNA (popisku) API klíče v hlavičce X-API-Key.
+
+    Společné pro všechny kontrolery; ověření se drží v cache (viz res.users.apikeys._bus_ticket_authenticate).
+    Vrací (uživatel, None), nebo (False, chybová zpráva).
+    """
+    key_description = request.httprequest.headers.get('X-API-Key')
+    if not key_description:
+        _logger.warning("API Authentication: Failed - Missing 'X-API-Key' header.")
+        return False, "Missing API Key in 'X-API-Key' header."
+
+    user_id = request.env['res.users.apikeys'].sudo()._bus_ticket_authenticate(key_description)
+    if not user_id:
+        _logger.warning("API Authentication: Failed - No key found with the given name.")
+        return False, "Invalid API Key."
+
+    _logger.debug("API Authentication: Success - user id %s.", user_id)
+    return request.env['res.users'].sudo().browse(user_id), None
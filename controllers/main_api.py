@@ -1,12 +1,34 @@
 # -*- coding: utf-8 -*-
+import base64
 import functools  
 import json
 from datetime import datetime, time, timedelta
 from odoo import http, fields
 from odoo.http import request, route, Response
+from ..models.city_pair_models import normalize_city
+from ..models.route_models import timetable_offset
+from ..tools import metrics
+from ..tools.journey_planner import from_seconds, to_seconds
+from ..tools.search_cache import get_search_cache
+from .api_auth import authenticate_by_description
 import logging
 _logger = logging.getLogger(__name__)
 
+# Klient si mapu sedadel může držet, ale před použitím ji vždy ověří přes ETag
+SEATS_CACHE_CONTROL = 'private, no-cache'
+# Maximální počet spojů v jednom dávkovém dotazu na dostupnost
+BATCH_AVAILABILITY_LIMIT = 100
+# Velikost stránky výsledků vyhledávání (výchozí a maximální)
+SEARCH_DEFAULT_LIMIT = 50
+SEARCH_MAX_LIMIT = 200
+# Plánovač cest: max. přestupů, počet itinerářů a výchozí minimální čas na přestup
+JOURNEY_MAX_TRANSFERS = 2
+JOURNEY_DEFAULT_LIMIT = 10
+JOURNEY_MAX_LIMIT = 50
+JOURNEY_MIN_CONNECTION_MINUTES = 15
+# Textový formát expozice Prometheus
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
 # --- Správná ověřovací funkce podle JMÉNA klíče ---
 
 def require_api_key(func):
@@ -21,14 +43,11 @@ def require_api_key(func):
             return func(self, *args, **kwargs)
         # --- KONEC DŮLEŽITÉ ÚPRAVY ---
 
-        # Zbytek tvé existující logiky pro kontrolu klíče už zůstává
-        api_key = request.httprequest.headers.get('X-API-KEY')
-        if not api_key:
+        # Ověření klíče sdíleným autentizátorem (s cache)
+        if not request.httprequest.headers.get('X-API-KEY'):
             return {'error': 'missing_api_key', 'message': 'Chybí hlavička X-API-KEY.'}
-
-        # Hledání klíče v databázi (tento kód už tam pravděpodobně máš)
-        api_key_record = request.env['bus.ticket.api.key'].sudo().search([('key', '=', api_key)], limit=1)
-        if not api_key_record:
+        user, _error_msg = authenticate_by_description()
+        if not user:
             return {'error': 'invalid_api_key', 'message': 'Poskytnutý API klíč není platný.'}
 
         # Pokud je vše v pořádku, zavolej původní funkci (např. get_stops)
@@ -50,40 +69,44 @@ class BusTicketApiController(http.Controller):
         return stops_data
 
 
-def _authenticate_by_description():
-    """Ověří požadavek podle JMÉNA (popisku) API klíče v hlavičce."""
-    key_description = request.httprequest.headers.get('X-API-Key')
-    if not key_description:
-        _logger.warning("API Authentication: Failed - Missing 'X-API-Key' header.")
-        return False, "Missing API Key in 'X-API-Key' header."
-    
-    key_record = request.env['res.users.apikeys'].sudo().search([('name', '=', key_description)], limit=1)
-    
-    if not key_record:
-        _logger.warning(f"API Authentication: Failed - No key found with name '{key_description}'.")
-        return False, "Invalid API Key."
-        
-    _logger.info(f"API Authentication: Success - Found key for user '{key_record.user_id.name}'.")
-    return key_record.user_id, None
-
-def _get_trip_data(trip):
-    """Naformátuje data o spoji pro API odpověď."""
-    return {
-        'id': trip.id, 'name': trip.name,
-        'route': trip.route_id.name if trip.route_id else None,
-        'departure_time': trip.departure_time.strftime('%Y-%m-%d %H:%M:%S') if trip.departure_time else None,
-        'arrival_time': trip.arrival_time.strftime('%Y-%m-%d %H:%M:%S') if trip.arrival_time else None,
-        'available_seats': trip.available_seats_count,
-        'vehicle': { 'name': trip.vehicle_id.name, 'license_plate': trip.vehicle_id.license_plate },
-        'driver': { 'name': trip.driver_id.name }
-    }
+def _encode_cursor(sort_key):
+    """Zakóduje klíč řazení (čas odjezdu, klíč spoje) posledního vráceného výsledku do kurzoru stránkování."""
+    return base64.urlsafe_b64encode(json.dumps(list(sort_key)).encode()).decode()
+
+def _decode_cursor(cursor):
+    """Dekóduje a ověří cursor stránkování (viz _result_sort_key); neplatný cursor vrací None."""
+    try:
+        departure_str, key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        departure_str, key = str(departure_str), str(key)
+        datetime.strptime(departure_str, '%Y-%m-%d %H:%M:%S')
+    except (ValueError, TypeError, AttributeError):
+        return None
+    # Materializovaný spoj 't<id>', virtuální odjezd 'v<ref>'
+    if key[:1] == 't' and key[1:].isascii() and key[1:].isdigit() or key[:1] == 'v' and key[1:]:
+        return departure_str, key
+    return None
+
+def _result_sort_key(trip_data):
+    """Klíč řazení výsledků: čas odjezdu, pak materializované spoje podle id před virtuálními podle ref."""
+    key = f"t{trip_data['id']:012d}" if trip_data['id'] else f"v{trip_data['ref']}"
+    return (trip_data['departure_time'], key)
+
+def _virtual_departure_sort_key(departure):
+    """_result_sort_key pro virtuální odjezd ještě před serializací (viz Template._get_virtual_departures)."""
+    return (departure['departure_time'].strftime('%Y-%m-%d %H:%M:%S'), f"v{departure['ref']}")
 
 class MainBusTicketApi(http.Controller):
 
     @http.route('/api/v1/trips/search', type='json', auth='none', methods=['POST'], csrf=False )
+    @metrics.instrument_request('trips_search')
     def search_trips(self, **kw):
-        """Vylepšené vyhledávání spojů."""
-        user, error_msg = _authenticate_by_description()
+        """Vylepšené vyhledávání spojů.
+
+        Výsledky jsou stránkované: volitelné parametry limit (výchozí SEARCH_DEFAULT_LIMIT) a cursor
+        (hodnota next_cursor z předchozí stránky).
+        """
+        user, error_msg = authenticate_by_description()
+        metrics.checkpoint('auth')
         if not user:
             return {'error': {'code': 401, 'message': error_msg}}
 
@@ -93,15 +116,37 @@ class MainBusTicketApi(http.Controller):
         if not all([from_city, to_city, departure_date_str]):
             return {'error': {'code': 400, 'message': 'Missing parameters'}}
 
+        cursor = _decode_cursor(params['cursor']) if params.get('cursor') else None
+        if params.get('cursor') and not cursor:
+            return {'error': {'code': 400, 'message': 'Invalid cursor'}}
         try:
+            limit = max(1, min(int(params.get('limit') or SEARCH_DEFAULT_LIMIT), SEARCH_MAX_LIMIT))
+            passengers = max(1, int(params.get('passengers') or 1))
             target_date = datetime.strptime(departure_date_str, '%Y-%m-%d').date()
-            Price = request.env['bus.ticket.price'].sudo()
-            valid_prices = Price.search([('stop_from_id.city', 'ilike', from_city), ('stop_to_id.city', 'ilike', to_city)])
-            if not valid_prices: return {'trips': []}
+        except (TypeError, ValueError):
+            return {'error': {'code': 400, 'message': 'Invalid limit, passengers or departure_date'}}
+
+        try:
+            search_cache = get_search_cache(request.env.cr.dbname)
+            # Zneplatnění z ostatních workerů (log v DB) se zpracují dřív, než se cache použije
+            snapshot = search_cache.sync(request.env.cr)
+            cache_key = (normalize_city(from_city), normalize_city(to_city), target_date, passengers, cursor, limit)
+            cached_result = search_cache.get(cache_key)
+            metrics.checkpoint('cache')
+            if cached_result is not None:
+                return cached_result
+            # Kandidátní trasy z předpočítaného indexu dvojic měst (jeden indexovaný dotaz)
+            city_pairs = request.env['bus.ticket.city.pair'].sudo()._lookup(from_city, to_city)
+            if not city_pairs: return {'trips': [], 'next_cursor': None}
 
-            valid_route_ids = valid_prices.mapped('route_id').ids
-            price_map = {price.route_id.id: price.price for price in valid_prices}
-            self._ensure_trips_exist_for_date(target_date, valid_route_ids)
+            valid_route_ids = city_pairs.mapped('route_id').ids
+            # Nástupní/výstupní zastávka pro každou trasu (nejdřívější nástup, pokud jich je ve městě víc)
+            segments = {}
+            for pair in city_pairs:
+                boarding_position = pair.route_id.fare_table['index'].get(str(pair.stop_from_id.id), 0)
+                if pair.route_id.id not in segments or boarding_position < segments[pair.route_id.id][0]:
+                    segments[pair.route_id.id] = (boarding_position, pair.stop_from_id.id, pair.stop_to_id.id)
+            metrics.checkpoint('city_pairs')
             
             start_date, end_date = target_date - timedelta(days=1), target_date + timedelta(days=2)
             domain = [
@@ -110,63 +155,197 @@ class MainBusTicketApi(http.Controller):
                 ('departure_time', '<=', datetime.combine(end_date, time.max)),
                 ('route_id', 'in', valid_route_ids),
             ]
-            found_trips = request.env['bus.ticket.trip'].sudo().search(domain, order='departure_time asc')
-            
-            response_trips = []
-            for trip in found_trips:
-                trip_data = _get_trip_data(trip)
-                trip_data['price'] = {'czk': price_map.get(trip.route_id.id, 0.0)}
-                trip_data['is_target_date'] = (trip.departure_time.date() == target_date)
-                response_trips.append(trip_data)
-            return {'trips': response_trips}
+            # Keyset stránkování: jen výsledky za kurzorem, nejvýš limit + 1 (pro zjištění další stránky)
+            if cursor:
+                cursor_departure = datetime.strptime(cursor[0], '%Y-%m-%d %H:%M:%S')
+                if cursor[1].startswith('t'):
+                    domain += ['|', ('departure_time', '>', cursor_departure),
+                               '&', ('departure_time', '=', cursor_departure), ('id', '>', int(cursor[1][1:]))]
+                else:
+                    domain += [('departure_time', '>', cursor_departure)]
+            found_trips = request.env['bus.ticket.trip'].sudo().search(domain, order='departure_time asc, id asc', limit=limit + 1)
+            # Odjezdy ze šablon, které ještě nejsou materializované - bez zápisu do DB; stejně jako u spojů
+            # se před serializací omezí kurzorem a na limit + 1
+            Template = request.env['bus.ticket.trip.template'].sudo()
+            virtual_departures = sorted((
+                departure for departure in Template._get_virtual_departures(valid_route_ids, start_date, end_date)
+                if not cursor or _virtual_departure_sort_key(departure) > cursor
+            ), key=_virtual_departure_sort_key)[:limit + 1]
+            metrics.checkpoint('trips')
+
+            page = found_trips._serialize_for_api() + Template._serialize_virtual_departures(virtual_departures)
+            route_by_trip = dict(zip(found_trips.ids, found_trips.mapped('route_id.id')))
+            route_by_ref = {d['ref']: d['template'].route_id.id for d in virtual_departures}
+            for trip_data in page:
+                trip_data['_route_id'] = route_by_trip[trip_data['id']] if trip_data['id'] else route_by_ref[trip_data['ref']]
+            page = sorted((t for t in page if not cursor or _result_sort_key(t) > cursor), key=_result_sort_key)
+            has_more = len(page) > limit
+            page = page[:limit]
+            metrics.checkpoint('serialize')
+
+            # Ceny všech výsledků jedním voláním cenové služby (ceny platí pro úsek, ne pro celou linku)
+            quotes = request.env['bus.ticket.route'].sudo()._quote_route_fares([
+                (t['_route_id'], segments[t['_route_id']][1], segments[t['_route_id']][2], passengers) for t in page
+            ])
+            metrics.checkpoint('pricing')
+            # Časy nástupu a výstupu na mezilehlých zastávkách z jízdních řádů tras (v cache)
+            timetables = request.env['bus.ticket.route'].sudo().browse(valid_route_ids)._get_timetables()
+            for trip_data, quote in zip(page, quotes):
+                route_id = trip_data.pop('_route_id')
+                quote = quote or {'unit_price': None, 'total': None, 'currency': None}
+                trip_data['price'] = {'czk': quote['unit_price'], 'total': quote['total'], 'currency': quote['currency']}
+                trip_data['from_stop_id'], trip_data['to_stop_id'] = segments[route_id][1:]
+                departure_dt = datetime.strptime(trip_data['departure_time'], '%Y-%m-%d %H:%M:%S')
+                for key, stop_id in (('boarding_time', segments[route_id][1]), ('alighting_time', segments[route_id][2])):
+                    offset = timetable_offset(timetables[route_id], stop_id)
+                    trip_data[key] = (departure_dt + offset).strftime('%Y-%m-%d %H:%M:%S') if offset is not None else None
+                trip_data['is_target_date'] = (trip_data['boarding_time'] or trip_data['departure_time']).startswith(departure_date_str)
+            metrics.checkpoint('timetable')
+
+            result = {'trips': page, 'next_cursor': _encode_cursor(_result_sort_key(page[-1])) if has_more else None}
+            search_cache.put(cache_key, result, route_ids=valid_route_ids, trip_ids=found_trips.ids, snapshot=snapshot)
+            return result
         except Exception as e:
             _logger.error(f"API Error in /trips/search: {e}", exc_info=True)
             return {'error': {'code': 500, 'message': 'Internal Server Error'}}
 
-    def _ensure_trips_exist_for_date(self, target_date, route_ids):
-        """Zkontroluje a případně vytvoří spoje ze šablon."""
-        Template = request.env['bus.ticket.trip.template'].sudo()
-        Trip = request.env['bus.ticket.trip'].sudo()
-        templates_to_check = Template.search([('active', '=', True), ('route_id', 'in', route_ids)])
+    @http.route('/api/v1/trips/search/cache', type='json', auth='none', methods=['POST'], csrf=False )
+    def search_cache_stats(self, **kw):
+        """Vrátí počitadla cache vyhledávání (hits/misses/evictions) pro její dimenzování."""
+        user, error_msg = authenticate_by_description()
+        if not user:
+            return {'error': {'code': 401, 'message': error_msg}}
+        return {'cache': get_search_cache(request.env.cr.dbname).stats()}
 
-        for template in templates_to_check:
-            day_of_week = target_date.weekday()
-            weekdays_map = {0: template.monday, 1: template.tuesday, 2: template.wednesday, 3: template.thursday, 4: template.friday, 5: template.saturday, 6: template.sunday}
-            
-            is_valid_day = weekdays_map.get(day_of_week, False)
-            is_in_date_range = (not template.date_from or template.date_from <= target_date) and \
-                               (not template.date_to or template.date_to >= target_date)
-            is_exception = request.env['bus.ticket.trip.template.exception'].sudo().search_count([
-                ('template_id', '=', template.id), ('date', '=', target_date)
-            ]) > 0
-
-            if is_valid_day and is_in_date_range and not is_exception:
-                departure_hour = int(template.departure_time)
-                departure_minute = int((template.departure_time * 60) % 60)
-                departure_dt = datetime.combine(target_date, datetime.min.time()).replace(hour=departure_hour, minute=departure_minute)
-
-                if not Trip.search_count([('trip_template_id', '=', template.id), ('departure_time', '=', departure_dt)]):
-                    arrival_dt = template._get_arrival_datetime(departure_dt)
-                    Trip.create({
-                        'route_id': template.route_id.id,
-                        'vehicle_id': template.vehicle_id.id,
-                        'driver_id': template.driver_id.id,
-                        'departure_time': departure_dt,
-                        'arrival_time': arrival_dt,
-                        'trip_template_id': template.id,
-                        'state': 'confirmed'
+    @http.route('/api/v1/journeys/search', type='json', auth='none', methods=['POST'], csrf=False )
+    @metrics.instrument_request('journeys_search')
+    def search_journeys(self, **kw):
+        """Plánovač cest s přestupy mezi linkami na společných zastávkách.
+
+        Parametry: from_city, to_city, departure_date, volitelně max_transfers (0-2, výchozí 2),
+        limit (výchozí JOURNEY_DEFAULT_LIMIT) a passengers. Minimální čas na přestup určuje
+        parametr bus_ticket_core.min_connection_minutes. Hledá se nad indexem spojení v paměti,
+        bez dotazů do DB pro jednotlivé úseky.
+        """
+        user, error_msg = authenticate_by_description()
+        metrics.checkpoint('auth')
+        if not user:
+            return {'error': {'code': 401, 'message': error_msg}}
+
+        params = request.get_json_data().get('params', {})
+        from_city, to_city, departure_date_str = params.get('from_city'), params.get('to_city'), params.get('departure_date')
+        if not all([from_city, to_city, departure_date_str]):
+            return {'error': {'code': 400, 'message': 'Missing parameters'}}
+
+        try:
+            target_date = datetime.strptime(departure_date_str, '%Y-%m-%d').date()
+            max_transfers = min(max(int(params.get('max_transfers', JOURNEY_MAX_TRANSFERS)), 0), JOURNEY_MAX_TRANSFERS)
+            limit = max(1, min(int(params.get('limit') or JOURNEY_DEFAULT_LIMIT), JOURNEY_MAX_LIMIT))
+            passengers = max(1, int(params.get('passengers') or 1))
+        except (TypeError, ValueError):
+            return {'error': {'code': 400, 'message': 'Invalid max_transfers, limit, passengers or departure_date'}}
+
+        try:
+            min_connection_minutes = int(request.env['ir.config_parameter'].sudo().get_param(
+                'bus_ticket_core.min_connection_minutes', JOURNEY_MIN_CONNECTION_MINUTES))
+
+            index = request.env['bus.ticket.trip'].sudo()._get_connection_index(target_date)
+            metrics.checkpoint('connection_index')
+            origin_stops = index.stops_by_city.get(normalize_city(from_city), ())
+            destination_stops = index.stops_by_city.get(normalize_city(to_city), ())
+            if not origin_stops or not destination_stops:
+                return {'journeys': []}
+            journeys = index.plan(
+                origin_stops, destination_stops,
+                to_seconds(datetime.combine(target_date, time.min)), to_seconds(datetime.combine(target_date, time.max)),
+                max_transfers=max_transfers, min_connection_time=min_connection_minutes * 60, limit=limit,
+            )
+            metrics.checkpoint('plan')
+
+            # Ceny všech úseků všech itinerářů jedním voláním cenové služby
+            legs = [leg for journey in journeys for leg in journey]
+            quotes = iter(request.env['bus.ticket.route'].sudo()._quote_route_fares([
+                (index.trips[trip_key]['route_id'], stop_from, stop_to, passengers)
+                for trip_key, stop_from, stop_to, _departure, _arrival in legs
+            ]))
+            journeys_data = []
+            for journey in journeys:
+                legs_data = []
+                for trip_key, stop_from, stop_to, departure, arrival in journey:
+                    trip_info, quote = index.trips[trip_key], next(quotes)
+                    legs_data.append({
+                        'trip_id': trip_info['trip_id'],
+                        'ref': trip_info['ref'],
+                        'route': trip_info['route'],
+                        'from_stop_id': stop_from,
+                        'to_stop_id': stop_to,
+                        'departure_time': from_seconds(departure).strftime('%Y-%m-%d %H:%M:%S'),
+                        'arrival_time': from_seconds(arrival).strftime('%Y-%m-%d %H:%M:%S'),
+                        'price': quote,
                     })
+                journeys_data.append({
+                    'departure_time': legs_data[0]['departure_time'],
+                    'arrival_time': legs_data[-1]['arrival_time'],
+                    'duration_minutes': (journey[-1][4] - journey[0][3]) // 60,
+                    'transfers': len(journey) - 1,
+                    'total_price': sum(leg['price']['total'] for leg in legs_data) if all(leg['price'] for leg in legs_data) else None,
+                    'legs': legs_data,
+                })
+            metrics.checkpoint('serialize')
+            return {'journeys': journeys_data}
+        except Exception as e:
+            _logger.error(f"API Error in /journeys/search: {e}", exc_info=True)
+            return {'error': {'code': 500, 'message': 'Internal Server Error'}}
+
+    @http.route('/api/v1/trips/seats', type='json', auth='none', methods=['POST'], csrf=False )
+    @metrics.instrument_request('trips_seats')
+    def get_trips_seat_availability(self, **kw):
+        """Dávková dostupnost sedadel pro více spojů najednou (kompaktní run-length kódování stavů).
+
+        Parametry: trip_ids (max. BATCH_AVAILABILITY_LIMIT), volitelně from_stop_id a to_stop_id.
+        """
+        user, error_msg = authenticate_by_description()
+        if not user:
+            return {'error': {'code': 401, 'message': error_msg}}
 
-    @http.route('/api/v1/trip/<int:trip_id>/seats', type='http', auth='none', methods=['GET'], csrf=False )
-    def get_trip_seats(self, trip_id, **kw):
-        """Vrátí seznam sedadel pro daný spoj."""
-        user, error_msg = _authenticate_by_description()
+        params = request.get_json_data().get('params', {})
+        trip_ids = params.get('trip_ids')
+        if not trip_ids or not isinstance(trip_ids, list) or not all(isinstance(t, int) for t in trip_ids):
+            return {'error': {'code': 400, 'message': 'Missing or invalid trip_ids'}}
+        if len(trip_ids) > BATCH_AVAILABILITY_LIMIT:
+            return {'error': {'code': 400, 'message': f'At most {BATCH_AVAILABILITY_LIMIT} trips per request'}}
+
+        trips = request.env['bus.ticket.trip'].sudo().browse(trip_ids).exists()
+        metrics.checkpoint('auth')
+        availability = trips._get_compact_availability(params.get('from_stop_id'), params.get('to_stop_id'))
+        metrics.checkpoint('availability')
+        return {'trips': {str(trip_id): data for trip_id, data in availability.items()}}
+
+    @http.route(['/api/v1/trip/<int:trip_id>/seats', '/api/v1/trip/<string:trip_ref>/seats'], type='http', auth='none', methods=['GET'], csrf=False )
+    @metrics.instrument_request('trip_seats')
+    def get_trip_seats(self, trip_id=None, trip_ref=None, **kw):
+        """Vrátí seznam sedadel pro daný spoj (virtuální odjezd ze šablony se teprve teď materializuje)."""
+        user, error_msg = authenticate_by_description()
+        metrics.checkpoint('auth')
         if not user:
             return Response(json.dumps({'error': error_msg}), status=401)
         
-        trip = request.env['bus.ticket.trip'].sudo().browse(trip_id)
-        if not trip.exists(): return Response(json.dumps({'error': 'Trip not found'}), status=404)
+        Trip = request.env['bus.ticket.trip'].sudo()
+        if trip_ref:
+            trip = Trip._resolve_trip_ref(trip_ref)
+            trip_id = trip.id
+            metrics.checkpoint('materialize')
+        # Verze sedadel jedním lehkým dotazem - při shodě ETagu se sedadla vůbec nenačítají
+        seat_version = Trip._get_seat_versions([trip_id]).get(trip_id) if trip_id else None
+        metrics.checkpoint('etag')
+        if seat_version is None: return Response(json.dumps({'error': 'Trip not found'}), status=404)
 
+        etag = f"trip-{trip_id}-{seat_version}"
+        headers = [('ETag', f'"{etag}"'), ('Cache-Control', SEATS_CACHE_CONTROL)]
+        if request.httprequest.if_none_match.contains(etag):
+            return Response(status=304, headers=headers)
+
+        trip = Trip.browse(trip_id)
         seats_data = [{'id': s.id, 'name': s.name, 'number': s.number, 'state': s.state, 'pos_x': s.pos_x, 'pos_y': s.pos_y} for s in trip.seat_ids]
         response_data = {
             'seats': seats_data,
@@ -176,4 +355,16 @@ class MainBusTicketApi(http.Controller):
                 'max_y': max((s['pos_y'] for s in seats_data), default=0),
             }
         }
-        return Response(json.dumps(response_data), content_type='application/json; charset=utf-8', status=200)
+        metrics.checkpoint('seats')
+        return Response(json.dumps(response_data), content_type='application/json; charset=utf-8', status=200, headers=headers)
+
+    @http.route('/api/v1/metrics', type='http', auth='none', methods=['GET'], csrf=False )
+    def get_metrics(self, **kw):
+        """Metriky rezervačního API a cronů ve formátu Prometheus.
+
+        Vrací jen hodnoty procesu workeru, který požadavek obsloužil (omezení viz metrics.MetricsRegistry).
+        """
+        user, error_msg = authenticate_by_description()
+        if not user:
+            return Response(json.dumps({'error': error_msg}), status=401)
+        return Response(metrics.registry.render_prometheus(), content_type=METRICS_CONTENT_TYPE, status=200)
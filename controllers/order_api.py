@@ -2,38 +2,39 @@
 # soubor: bus_ticket_core/controllers/order_api.py
 import json
 from datetime import datetime
+from psycopg2 import OperationalError
 from odoo import http
+from odoo.exceptions import ConcurrencyError
 from odoo.http import request, Response
+from ..tools import metrics
+from .api_auth import authenticate_by_description
 import logging
 
 _logger = logging.getLogger(__name__)
 
-# Pomocná funkce pro ověření klíče
-def _authenticate_by_description():
-    key_description = request.httprequest.headers.get('X-API-Key')
-    if not key_description:
-        return False, "Missing API Key (description) in 'X-API-Key' header."
-    
-    key_record = request.env['res.users.apikeys'].sudo().search([('name', '=', key_description)], limit=1)
-    if not key_record:
-        return False, "Invalid API Key (description)."
-    
-    # Můžeme přidat i kontrolu expirace, pokud ji budete používat
-    # if key_record.expire_date and key_record.expire_date < datetime.now().date():
-    #     return False, "This API Key is expired."
-        
-    return key_record.user_id, None
+# Maximální počet položek (spojů) v jedné dávkové objednávce
+BATCH_ORDER_LIMIT = 50
+# Maximální počet objednávek v jednom oznámení o platbě
+PAYMENT_CONFIRM_LIMIT = 5000
+# Chyby souběhu (materializace spoje, serializační chyba, deadlock, zámek), po kterých Odoo požadavek
+# zopakuje v novém snímku; obecný handler endpointů je proto nesmí spolknout jako chybu 500
+RETRYABLE_ERRORS = (ConcurrencyError, OperationalError)
 
+def _json_response(data, status=200):
+    return Response(json.dumps(data), content_type='application/json; charset=utf-8', status=status)
 
 class OrderBusTicketApi(http.Controller):
     @http.route('/api/v1/order/create', type='http', auth='none', methods=['POST'], csrf=False )
+    @metrics.instrument_request('order_create')
     def create_order(self, **kw):
         """
         Vytvoří novou cenovou nabídku (Sale Order) pro vybraná sedadla.
         Ověřuje pomocí popisku API klíče v hlavičce X-API-Key.
-        Očekává JSON s: {trip_id, seat_ids, customer_info: {name, email, phone}}
+        Očekává JSON s: {trip_id (id nebo reference virtuálního odjezdu), seat_ids, customer_info: {name, email, phone}},
+        volitelně from_stop_id, to_stop_id (úsek jízdy) a allow_partial (objednat i jen část sedadel).
         """
-        user, error_msg = _authenticate_by_description()
+        user, error_msg = authenticate_by_description()
+        metrics.checkpoint('auth')
         if not user:
             return Response(json.dumps({'error': error_msg}), content_type='application/json; charset=utf-8', status=401)
 
@@ -48,28 +49,34 @@ class OrderBusTicketApi(http.Controller):
                 return Response(json.dumps({'error': 'Missing required data (trip_id, seat_ids, customer_info).'}), status=400)
 
             env = request.env(user=user.id)
+            stop_from_id, stop_to_id = data.get('from_stop_id'), data.get('to_stop_id')
             
-            # 2. Kontrola dostupnosti sedadel
-            seats = env['bus.ticket.trip.seat'].browse(seat_ids)
-            if not seats:
+            # 2. Atomické zabrání sedadel (žádné čtení stavu předem -> žádný double-booking)
+            trip = env['bus.ticket.trip'].sudo()._resolve_trip_ref(trip_id).with_env(env)
+            seats = env['bus.ticket.trip.seat'].browse(seat_ids).exists().filtered(lambda s: s.trip_id == trip)
+            if not trip or not seats or len(seats) != len(set(seat_ids)):
                  return Response(json.dumps({'error': 'Invalid seat IDs provided.'}), status=400)
-            if any(s.state != 'available' for s in seats):
+            leg_mask = trip._get_segment_masks(stop_from_id, stop_to_id)[trip.id]
+            if not leg_mask:
+                return Response(json.dumps({'error': 'The trip does not serve the requested stops.'}), status=400)
+            metrics.checkpoint('validate')
+            claimed_seats = seats._claim_seats(stop_from_id, stop_to_id, allow_partial=bool(data.get('allow_partial')))
+            metrics.checkpoint('claim')
+            if not claimed_seats:
                 return Response(json.dumps({'error': 'One or more selected seats are no longer available.'}), status=409)
             
             # 3. Nalezení nebo vytvoření zákazníka (res.partner)
-            partner = env['res.partner'].search([('email', '=', customer_info.get('email'))], limit=1)
-            if not partner:
-                partner = env['res.partner'].create({
-                    'name': customer_info.get('name'),
-                    'email': customer_info.get('email'),
-                    'phone': customer_info.get('phone'),
-                })
+            partner = env['res.partner']._bus_ticket_get_customers([customer_info])[0]
+            metrics.checkpoint('partner')
             
-            # 4. Vytvoření cenové nabídky (sale.order)
+            # 4. Vytvoření cenové nabídky (sale.order) jen ze získaných sedadel
             ticket_product = env.ref('bus_ticket_core.product_product_bus_ticket')
-            trip = env['bus.ticket.trip'].browse(trip_id)
-            price = ticket_product.list_price
+            # Cena úseku z tarifu linky; úsek bez ceny v tarifu ocení _quote_route_fares produktovou cenou
+            quote = env['bus.ticket.route'].sudo()._quote_fares([(trip.id, stop_from_id, stop_to_id, len(claimed_seats))])[0]
+            price = quote['unit_price'] if quote else ticket_product.list_price
+            metrics.checkpoint('pricing')
 
+            hold_expires_at = env['sale.order.line']._get_seat_hold_expiry()
             order = env['sale.order'].create({
                 'partner_id': partner.id,
                 'order_line': [
@@ -79,24 +86,182 @@ class OrderBusTicketApi(http.Controller):
                         'price_unit': price,
                         'trip_id': trip.id,
                         'seat_id': seat.id,
-                    }) for seat in seats
+                        'stop_from_id': stop_from_id,
+                        'stop_to_id': stop_to_id,
+                        'leg_mask': leg_mask,
+                        'hold_expires_at': hold_expires_at,
+                    }) for seat in claimed_seats
                 ]
             })
 
-            # 5. Okamžitá rezervace sedadel
-            seats.write({'state': 'reserved'})
-            
-            # 6. Vrácení skutečných dat o objednávce
+            # 5. Vrácení skutečných dat o objednávce
+            order.flush_recordset()
+            metrics.checkpoint('order')
             response_data = {
                 'order': {
                     'id': order.id,
                     'name': order.name,
                     'amount_total': order.amount_total,
                     'currency': order.currency_id.name,
-                }
+                    'hold_expires_at': hold_expires_at.strftime('%Y-%m-%d %H:%M:%S'),
+                },
+                'reserved_seat_ids': claimed_seats.ids,
+                'rejected_seat_ids': (seats - claimed_seats).ids,
             }
             return Response(json.dumps(response_data), content_type='application/json; charset=utf-8', status=200)
 
+        except RETRYABLE_ERRORS:
+            # Souběžná materializace spoje nebo souběžné zabrání sedadel: Odoo požadavek zopakuje v novém snímku
+            raise
         except Exception as e:
+            # Zabraná sedadla nesmí zůstat rezervovaná bez objednávky
+            request.env.cr.rollback()
             _logger.error(f"API Error in /order/create for user {user.login}: {e}")
-            return Response(json.dumps({'error': 'An internal error occurred while creating the order.'}), content_type='application/json; charset=utf-8', status=500)
\ No newline at end of file
+            return Response(json.dumps({'error': 'An internal error occurred while creating the order.'}), content_type='application/json; charset=utf-8', status=500)
+    @http.route('/api/v1/order/batch', type='http', auth='none', methods=['POST'], csrf=False )
+    @metrics.instrument_request('order_batch')
+    def create_batch_order(self, **kw):
+        """
+        Vytvoří v jedné transakci cenové nabídky pro více spojů najednou (skupiny, zpáteční jízdenky).
+        Očekává JSON s: {items: [{trip_id, seat_ids, customer_info?, from_stop_id?, to_stop_id?}], customer_info?};
+        customer_info na úrovni dávky platí pro položky bez vlastního zákazníka.
+        Sedadla všech položek se zaberou atomicky - buď všechna, nebo žádné (409). Každá položka dostane
+        vlastní objednávku, výsledky se vrací ve stejném pořadí jako položky.
+        """
+        user, error_msg = authenticate_by_description()
+        metrics.checkpoint('auth')
+        if not user:
+            return _json_response({'error': error_msg}, status=401)
+
+        try:
+            data = json.loads(request.httprequest.data)
+            items = data.get('items')
+            if not items or not isinstance(items, list) or len(items) > BATCH_ORDER_LIMIT:
+                return _json_response({'error': f'Provide between 1 and {BATCH_ORDER_LIMIT} items.'}, status=400)
+            customer_infos = [item.get('customer_info') or data.get('customer_info') for item in items]
+            if not all(item.get('trip_id') and item.get('seat_ids') for item in items) or not all(customer_infos):
+                return _json_response({'error': 'Every item requires trip_id, seat_ids and customer_info.'}, status=400)
+            all_seat_ids = [seat_id for item in items for seat_id in item['seat_ids']]
+            if len(all_seat_ids) != len(set(all_seat_ids)):
+                return _json_response({'error': 'A seat can be ordered only once per batch.'}, status=400)
+
+            env = request.env(user=user.id)
+            Trip = env['bus.ticket.trip']
+            # 1. Spoje (virtuální odjezdy se materializují) a masky úseků všech položek
+            trips = [Trip.sudo()._resolve_trip_ref(item['trip_id']).with_env(env) for item in items]
+            seats = env['bus.ticket.trip.seat'].browse(all_seat_ids).exists()
+            trip_by_seat = {seat.id: seat.trip_id for seat in seats}
+            seat_masks = {}
+            for index, (item, trip) in enumerate(zip(items, trips)):
+                if not trip or any(trip_by_seat.get(seat_id) != trip for seat_id in item['seat_ids']):
+                    return _json_response({'error': 'Invalid seat IDs provided.', 'item': index}, status=400)
+                leg_mask = trip._get_segment_masks(item.get('from_stop_id'), item.get('to_stop_id'))[trip.id]
+                if not leg_mask:
+                    return _json_response({'error': 'The trip does not serve the requested stops.', 'item': index}, status=400)
+                seat_masks.update(dict.fromkeys(item['seat_ids'], leg_mask))
+            metrics.checkpoint('validate')
+
+            # 2. Atomické zabrání všech sedadel dávky najednou
+            if not env['bus.ticket.trip.seat']._claim_seats_with_masks(seat_masks, allow_partial=False):
+                return _json_response({'error': 'One or more selected seats are no longer available.'}, status=409)
+            metrics.checkpoint('claim')
+
+            # 3. Zákazníci jedním dotazem, ceny jedním voláním cenové služby
+            partners = env['res.partner']._bus_ticket_get_customers(customer_infos)
+            metrics.checkpoint('partner')
+            ticket_product = env.ref('bus_ticket_core.product_product_bus_ticket')
+            quotes = env['bus.ticket.route'].sudo()._quote_fares([
+                (trip.id, item.get('from_stop_id'), item.get('to_stop_id'), len(item['seat_ids']))
+                for item, trip in zip(items, trips)
+            ])
+            metrics.checkpoint('pricing')
+
+            # 4. Objednávky a jejich řádky hromadně (dva create pro celou dávku)
+            orders = env['sale.order'].create([{'partner_id': partner.id} for partner in partners])
+            hold_expires_at = env['sale.order.line']._get_seat_hold_expiry()
+            seat_names = {seat.id: seat.name or seat.number for seat in seats}
+            line_vals = []
+            for order, item, trip, quote in zip(orders, items, trips, quotes):
+                for seat_id in item['seat_ids']:
+                    line_vals.append({
+                        'order_id': order.id,
+                        'product_id': ticket_product.id,
+                        'name': f"Ticket: {trip.name or ''} - Seat {seat_names[seat_id]}",
+                        'price_unit': quote['unit_price'] if quote else ticket_product.list_price,
+                        'trip_id': trip.id,
+                        'seat_id': seat_id,
+                        'stop_from_id': item.get('from_stop_id'),
+                        'stop_to_id': item.get('to_stop_id'),
+                        'leg_mask': seat_masks[seat_id],
+                        'hold_expires_at': hold_expires_at,
+                    })
+            env['sale.order.line'].create(line_vals)
+            env.flush_all()
+            metrics.checkpoint('order')
+
+            # 5. Výsledky po položkách
+            response_data = {
+                'items': [{
+                    'order': {
+                        'id': order.id,
+                        'name': order.name,
+                        'amount_total': order.amount_total,
+                        'currency': order.currency_id.name,
+                    },
+                    'trip_id': trip.id,
+                    'reserved_seat_ids': item['seat_ids'],
+                } for order, item, trip in zip(orders, items, trips)],
+                'hold_expires_at': hold_expires_at.strftime('%Y-%m-%d %H:%M:%S'),
+            }
+            return _json_response(response_data)
+
+        except RETRYABLE_ERRORS:
+            # Souběžná materializace spoje nebo souběžné zabrání sedadel: Odoo požadavek zopakuje v novém snímku
+            raise
+        except Exception as e:
+            # Zabraná sedadla ani materializované spoje nesmí zůstat bez objednávek
+            request.env.cr.rollback()
+            _logger.error(f"API Error in /order/batch for user {user.login}: {e}")
+            return _json_response({'error': 'An internal error occurred while creating the orders.'}, status=500)
+
+    @http.route('/api/v1/payment/confirm', type='http', auth='none', methods=['POST'], csrf=False )
+    @metrics.instrument_request('payment_confirm')
+    def confirm_payment(self, **kw):
+        """
+        Platební webhook: po zaplacení hromadně potvrdí objednávky (sedadla se prodají jedním
+        množinovým zápisem, viz sale.order._bus_ticket_confirm_orders).
+        Očekává JSON s: {order_ids: [...]}; opakované doručení téhož oznámení je bezpečné,
+        už potvrzené objednávky se vrátí ve skipped_order_ids. Potvrdit lze jen objednávky jízdenek,
+        které vytvořil uživatel volajícího API klíče; ostatní id se také vrátí ve skipped_order_ids.
+        """
+        user, error_msg = authenticate_by_description()
+        metrics.checkpoint('auth')
+        if not user:
+            return _json_response({'error': error_msg}, status=401)
+
+        try:
+            data = json.loads(request.httprequest.data)
+            order_ids = data.get('order_ids')
+            if (not order_ids or not isinstance(order_ids, list) or len(order_ids) > PAYMENT_CONFIRM_LIMIT
+                    or not all(isinstance(order_id, int) for order_id in order_ids)):
+                return _json_response({'error': f'Provide between 1 and {PAYMENT_CONFIRM_LIMIT} order IDs.'}, status=400)
+
+            env = request.env(user=user.id)
+            own_order_ids = env['sale.order'].search([
+                ('id', 'in', order_ids), ('create_uid', '=', user.id), ('order_line.trip_id', '!=', False),
+            ]).ids
+            metrics.checkpoint('validate')
+            confirmed = env['sale.order']._bus_ticket_confirm_orders(own_order_ids)
+            metrics.checkpoint('confirm')
+            return _json_response({
+                'confirmed_order_ids': confirmed.ids,
+                'skipped_order_ids': sorted(set(order_ids) - set(confirmed.ids)),
+            })
+
+        except RETRYABLE_ERRORS:
+            # Souběžné potvrzení týchž sedadel: Odoo požadavek zopakuje v novém snímku
+            raise
+        except Exception as e:
+            request.env.cr.rollback()
+            _logger.error(f"API Error in /payment/confirm for user {user.login}: {e}")
+            return _json_response({'error': 'An internal error occurred while confirming the orders.'}, status=500)
@@ -3,15 +3,28 @@
 import json
 from odoo import http
 from odoo.http import request, Response
+from ..tools import metrics
 import logging
 _logger = logging.getLogger(__name__)
 
+# Seznam měst se mění zřídka -> může ho držet i CDN
+CITIES_CACHE_CONTROL = 'public, max-age=300, s-maxage=3600'
+
 class PublicBusTicketApi(http.Controller):
     # UJISTĚTE SE, ŽE JE ZDE 'GET' A 'auth="public"'
     @http.route('/api/v1/cities', type='http', auth='public', methods=['GET'], csrf=False )
+    @metrics.instrument_request('cities')
     def get_cities(self, **kw):
         """Vrátí unikátní seznam měst ze všech zastávek."""
         try:
+            # Verze tabulky zastávek jedním lehkým dotazem - při shodě ETagu se zastávky vůbec nenačítají
+            stop_version = request.env['bus.ticket.stop'].sudo()._get_stop_version()
+            etag = f"cities-{stop_version}"
+            headers = [('ETag', f'"{etag}"'), ('Cache-Control', CITIES_CACHE_CONTROL)]
+            if request.httprequest.if_none_match.contains(etag):
+                metrics.checkpoint('etag')
+                return Response(status=304, headers=headers)
+
             # Použijeme read_group pro efektivní získání unikátních měst
             grouped_data = request.env['bus.ticket.stop'].read_group(
                 [('city', '!=', False), ('city', '!=', '')], 
@@ -21,11 +34,13 @@ class PublicBusTicketApi(http.Controller):
             )
             # Extrahuje názvy měst ze seskupených dat
             cities = [g['city'] for g in grouped_data]
+            metrics.checkpoint('cities')
             
             return Response(
                 json.dumps({'cities': cities}), 
                 content_type='application/json; charset=utf-8', 
-                status=200
+                status=200,
+                headers=headers
             )
         except Exception as e:
             _logger.error(f"API Error in /cities: {e}")
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/migrations/18.0.9.2.0/post-migrate.py
+
+
+def migrate(cr, version):
+    """Již prodaná/rezervovaná sedadla obsazují všechny úseky linky."""
+    if not version:
+        return
+    cr.execute("""
+        UPDATE bus_ticket_trip_seat AS seat
+           SET leg_mask = (1 << LEAST(GREATEST(legs.stop_count - 1, 1), 31)) - 1
+          FROM (
+                SELECT trip.id AS trip_id, count(way_point.id) AS stop_count
+                  FROM bus_ticket_trip AS trip
+             LEFT JOIN bus_ticket_way_point AS way_point ON way_point.route_id = trip.route_id
+              GROUP BY trip.id
+               ) AS legs
+         WHERE seat.trip_id = legs.trip_id
+           AND seat.state != 'available'
+    """)
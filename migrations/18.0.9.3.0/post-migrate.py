@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/migrations/18.0.9.3.0/post-migrate.py
+
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    """Naplní index dvojic měst z existujících cenových řádků."""
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env['bus.ticket.city.pair']._rebuild_all()
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/migrations/18.0.9.4.0/post-migrate.py
+
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    """Převede ceník z řádků pro každou dvojici zastávek na kumulativní ceny waypointů.
+
+    Kumulativní cena waypointu = cena z první zastávky linky do něj. Řádky, které z ní
+    plynou (nebo jsou nulové), se smažou; ostatní zůstanou jako ruční výjimky.
+    """
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {'bus_ticket_defer_city_pairs': True})
+    for route in env['bus.ticket.route'].search([]):
+        lines = route.stop_line_ids.sorted('sequence')
+        if not lines:
+            continue
+        first_stop_id = lines[0].stop_id.id
+        prices = {(price.stop_from_id.id, price.stop_to_id.id): price.price for price in route.price_ids}
+        for line in lines[1:]:
+            line.fare_offset = prices.get((first_stop_id, line.stop_id.id), 0.0)
+        route.generate_pricing()
+    env['bus.ticket.city.pair']._rebuild_all()
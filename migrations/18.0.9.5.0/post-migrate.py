@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/migrations/18.0.9.5.0/post-migrate.py
+
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    """Naplní knihu statistik spojů z existujících objednávek."""
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env['bus.ticket.trip.stats']._rebuild()
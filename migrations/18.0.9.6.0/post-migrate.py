@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/migrations/18.0.9.6.0/post-migrate.py
+
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    """Srovná skupiny zobrazení spojů, které už se nepřepočítávají automaticky."""
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    cr.execute("UPDATE bus_ticket_trip SET display_group = 'future' WHERE display_group IS NULL")
+    env['bus.ticket.trip']._cron_rollover_display_group()
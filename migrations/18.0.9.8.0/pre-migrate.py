@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/migrations/18.0.9.8.0/pre-migrate.py
+
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """Odstraní duplicitní spoje šablon před přidáním UNIQUE(trip_template_id, departure_time).
+
+    Ze skupiny spojů se stejnou šablonou a časem odjezdu zůstane spojem šablony jeden (přednostně
+    ten s prodanými jízdenkami, jinak nejstarší). Ostatní duplicity s jízdenkami se od šablony odpojí
+    (zůstanou jako samostatné spoje i se sedadly a objednávkami), duplicity bez jízdenek se smažou.
+    """
+    if not version:
+        return
+    cr.execute("""
+        WITH trip AS (
+            SELECT trip.id, trip.trip_template_id, trip.departure_time,
+                   EXISTS(SELECT 1 FROM sale_order_line AS line WHERE line.trip_id = trip.id) AS has_tickets
+              FROM bus_ticket_trip AS trip
+             WHERE trip.trip_template_id IS NOT NULL
+        ), ranked AS (
+            SELECT id, has_tickets,
+                   row_number() OVER (PARTITION BY trip_template_id, departure_time ORDER BY has_tickets DESC, id) AS position
+              FROM trip
+        )
+        SELECT id, has_tickets FROM ranked WHERE position > 1
+    """)
+    duplicates = cr.fetchall()
+    detached_ids = tuple(trip_id for trip_id, has_tickets in duplicates if has_tickets)
+    removed_ids = tuple(trip_id for trip_id, has_tickets in duplicates if not has_tickets)
+    if detached_ids:
+        cr.execute("UPDATE bus_ticket_trip SET trip_template_id = NULL WHERE id IN %s", [detached_ids])
+    if removed_ids:
+        for table, model_column in (('mail_message', 'model'), ('mail_followers', 'res_model'), ('mail_activity', 'res_model')):
+            cr.execute(f"DELETE FROM {table} WHERE {model_column} = 'bus.ticket.trip' AND res_id IN %s", [removed_ids])
+        cr.execute("DELETE FROM bus_ticket_trip_seat WHERE trip_id IN %s", [removed_ids])
+        cr.execute("DELETE FROM bus_ticket_trip WHERE id IN %s", [removed_ids])
+    if duplicates:
+        _logger.info("Bus Tickets: removed %s and detached %s duplicate template trips.", len(removed_ids), len(detached_ids))
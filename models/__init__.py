@@ -14,6 +14,10 @@ from . import seat_models
 # 2. Poté načteme hlavní modely, které používají ty předchozí.
 from . import route_models
 from . import trip_models
+from . import city_pair_models
+from . import trip_stats_models
+from . import trip_archive_models
 
 # 3. Nakonec načteme modely, které dědí z ostatních.
-from . import inherited_models
\ No newline at end of file
+from . import inherited_models
+from . import res_users_apikeys
\ No newline at end of file
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/models/city_pair_models.py
+
+import unicodedata
+
+from itertools import combinations
+
+from odoo import models, fields, api
+from odoo.tools import create_index
+from ..tools.search_cache import invalidate_search_cache
+from .route_models import serves_segment
+
+
+def normalize_city(city):
+    """Normalizuje název města pro vyhledávání: bez diakritiky, malými písmeny, bez nadbytečných mezer."""
+    if not city:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', city)
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(stripped.casefold().split())
+
+
+# ===================================================================
+# Předpočítaný index (město odkud, město kam) -> trasa, zastávky, cena
+# ===================================================================
+class BusCityPair(models.Model):
+    _name = 'bus.ticket.city.pair'
+    _description = 'City Pair Lookup Index'
+    _log_access = False
+
+    from_city_key = fields.Char(string="From City (normalized)", required=True)
+    to_city_key = fields.Char(string="To City (normalized)", required=True)
+    route_id = fields.Many2one('bus.ticket.route', string="Route", required=True, ondelete='cascade', index=True)
+    stop_from_id = fields.Many2one('bus.ticket.stop', string="From Stop", required=True, ondelete='cascade')
+    stop_to_id = fields.Many2one('bus.ticket.stop', string="To Stop", required=True, ondelete='cascade')
+    price = fields.Float(string="Price")
+
+    def init(self):
+        create_index(self.env.cr, 'bus_ticket_city_pair_lookup_index', self._table, ['from_city_key', 'to_city_key'])
+
+    @api.model
+    def _lookup(self, from_city, to_city):
+        """Najde kandidátní trasy pro dvojici měst jediným indexovaným dotazem na rovnost."""
+        return self.search([
+            ('from_city_key', '=', normalize_city(from_city)),
+            ('to_city_key', '=', normalize_city(to_city)),
+        ])
+
+    @api.model
+    def _prepare_route_pairs(self, route):
+        """Hodnoty řádků indexu pro všechny dvojice zastávek trasy (v pořadí jízdy) s vyplněným městem.
+
+        Úsek bez ceny v tarifu linky má v indexu cenu 0; vyhledá se, cenu mu dá až _quote_route_fares.
+        """
+        vals_list = []
+        for line_from, line_to in combinations(route.stop_line_ids.sorted('sequence'), 2):
+            stop_from, stop_to = line_from.stop_id, line_to.stop_id
+            if not stop_from.city or not stop_to.city or not serves_segment(route.fare_table, stop_from.id, stop_to.id):
+                continue
+            fare = route._get_fare(stop_from.id, stop_to.id) or 0.0
+            vals_list.append({
+                'from_city_key': normalize_city(stop_from.city),
+                'to_city_key': normalize_city(stop_to.city),
+                'route_id': route.id,
+                'stop_from_id': stop_from.id,
+                'stop_to_id': stop_to.id,
+                'price': fare,
+            })
+        return vals_list
+
+    @api.model
+    def _refresh_routes(self, route_ids):
+        """Přepočítá řádky indexu pro zadané trasy ze všech dvojic jejich zastávek a tarifní tabulky."""
+        route_ids = list(set(route_ids))
+        if not route_ids:
+            return
+        self.search([('route_id', 'in', route_ids)]).unlink()
+        vals_list = []
+        for route in self.env['bus.ticket.route'].browse(route_ids).exists():
+            vals_list += self._prepare_route_pairs(route)
+        self.create(vals_list)
+        invalidate_search_cache(self.env, route_ids=route_ids)
+
+    @api.model
+    def _refresh_prices(self, route_ids):
+        """Aktualizuje jen ceny řádků indexu tras po změně jízdného (zastávky se nemění).
+
+        Změněné ceny se přepíšou jedním UPDATE; trasy, jejichž dvojice v indexu neodpovídají zastávkám
+        (index se mezitím nepřepočítal), se přepočítají celé přes _refresh_routes.
+        """
+        route_ids = list(set(route_ids))
+        if not route_ids:
+            return
+        pairs_by_key = {
+            (pair.route_id.id, pair.stop_from_id.id, pair.stop_to_id.id): pair
+            for pair in self.search([('route_id', 'in', route_ids)])
+        }
+        rebuild_route_ids, price_updates = [], {}
+        for route in self.env['bus.ticket.route'].browse(route_ids).exists():
+            expected = {(vals['route_id'], vals['stop_from_id'], vals['stop_to_id']): vals['price']
+                        for vals in self._prepare_route_pairs(route)}
+            if expected.keys() != {key for key in pairs_by_key if key[0] == route.id}:
+                rebuild_route_ids.append(route.id)
+                continue
+            price_updates.update({pairs_by_key[key].id: price for key, price in expected.items()
+                                  if pairs_by_key[key].price != price})
+        if price_updates:
+            self.flush_model(['price'])
+            self.env.cr.execute("""
+                UPDATE bus_ticket_city_pair AS pair SET price = updated.price
+                  FROM unnest(%s::int[], %s::float8[]) AS updated(id, price)
+                 WHERE pair.id = updated.id
+            """, [list(price_updates), list(price_updates.values())])
+            self.browse(price_updates).invalidate_recordset(['price'])
+        self._refresh_routes(rebuild_route_ids)
+        invalidate_search_cache(self.env, route_ids=route_ids)
+
+    @api.model
+    def _rebuild_all(self):
+        self._refresh_routes(self.env['bus.ticket.route'].search([]).ids)
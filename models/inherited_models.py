@@ -2,32 +2,233 @@
 # soubor: bus_ticket_core/models/inherited_models.py
 
 # -*- coding: utf-8 -*-
-from odoo import models, fields
+import logging
+from datetime import timedelta
+from odoo import models, fields, api
+from odoo.tools import email_normalize, split_every
+from ..tools import metrics
+from .trip_stats_models import mark_trip_stats_dirty
+
+_logger = logging.getLogger(__name__)
 
 class FleetVehicle(models.Model):
     _inherit = 'fleet.vehicle'
     seat_layout_id = fields.Many2one('bus.ticket.seat.layout', string="Seat Layout")
     seat_layout_total_seats = fields.Integer(related='seat_layout_id.total_seats', string="Total Seats", readonly=True)
 
+class ResPartner(models.Model):
+    _inherit = 'res.partner'
+
+    @api.model
+    def _bus_ticket_get_customers(self, customer_infos):
+        """Najde nebo založí zákazníky pro seznam {name, email, phone}; vrací partnery ve stejném pořadí.
+
+        Existující partneři se hledají jedním dotazem přes indexované email_normalized, chybějící
+        se založí jedním create (zákazník se stejným e-mailem jen jednou).
+        """
+        emails = [email_normalize(info.get('email') or '') for info in customer_infos]
+        partner_by_email = {}
+        for partner in self.search([('email_normalized', 'in', [email for email in emails if email])], order='id'):
+            partner_by_email.setdefault(partner.email_normalized, partner)
+        missing = {}
+        for info, email in zip(customer_infos, emails):
+            key = email or id(info)
+            if email not in partner_by_email and key not in missing:
+                missing[key] = {'name': info.get('name') or info.get('email'), 'email': info.get('email'), 'phone': info.get('phone')}
+        new_partners = self.create(list(missing.values()))
+        new_by_key = dict(zip(missing, new_partners))
+        return [partner_by_email.get(email) or new_by_key[email or id(info)] for info, email in zip(customer_infos, emails)]
+
 class SaleOrderLine(models.Model):
     _inherit = 'sale.order.line'
     seat_id = fields.Many2one('bus.ticket.trip.seat', string="Reserved Seat")
     trip_id = fields.Many2one('bus.ticket.trip', string="Trip", ondelete='set null')
+    # Úsek jízdenky a jím obsazené úseky sedadla (viz bus.ticket.trip.seat.leg_mask)
+    stop_from_id = fields.Many2one('bus.ticket.stop', string="From Stop")
+    stop_to_id = fields.Many2one('bus.ticket.stop', string="To Stop")
+    leg_mask = fields.Integer(string="Occupied Legs", default=0)
+    # Nezaplacená rezervace sedadla propadne v tento okamžik (viz _cron_release_expired_holds)
+    hold_expires_at = fields.Datetime(string="Hold Expires At", index='btree_not_null', copy=False)
+    # Jízdenka na archivovaný spoj (spoj i sedadlo už neexistují, viz bus.ticket.trip.archive)
+    archive_id = fields.Many2one('bus.ticket.trip.archive', string="Archived Trip", index='btree_not_null', readonly=True, copy=False)
+
+    # Pole řádku, jejichž změna mění statistiky spoje (bus.ticket.trip.stats)
+    _TRIP_STATS_FIELDS = {'trip_id', 'seat_id', 'order_id', 'price_unit', 'product_uom_qty', 'discount', 'tax_id'}
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        lines._mark_trip_stats_dirty()
+        return lines
+
+    def write(self, vals):
+        if self._TRIP_STATS_FIELDS.isdisjoint(vals):
+            return super().write(vals)
+        self._mark_trip_stats_dirty()
+        res = super().write(vals)
+        self._mark_trip_stats_dirty()
+        return res
+
+    def unlink(self):
+        self._mark_trip_stats_dirty()
+        return super().unlink()
+
+    def _mark_trip_stats_dirty(self):
+        mark_trip_stats_dirty(self.env, set(self.trip_id.ids) | set(self.seat_id.trip_id.ids))
+
+    @api.model
+    def _get_seat_hold_expiry(self):
+        """Čas propadnutí nové rezervace podle parametru bus_ticket_core.seat_hold_minutes (výchozí 15 min)."""
+        minutes = int(self.env['ir.config_parameter'].sudo().get_param('bus_ticket_core.seat_hold_minutes', 15))
+        return fields.Datetime.now() + timedelta(minutes=minutes)
+
+    def _release_ticket_seats(self):
+        """Uvolní úseky sedadel obsazené řádky v self jedním UPDATE; vrací dotčená sedadla.
+
+        Sedadlo, kterému nezůstane žádný obsazený úsek, se vrátí do stavu 'available'.
+        Řádky bez masky (starší objednávky) uvolňují celé sedadlo.
+        """
+        lines = self.filtered('seat_id')
+        if not lines:
+            return self.env['bus.ticket.trip.seat']
+        self.env['bus.ticket.trip.seat'].flush_model(['state', 'leg_mask'])
+        lines.flush_recordset(['seat_id', 'leg_mask'])
+        self.env.cr.execute("""
+            WITH released AS (
+                SELECT seat_id, bit_or(CASE WHEN leg_mask = 0 THEN -1 ELSE leg_mask END) AS mask
+                  FROM sale_order_line
+                 WHERE id IN %s
+                 GROUP BY seat_id
+            )
+            UPDATE bus_ticket_trip_seat AS seat
+               SET leg_mask = seat.leg_mask & ~released.mask,
+                   state = CASE WHEN seat.leg_mask & ~released.mask = 0 THEN 'available' ELSE seat.state END,
+                   write_uid = %s,
+                   write_date = now() at time zone 'UTC'
+              FROM released, bus_ticket_trip_seat AS old
+             WHERE seat.id = released.seat_id
+               AND old.id = seat.id
+         RETURNING seat.id, seat.trip_id, old.state, seat.state
+        """, [tuple(lines.ids), self.env.uid])
+        transitions = self.env.cr.fetchall()
+        Seat = self.env['bus.ticket.trip.seat']
+        seats = Seat.browse(row[0] for row in transitions)
+        seats.invalidate_recordset(['state', 'leg_mask', 'write_uid', 'write_date'])
+        Seat._apply_state_transitions(transitions)
+        return seats
+
+    def _sell_ticket_seats(self):
+        """Označí sedadla řádků v self jako prodaná jedním UPDATE; vrací dotčená sedadla.
+
+        Sedadlo převezme úseky řádků (řádky bez masky, tj. starší objednávky, obsadí celé sedadlo),
+        změny stavů se promítnou do čítačů spojů najednou.
+        """
+        lines = self.filtered('seat_id')
+        if not lines:
+            return self.env['bus.ticket.trip.seat']
+        self.env['bus.ticket.trip.seat'].flush_model(['state', 'leg_mask'])
+        lines.flush_recordset(['seat_id', 'leg_mask'])
+        self.env.cr.execute("""
+            WITH sold AS (
+                SELECT seat_id, bit_or(CASE WHEN leg_mask = 0 THEN -1 ELSE leg_mask END) AS mask
+                  FROM sale_order_line
+                 WHERE id IN %s
+                 GROUP BY seat_id
+            )
+            UPDATE bus_ticket_trip_seat AS seat
+               SET leg_mask = seat.leg_mask | sold.mask,
+                   state = 'sold',
+                   write_uid = %s,
+                   write_date = now() at time zone 'UTC'
+              FROM sold, bus_ticket_trip_seat AS old
+             WHERE seat.id = sold.seat_id
+               AND old.id = seat.id
+         RETURNING seat.id, seat.trip_id, old.state, seat.state
+        """, [tuple(lines.ids), self.env.uid])
+        transitions = self.env.cr.fetchall()
+        Seat = self.env['bus.ticket.trip.seat']
+        seats = Seat.browse(row[0] for row in transitions)
+        seats.invalidate_recordset(['state', 'leg_mask', 'write_uid', 'write_date'])
+        Seat._apply_state_transitions(transitions)
+        return seats
+
+    @api.model
+    @metrics.instrument_job('release_expired_holds')
+    def _cron_release_expired_holds(self):
+        """Metoda volaná CRONem: hromadně uvolní všechny propadlé rezervace sedadel.
+
+        Uvolní úseky sedadel, odpojí řádky od sedadel a zruší návrhy objednávek,
+        kterým nezůstalo žádné rezervované sedadlo.
+        """
+        self.flush_model(['hold_expires_at', 'seat_id', 'order_id'])
+        self.env['sale.order'].flush_model(['state'])
+        self.env.cr.execute("""
+            SELECT line.id
+              FROM sale_order_line AS line
+              JOIN sale_order AS so ON so.id = line.order_id
+             WHERE line.hold_expires_at < now() at time zone 'UTC'
+               AND line.seat_id IS NOT NULL
+               AND so.state IN ('draft', 'sent')
+               FOR UPDATE OF line SKIP LOCKED
+        """)
+        expired_lines = self.browse(row[0] for row in self.env.cr.fetchall())
+        if not expired_lines:
+            return
+        expired_lines._release_ticket_seats()
+        self.env.cr.execute("""
+            UPDATE sale_order_line SET seat_id = NULL, hold_expires_at = NULL WHERE id IN %s
+        """, [tuple(expired_lines.ids)])
+        expired_lines.invalidate_recordset(['seat_id', 'hold_expires_at'])
+        orders = expired_lines.order_id.filtered(lambda o: not o.order_line.filtered('seat_id'))
+        orders._action_cancel()
+        _logger.info("Bus Tickets: released %s expired seat holds, cancelled %s orders.", len(expired_lines), len(orders))
 
 # soubor: bus_ticket_core/models/inherited_models.py
 
 class SaleOrder(models.Model):
     _inherit = 'sale.order'
 
+    def write(self, vals):
+        res = super().write(vals)
+        if 'state' in vals:
+            self.order_line._mark_trip_stats_dirty()
+        return res
+
     def action_confirm(self):
         # OPRAVA: Použijeme přímé volání super() bez argumentů
         res = super().action_confirm()
-
-        # Naše vlastní logika zůstává stejná
-        for order in self:
-            ticket_lines = order.order_line.filtered(lambda line: line.seat_id)
-            if ticket_lines:
-                seats_to_update = ticket_lines.mapped('seat_id')
-                seats_to_update.write({'state': 'sold'})
-        
+        self._bus_ticket_confirm_seats()
         return res
+
+    def _bus_ticket_confirm_seats(self):
+        """Prodá sedadla všech objednávek v self najednou a zruší jejich rezervační lhůty.
+
+        Sedadla přejdou do stavu 'sold' jedním UPDATE, čítače a verze sedadel se upraví jednou
+        za každý dotčený spoj (viz SaleOrderLine._sell_ticket_seats).
+        """
+        ticket_lines = self.order_line.filtered('seat_id')
+        ticket_lines._sell_ticket_seats()
+        # Zaplacená sedadla už nepropadají
+        ticket_lines.filtered('hold_expires_at').write({'hold_expires_at': False})
+
+    @api.model
+    def _bus_ticket_confirm_orders(self, order_ids, batch_size=500):
+        """Hromadně potvrdí objednávky podle id (platební webhook, dávka od platební brány, fronta úloh).
+
+        Přeskočí neexistující a už potvrzené objednávky, takže opakované volání je bezpečné.
+        Zpracovává po dávkách batch_size; vrací potvrzené objednávky.
+        """
+        confirmed = self.browse()
+        for batch_ids in split_every(batch_size, order_ids):
+            orders = self.browse(batch_ids).exists().filtered(lambda o: o.state in ('draft', 'sent'))
+            if orders:
+                orders.action_confirm()
+                confirmed |= orders
+        _logger.info("Bus Tickets: confirmed %s of %s orders in bulk.", len(confirmed), len(order_ids))
+        return confirmed
+
+    def _action_cancel(self):
+        # Zrušená objednávka vrací svá sedadla do prodeje
+        self.order_line._release_ticket_seats()
+        self.order_line.filtered('hold_expires_at').write({'hold_expires_at': False})
+        return super()._action_cancel()
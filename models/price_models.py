@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 # soubor: bus_ticket_core/models/price_models.py
 
-from odoo import models, fields
+from odoo import models, fields, api
 
 # ===================================================================
 # Model pro Ceny (Price)
@@ -30,3 +30,27 @@ class BusPrice(models.Model):
         related='route_id.company_id.currency_id',
         store=True # Je dobrým zvykem u related polí přidat store=True pro lepší výkon
     )
+
+    # Změny cen udržují ceny v indexu bus.ticket.city.pair aktuální (zastávky tras se jimi nemění)
+    _CITY_PAIR_FIELDS = {'route_id', 'stop_from_id', 'stop_to_id', 'price'}
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        prices = super().create(vals_list)
+        if not self.env.context.get('bus_ticket_defer_city_pairs'):
+            self.env['bus.ticket.city.pair']._refresh_prices(prices.route_id.ids)
+        return prices
+
+    def write(self, vals):
+        route_ids = self.route_id.ids
+        res = super().write(vals)
+        if self._CITY_PAIR_FIELDS.intersection(vals) and not self.env.context.get('bus_ticket_defer_city_pairs'):
+            self.env['bus.ticket.city.pair']._refresh_prices(route_ids + self.route_id.ids)
+        return res
+
+    def unlink(self):
+        route_ids = self.route_id.ids
+        res = super().unlink()
+        if not self.env.context.get('bus_ticket_defer_city_pairs'):
+            self.env['bus.ticket.city.pair']._refresh_prices(route_ids)
+        return res
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/models/res_users_apikeys.py
+
+import hashlib
+import time
+
+from odoo import models, fields, api, tools
+from odoo.tools import create_index
+
+# Jak dlouho (s) smí worker věřit ověření API klíče z cache
+API_KEY_CACHE_TTL = 300
+
+
+class ResUsersApikeys(models.Model):
+    _inherit = 'res.users.apikeys'
+
+    def init(self):
+        super().init()
+        # API ověřuje klíče podle popisku (name) -> index místo sekvenčního průchodu
+        create_index(self.env.cr, 'res_users_apikeys_name_index', self._table, ['name'])
+
+    @api.model
+    def _bus_ticket_authenticate(self, key_description):
+        """Vrátí id uživatele pro popisek API klíče, nebo False.
+
+        Výsledek se drží v ormcache pod hashem klíče (samotný klíč v cache není) a po
+        uplynutí API_KEY_CACHE_TTL se ověří znovu. Vytvoření i zrušení klíče cache
+        zneplatní ve všech workerech.
+        """
+        key_hash = hashlib.sha256(key_description.encode()).hexdigest()
+        ttl_bucket = int(time.time() // API_KEY_CACHE_TTL)
+        return self._bus_ticket_lookup_user_id(key_hash, ttl_bucket, key_description)
+
+    @tools.ormcache('key_hash', 'ttl_bucket')
+    def _bus_ticket_lookup_user_id(self, key_hash, ttl_bucket, key_description):
+        domain = [('name', '=', key_description)]
+        if 'expiration_date' in self._fields:
+            domain += ['|', ('expiration_date', '=', False), ('expiration_date', '>', fields.Datetime.now())]
+        key_record = self.sudo().search(domain, limit=1)
+        return key_record.user_id.id or False
+
+    def _generate(self, *args, **kwargs):
+        key = super()._generate(*args, **kwargs)
+        self.env.registry.clear_cache()
+        return key
+
+    def unlink(self):
+        res = super().unlink()
+        self.env.registry.clear_cache()
+        return res
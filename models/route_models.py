@@ -1,8 +1,43 @@
 # -*- coding: utf-8 -*-
 # Soubor: bus_ticket_core/models/route_models.py
 
-from odoo import models, fields, api
-from itertools import combinations
+from datetime import timedelta
+
+from odoo import models, fields, api, tools, _
+from odoo.exceptions import UserError, ValidationError
+
+
+def serves_segment(fare_table, stop_from_id, stop_to_id):
+    """True, pokud linka s tarifní tabulkou fare_table jede ze stop_from_id do stop_to_id (v tomto směru)."""
+    if not fare_table:
+        return False
+    index = fare_table['index']
+    start, end = index.get(str(stop_from_id)), index.get(str(stop_to_id))
+    return start is not None and end is not None and end > start
+
+
+def lookup_fare(fare_table, stop_from_id, stop_to_id):
+    """Cena úseku z tarifní tabulky linky v O(1); None, pokud linka úsek neobsluhuje nebo pro něj
+    nemá kladnou cenu (např. nově vložená zastávka, které ještě nikdo nezadal jízdné).
+
+    Ruční výjimka (bus.ticket.price) má přednost před rozdílem kumulativních cen waypointů.
+    """
+    if not serves_segment(fare_table, stop_from_id, stop_to_id):
+        return None
+    override = fare_table['overrides'].get(f"{stop_from_id}-{stop_to_id}")
+    if override is None:
+        index = fare_table['index']
+        override = fare_table['fares'][index[str(stop_to_id)]] - fare_table['fares'][index[str(stop_from_id)]]
+    return override if override > 0 else None
+
+
+def timetable_offset(timetable, stop_id):
+    """Jízdní doba z první zastávky linky na zastávku stop_id podle jízdního řádu; None, pokud ji linka nemá."""
+    for timetable_stop_id, offset in timetable:
+        if timetable_stop_id == stop_id:
+            return offset
+    return None
+
 
 class BusRoute(models.Model):
     _name = 'bus.ticket.route'
@@ -12,8 +47,12 @@ class BusRoute(models.Model):
 
     name = fields.Char(string="Route Name", required=True, tracking=True, translate=True)
     stop_line_ids = fields.One2many('bus.ticket.way.point', 'route_id', string='Stops (Waypoints)')
-    price_ids = fields.One2many('bus.ticket.price', 'route_id', string='Pricing')
+    price_ids = fields.One2many('bus.ticket.price', 'route_id', string='Price Overrides')
+    # Kompaktní tarif linky: {'index': {stop_id: pozice}, 'fares': [kumulativní ceny], 'overrides': {"od-do": cena}}
+    fare_table = fields.Json(string="Fare Table", compute='_compute_fare_table', store=True)
     company_id = fields.Many2one('res.company', string='Company', required=True, default=lambda self: self.env.company)
+    # Verze jízdního řádu (klíč cache _load_timetable); bere se ze sekvence, takže se nikdy neopakuje ani po rollbacku
+    timetable_version = fields.Integer(string="Timetable Version", default=0, readonly=True, copy=False)
 
     # --- INFORMATIVNÍ POLE ---
     start_stop_id = fields.Many2one('bus.ticket.stop', string="Start Stop", compute='_compute_start_end_stops', store=True)
@@ -30,24 +69,186 @@ class BusRoute(models.Model):
                 route.start_stop_id = False
                 route.end_stop_id = False
     
-    def generate_pricing(self):
+    @api.depends('stop_line_ids.sequence', 'stop_line_ids.stop_id', 'stop_line_ids.fare_offset',
+                 'price_ids.stop_from_id', 'price_ids.stop_to_id', 'price_ids.price')
+    def _compute_fare_table(self):
+        for route in self:
+            route.fare_table = route._build_fare_table(with_overrides=True)
+
+    def init(self):
+        self.env.cr.execute("CREATE SEQUENCE IF NOT EXISTS bus_ticket_route_timetable_version_seq")
+
+    def _bump_timetable_version(self):
+        """Zneplatní jízdní řády linek v self (volá se při každé změně jejich waypointů)."""
+        if not self:
+            return
+        self.env.cr.execute("""
+            UPDATE bus_ticket_route SET timetable_version = nextval('bus_ticket_route_timetable_version_seq')
+             WHERE id IN %s
+        """, [tuple(self.ids)])
+        self.invalidate_recordset(['timetable_version'])
+
+    @tools.ormcache('route_id', 'timetable_version')
+    def _load_timetable(self, route_id, timetable_version):
+        """Jízdní řád linky: n-tice (stop_id, jízdní doba od první zastávky) seřazená podle sekvence waypointů."""
+        self.env['bus.ticket.way.point'].flush_model(['route_id', 'stop_id', 'sequence', 'offset_days', 'offset_time'])
+        self.env.cr.execute("""
+            SELECT stop_id, offset_days, offset_time FROM bus_ticket_way_point
+             WHERE route_id = %s ORDER BY sequence, id
+        """, [route_id])
+        return tuple(
+            (stop_id, timedelta(days=offset_days or 0, hours=offset_time or 0.0))
+            for stop_id, offset_days, offset_time in self.env.cr.fetchall()
+        )
+
+    def _get_timetables(self):
+        """Jízdní řády linek v self {route_id: timetable} z cache; dotaz jen pro linky se změněnou verzí."""
+        return {route.id: self._load_timetable(route.id, route.timetable_version) for route in self}
+
+    def _get_travel_duration(self):
+        """Jízdní doba linky z první na poslední zastávku."""
+        self.ensure_one()
+        timetable = self._load_timetable(self.id, self.timetable_version)
+        return timetable[-1][1] if timetable else timedelta()
+
+    def _build_fare_table(self, with_overrides=True):
+        self.ensure_one()
+        lines = self.stop_line_ids.sorted('sequence')
+        index = {}
+        for position, line in enumerate(lines):
+            index.setdefault(str(line.stop_id.id), position)
+        overrides = {}
+        if with_overrides:
+            overrides = {f"{price.stop_from_id.id}-{price.stop_to_id.id}": price.price for price in self.price_ids if price.price}
+        return {'index': index, 'fares': [line.fare_offset for line in lines], 'overrides': overrides}
+
+    def _get_fare(self, stop_from_id, stop_to_id):
+        self.ensure_one()
+        return lookup_fare(self.fare_table, stop_from_id, stop_to_id)
+
+    @api.model
+    def _quote_fares(self, items):
+        """Ocení najednou vektor položek [(trip_id, stop_from_id, stop_to_id, počet cestujících)].
+
+        Spoje, tarifní tabulky tras a měny se načtou předem (pár dotazů bez ohledu na počet položek),
+        položky se pak oceňují v paměti. Vrací seznam ve stejném pořadí, viz _quote_route_fares.
+        """
+        trips = self.env['bus.ticket.trip'].browse({item[0] for item in items})
+        route_by_trip = {trip['id']: trip['route_id'] and trip['route_id'][0] for trip in trips.read(['route_id'])}
+        return self._quote_route_fares([
+            (route_by_trip.get(trip_id), stop_from_id, stop_to_id, passengers)
+            for trip_id, stop_from_id, stop_to_id, passengers in items
+        ])
+
+    @api.model
+    def _quote_route_fares(self, items):
+        """Ocení položky [(route_id, stop_from_id, stop_to_id, počet cestujících)] z předem načtených tarifů.
+
+        Bez zastávek se oceňuje celá linka. Každá položka dostane {'unit_price', 'total', 'currency'},
+        nebo None, pokud linka úsek neobsluhuje. Obsluhovaný úsek bez kladné ceny (linka bez tarifu,
+        nově vložená zastávka) se ocení produktovou cenou jízdenky, aby se neprodával zadarmo.
+        """
+        routes = self.browse({item[0] for item in items if item[0]})
+        tables = {route['id']: route['fare_table'] for route in routes.read(['fare_table'])}
+        currencies = {route.id: route.company_id.currency_id.name for route in routes}
+        fallback_price = None
+        quotes = []
+        for route_id, stop_from_id, stop_to_id, passengers in items:
+            table = tables.get(route_id)
+            if table and table['index'] and not (stop_from_id and stop_to_id):
+                by_position = sorted(table['index'], key=table['index'].get)
+                stop_from_id = stop_from_id or int(by_position[0])
+                stop_to_id = stop_to_id or int(by_position[-1])
+            fare = lookup_fare(table, stop_from_id, stop_to_id)
+            if fare is None:
+                if not serves_segment(table, stop_from_id, stop_to_id):
+                    quotes.append(None)
+                    continue
+                if fallback_price is None:
+                    fallback_price = self.env.ref('bus_ticket_core.product_product_bus_ticket').sudo().list_price
+                fare = fallback_price
+            quotes.append({'unit_price': fare, 'total': fare * (passengers or 1), 'currency': currencies[route_id]})
+        return quotes
+
+    # Obsazenost sedadla je bitová maska přes úseky linky (sloupec int4) -> max. 31 úseků
+    MAX_LEGS = 31
+
+    @api.constrains('stop_line_ids')
+    def _check_leg_count(self):
+        for route in self:
+            if len(route.stop_line_ids) - 1 > self.MAX_LEGS:
+                raise ValidationError(_("Route %(route)s has too many stops, at most %(count)s are supported.",
+                                        route=route.name, count=self.MAX_LEGS + 1))
+
+    def _get_stop_ids(self):
+        """Vrátí id zastávek linky seřazená podle sekvence waypointů."""
         self.ensure_one()
-        Price = self.env['bus.ticket.price']
-        self.price_ids.unlink()
-        stops = self.stop_line_ids.sorted('sequence')
-        if len(stops) < 2:
+        return [line.stop_id.id for line in self.stop_line_ids.sorted('sequence')]
+
+    def _check_legs_editable(self):
+        """Zastávky linek v self (a tím úseky, na které ukazují bity leg_mask) nejdou měnit,
+        dokud má některý nedokončený spoj linky obsazené sedadlo.
+        """
+        if not self:
             return
+        self.env['bus.ticket.trip'].flush_model(['route_id', 'state'])
+        self.env['bus.ticket.trip.seat'].flush_model(['trip_id', 'state', 'leg_mask'])
+        self.env.cr.execute("""
+            SELECT DISTINCT trip.route_id
+              FROM bus_ticket_trip AS trip
+              JOIN bus_ticket_trip_seat AS seat ON seat.trip_id = trip.id
+             WHERE trip.route_id IN %s
+               AND trip.state NOT IN ('done', 'cancelled')
+               AND (seat.leg_mask != 0 OR seat.state != 'available')
+        """, [tuple(self.ids)])
+        occupied_routes = self.browse(row[0] for row in self.env.cr.fetchall())
+        if occupied_routes:
+            raise UserError(_("The stops of route %(routes)s cannot be added, removed or reordered while "
+                              "its trips have reserved or sold seats.",
+                              routes=', '.join(occupied_routes.mapped('name'))))
+
+    def _get_full_leg_mask(self):
+        """Maska všech úseků linky; linka bez úseků se chová jako jeden úsek."""
+        self.ensure_one()
+        return (1 << max(len(self.stop_line_ids) - 1, 1)) - 1
+
+    def _get_segment_mask(self, stop_from_id=None, stop_to_id=None):
+        """Bitová maska úseků mezi dvěma zastávkami (úsek i vede ze zastávky i do zastávky i+1).
 
-        price_vals = [
-            {
-                'route_id': self.id,
-                'stop_from_id': stop_from.stop_id.id,
-                'stop_to_id': stop_to.stop_id.id
-            }
-            for stop_from, stop_to in combinations(stops, 2)
-        ]
-        if price_vals:
-            Price.create(price_vals)
+        Bez zastávek vrací masku celé linky, pro úsek, který linka neobsluhuje, vrací 0.
+        """
+        self.ensure_one()
+        if not stop_from_id and not stop_to_id:
+            return self._get_full_leg_mask()
+        stop_ids = self._get_stop_ids()
+        if stop_from_id and stop_from_id not in stop_ids:
+            return 0
+        start = stop_ids.index(stop_from_id) if stop_from_id else 0
+        if stop_to_id:
+            if stop_to_id not in stop_ids[start + 1:]:
+                return 0
+            end = stop_ids.index(stop_to_id, start + 1)
+        else:
+            end = len(stop_ids) - 1
+        if end <= start:
+            return 0
+        return ((1 << (end - start)) - 1) << start
+
+    def generate_pricing(self):
+        """Vyčistí ceník linky: ceny úseků plynou z kumulativních cen waypointů, takže ponechá jen
+        ruční výjimky, které se od nich liší. Nulové a nadbytečné řádky a řádky úseků, které linka
+        už neobsluhuje, smaže; ceny waypointů ani platné výjimky nemění.
+        """
+        self.ensure_one()
+        base_table = self._build_fare_table(with_overrides=False)
+        redundant_prices = self.price_ids.filtered(lambda price: (
+            not price.price
+            or not serves_segment(base_table, price.stop_from_id.id, price.stop_to_id.id)
+            or lookup_fare(base_table, price.stop_from_id.id, price.stop_to_id.id) == price.price
+        ))
+        # Index měst přepočítáme jednou na konci
+        redundant_prices.with_context(bus_ticket_defer_city_pairs=True).unlink()
+        self.env['bus.ticket.city.pair']._refresh_prices(self.ids)
 
 class BusStop(models.Model):
     _name = 'bus.ticket.stop'
@@ -56,6 +257,53 @@ class BusStop(models.Model):
     name = fields.Char(string='Stop Name', required=True, translate=True)
     city = fields.Char(string='City', compute='_compute_city', store=True, help="City is automatically extracted from the stop name.")
 
+    # Klíč verze tabulky zastávek v ir.config_parameter
+    _STOP_VERSION_KEY = 'bus_ticket_core.stop_version'
+
+    def init(self):
+        self.env.cr.execute("CREATE SEQUENCE IF NOT EXISTS bus_ticket_stop_version_seq")
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        stops = super().create(vals_list)
+        self._bump_stop_version()
+        return stops
+
+    def unlink(self):
+        res = super().unlink()
+        self._bump_stop_version()
+        return res
+
+    @api.model
+    def _bump_stop_version(self):
+        """Zvýší verzi tabulky zastávek (ETag seznamu měst v /api/v1/cities).
+
+        Hodnota je ze sekvence (souběžné změny nedostanou stejnou verzi) a zapisuje se přímo SQL:
+        set_param by při každé změně zastávky vyprázdnil ormcache všech workerů.
+        """
+        self.env.cr.execute("""
+            INSERT INTO ir_config_parameter (key, value, create_uid, create_date, write_uid, write_date)
+            VALUES (%(key)s, nextval('bus_ticket_stop_version_seq')::text, %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC')
+            ON CONFLICT (key) DO UPDATE
+               SET value = EXCLUDED.value, write_uid = EXCLUDED.write_uid, write_date = EXCLUDED.write_date
+        """, {'key': self._STOP_VERSION_KEY, 'uid': self.env.uid})
+
+    @api.model
+    def _get_stop_version(self):
+        """Aktuální verze tabulky zastávek jedním dotazem (ormcache get_param se při změně nemaže)."""
+        self.env.cr.execute("SELECT value FROM ir_config_parameter WHERE key = %s", [self._STOP_VERSION_KEY])
+        row = self.env.cr.fetchone()
+        return row[0] if row else '0'
+
+    def write(self, vals):
+        res = super().write(vals)
+        if 'name' in vals:
+            self._bump_stop_version()
+            # Změna názvu mění město -> přepočítáme index dvojic měst dotčených tras
+            way_points = self.env['bus.ticket.way.point'].search([('stop_id', 'in', self.ids)])
+            self.env['bus.ticket.city.pair']._refresh_routes(way_points.route_id.ids)
+        return res
+
     @api.depends('name')
     def _compute_city(self):
         for stop in self:
@@ -1,7 +1,65 @@
 # -*- coding: utf-8 -*-
 # soubor: bus_ticket_core/models/seat_models.py
 
-from odoo import models, fields, api
+from collections import defaultdict
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from ..tools import metrics
+
+
+def _build_seat_grid(total_seats, cols=5, aisle_col=2):
+    """Rozmístí sedadla do mřížky o `cols` sloupcích s uličkou ve sloupci `aisle_col`.
+
+    Vrací seznam [number, pos_x, pos_y, name] – stejný tvar, jaký ukládá `seat_template`.
+    """
+    grid = []
+    current_row, current_col = 0, 0
+    for number in range(1, total_seats + 1):
+        if current_col == aisle_col: current_col += 1
+        grid.append([number, current_col, current_row, f"Seat {number}"])
+        current_col += 1
+        if current_col >= cols: current_col, current_row = 0, current_row + 1
+    return grid
+
+# Jednoznakové kódy stavů sedadel pro kompaktní kódování dostupnosti
+SEAT_STATE_CODES = {'available': 'A', 'reserved': 'R', 'sold': 'S'}
+
+
+def encode_seat_states(codes):
+    """Zakóduje posloupnost kódů stavů run-length řetězcem, např. 'AAAARRA' -> 'A4R2A1'."""
+    encoded = []
+    previous, run = None, 0
+    for code in codes:
+        if code == previous:
+            run += 1
+            continue
+        if previous is not None:
+            encoded.append(f"{previous}{run}")
+        previous, run = code, 1
+    if previous is not None:
+        encoded.append(f"{previous}{run}")
+    return ''.join(encoded)
+
+
+def decode_seat_states(encoded):
+    """Inverze k encode_seat_states: 'A4R2A1' -> 'AAAARRA'."""
+    decoded, code, run = [], None, ''
+    for char in encoded or '':
+        if char.isdigit():
+            run += char
+            continue
+        if code is not None:
+            decoded.append(code * int(run))
+        code, run = char, ''
+    if code is not None:
+        decoded.append(code * int(run))
+    return ''.join(decoded)
+
+
+class _SeatClaimIncomplete(Exception):
+    """Interní signál pro rollback savepointu, když se nepodařilo získat všechna sedadla."""
+
 
 class SeatLayout(models.Model):
     _name = 'bus.ticket.seat.layout'
@@ -18,12 +76,20 @@ class SeatLayout(models.Model):
 
     total_seats = fields.Integer(string="Total Seats", compute='_compute_total_seats', store=True)
     layout_line_ids = fields.One2many('bus.ticket.seat.layout.line', 'layout_id', string="Layout Lines")
+
+    # Předpočítaná šablona sedadel [[number, pos_x, pos_y, name], ...]; přepočítá se jen při změně layoutu
+    seat_template = fields.Json(string="Seat Template", compute='_compute_seat_template', store=True)
     
     @api.depends('layout_line_ids.seat_count')
     def _compute_total_seats(self):
         for layout in self:
             layout.total_seats = sum(line.seat_count for line in layout.layout_line_ids)
 
+    @api.depends('layout_line_ids.seat_count')
+    def _compute_seat_template(self):
+        for layout in self:
+            layout.seat_template = _build_seat_grid(sum(line.seat_count for line in layout.layout_line_ids))
+
 class SeatLayoutLine(models.Model):
     _name = 'bus.ticket.seat.layout.line'
     _description = 'Bus Seat Layout Line'
@@ -54,6 +120,151 @@ class TripSeat(models.Model):
     pos_x = fields.Integer(string="Position X")
     pos_y = fields.Integer(string="Position Y")
 
+    # Obsazenost po úsecích linky: bit i = úsek mezi i-tou a (i+1)-ní zastávkou (podle way.point.sequence)
+    leg_mask = fields.Integer(string="Occupied Legs", default=0, required=True,
+                              help="Bitmask of route legs on which this seat is reserved or sold.")
+
+    def _claim_seats(self, stop_from_id=None, stop_to_id=None, allow_partial=True):
+        """Atomicky zarezervuje sedadla v self na úseku stop_from_id -> stop_to_id.
+
+        Sedadla se zamknou přes FOR UPDATE SKIP LOCKED a přepíšou jediným podmíněným UPDATE, takže
+        souběžné objednávky se navzájem neblokují ani nepřebookují. Vrací jen sedadla, která se
+        podařilo získat; s allow_partial=False buď všechna, nebo žádné.
+        """
+        if not self:
+            return self
+        segment_masks = self.trip_id._get_segment_masks(stop_from_id, stop_to_id)
+        seat_masks = {seat.id: segment_masks[seat.trip_id.id] for seat in self if segment_masks.get(seat.trip_id.id)}
+        if not allow_partial and len(seat_masks) != len(self):
+            return self.browse()
+        return self._claim_seats_with_masks(seat_masks, allow_partial=allow_partial)
+
+    @api.model
+    def _claim_seats_with_masks(self, seat_masks, allow_partial=True):
+        """Zabere sedadla {seat_id: maska úseků}, každé na vlastním úseku (např. více spojů jedné objednávky).
+
+        Chová se jako _claim_seats: vrací získaná sedadla, s allow_partial=False všechna, nebo žádné.
+        """
+        seats = self.browse(seat_masks)
+        seats.flush_recordset(['state', 'leg_mask'])
+        try:
+            with self.env.cr.savepoint(flush=False):
+                transitions = self._claim_seat_masks(seat_masks)
+                claimed = self.browse(row[0] for row in transitions)
+                if not allow_partial and len(claimed) != len(seats):
+                    raise _SeatClaimIncomplete()
+        except _SeatClaimIncomplete:
+            seats.invalidate_recordset(['state', 'leg_mask'])
+            metrics.increment('bus_ticket_seat_claim_conflicts_total', len(seats),
+                              "Seats requested but not claimed (already taken or locked).")
+            return self.browse()
+        claimed.invalidate_recordset(['state', 'leg_mask', 'write_uid', 'write_date'])
+        self._apply_state_transitions(transitions)
+        if len(claimed) != len(seats):
+            metrics.increment('bus_ticket_seat_claim_conflicts_total', len(seats) - len(claimed),
+                              "Seats requested but not claimed (already taken or locked).")
+        return claimed
+
+    def _claim_seat_masks(self, seat_masks):
+        """Provede samotné zabrání sedadel {seat_id: maska}; vrací (seat_id, trip_id, starý stav, nový stav).
+
+        SKIP LOCKED přeskočí jen sedadla, která jiná transakce právě drží zamčená. Sedadlo, které jiná
+        transakce změnila a commitla až po snímku této transakce (REPEATABLE READ), vyvolá serializační
+        chybu; Odoo pak celý požadavek zopakuje s novým snímkem, takže souběh končí opakováním, ne double-bookingem.
+        """
+        if not seat_masks:
+            return []
+        self.env.cr.execute("""
+            WITH candidate AS (
+                SELECT seat.id, claim.mask, seat.state AS old_state
+                  FROM bus_ticket_trip_seat AS seat
+                  JOIN unnest(%s::int[], %s::int[]) AS claim(seat_id, mask) ON claim.seat_id = seat.id
+                 WHERE seat.leg_mask & claim.mask = 0
+                   FOR UPDATE OF seat SKIP LOCKED
+            )
+            UPDATE bus_ticket_trip_seat AS seat
+               SET leg_mask = seat.leg_mask | candidate.mask,
+                   state = CASE WHEN seat.state = 'available' THEN 'reserved' ELSE seat.state END,
+                   write_uid = %s,
+                   write_date = now() at time zone 'UTC'
+              FROM candidate
+             WHERE seat.id = candidate.id
+         RETURNING seat.id, seat.trip_id, candidate.old_state, seat.state
+        """, [list(seat_masks), list(seat_masks.values()), self.env.uid])
+        return self.env.cr.fetchall()
+
+    @api.model
+    def _apply_state_transitions(self, transitions):
+        """Promítne změny stavů sedadel [(seat_id, trip_id, starý stav, nový stav)] do čítačů a verzí sedadel spojů."""
+        deltas = defaultdict(lambda: [0, 0])
+        for _seat_id, trip_id, old_state, new_state in transitions:
+            deltas[trip_id]  # i beze změny stavu se mění verze sedadel spoje
+            if old_state == new_state:
+                continue
+            metrics.increment('bus_ticket_seat_transitions_total', 1, "Seat state changes.",
+                              from_state=old_state, to_state=new_state)
+            for state, sign in ((old_state, -1), (new_state, 1)):
+                if state == 'available':
+                    deltas[trip_id][0] += sign
+                elif state in ('reserved', 'sold'):
+                    deltas[trip_id][1] += sign
+        self.env['bus.ticket.trip']._apply_seat_count_deltas(deltas)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        seats = super().create(vals_list)
+        self._apply_state_transitions([(seat.id, seat.trip_id.id, None, seat.state) for seat in seats])
+        return seats
+
+    def unlink(self):
+        transitions = [(seat.id, seat.trip_id.id, seat.state, None) for seat in self]
+        res = super().unlink()
+        self._apply_state_transitions(transitions)
+        return res
+
+    # Pole vykreslená v mapě sedadel a v /api/v1/trip/<id>/seats; jejich změna mění verzi sedadel spoje (ETag)
+    _SEAT_MAP_FIELDS = {'name', 'number', 'pos_x', 'pos_y'}
+
+    def write(self, vals):
+        transitions = []
+        if 'state' in vals:
+            transitions = [(seat.id, seat.trip_id.id, seat.state, vals['state']) for seat in self]
+        elif self._SEAT_MAP_FIELDS.intersection(vals):
+            transitions = [(seat.id, seat.trip_id.id, seat.state, seat.state) for seat in self]
+        # Ruční změna stavu celého sedadla drží masku úseků v souladu
+        if 'state' in vals and 'leg_mask' not in vals:
+            if vals['state'] == 'available':
+                # Úseky držené jízdenkami (i cizími na jiných úsecích) uvolní jen zrušení jejich objednávek
+                held_seats = self.browse(self._get_held_leg_masks())
+                if held_seats:
+                    raise UserError(_("Seats %(seats)s still hold tickets. Cancel their orders to release them.",
+                                      seats=', '.join(held_seats.mapped('name'))))
+                vals = dict(vals, leg_mask=0)
+            else:
+                for route, seats in self.grouped(lambda s: s.trip_id.route_id).items():
+                    free_seats = seats.filtered(lambda s: not s.leg_mask)
+                    if free_seats and route:
+                        super(TripSeat, free_seats).write({'leg_mask': route._get_full_leg_mask()})
+        res = super().write(vals)
+        self._apply_state_transitions(transitions)
+        return res
+
+    def _get_held_leg_masks(self):
+        """Úseky sedadel v self držené řádky nezrušených objednávek: {seat_id: maska} (bez volných sedadel)."""
+        if not self:
+            return {}
+        self.env['sale.order.line'].flush_model(['seat_id', 'leg_mask', 'order_id'])
+        self.env['sale.order'].flush_model(['state'])
+        self.env.cr.execute("""
+            SELECT line.seat_id, bit_or(CASE WHEN line.leg_mask = 0 THEN -1 ELSE line.leg_mask END)
+              FROM sale_order_line AS line
+              JOIN sale_order AS so ON so.id = line.order_id
+             WHERE line.seat_id IN %s
+               AND so.state != 'cancel'
+             GROUP BY line.seat_id
+        """, [tuple(self.ids)])
+        return dict(self.env.cr.fetchall())
+
     @api.depends('number')
     def _compute_seat_name(self):
         for seat in self:
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/models/trip_archive_models.py
+
+import logging
+from datetime import timedelta
+
+from odoo import models, fields, api
+from odoo.tools import split_every
+from ..tools import metrics
+from .seat_models import SEAT_STATE_CODES, encode_seat_states, decode_seat_states
+
+_logger = logging.getLogger(__name__)
+
+_SEAT_STATES_BY_CODE = {code: state for state, code in SEAT_STATE_CODES.items()}
+
+
+# ===================================================================
+# Archiv starých spojů: jeden řádek na spoj místo spoje, jeho sedadel a historie chatteru
+# ===================================================================
+class BusTripArchive(models.Model):
+    _name = 'bus.ticket.trip.archive'
+    _description = 'Archived Bus Trip'
+    _order = 'departure_time desc'
+
+    # Výchozí stáří (ve dnech), po kterém se dokončené a zrušené spoje archivují
+    _DEFAULT_ARCHIVE_AFTER_DAYS = 180
+    _ARCHIVE_BATCH_SIZE = 500
+
+    name = fields.Char(string="Trip Name", readonly=True)
+    original_trip_id = fields.Integer(string="Original Trip ID", readonly=True, index=True)
+    route_id = fields.Many2one('bus.ticket.route', string="Route", readonly=True, ondelete='set null', index=True)
+    trip_template_id = fields.Many2one('bus.ticket.trip.template', string="Created from Template", readonly=True, ondelete='set null')
+    vehicle_id = fields.Many2one('fleet.vehicle', string="Vehicle", readonly=True, ondelete='set null')
+    driver_id = fields.Many2one('res.partner', string="Driver", readonly=True, ondelete='set null')
+    departure_time = fields.Datetime(string="Departure Time", readonly=True)
+    arrival_time = fields.Datetime(string="Arrival Time", readonly=True)
+    state = fields.Selection([('done', 'Done'), ('cancelled', 'Cancelled')], string="Status", readonly=True)
+    company_id = fields.Many2one('res.company', string="Company", readonly=True)
+    currency_id = fields.Many2one('res.currency', string="Currency", related='company_id.currency_id')
+
+    # Stavy sedadel seřazené podle čísla sedadla, run-length kódované (viz encode_seat_states)
+    seat_states = fields.Char(string="Packed Seat States", readonly=True)
+    seat_count = fields.Integer(string="Seats", readonly=True)
+    sold_seats_count = fields.Integer(string="Sold/Reserved Seats", readonly=True)
+    revenue = fields.Monetary(string="Revenue", readonly=True)
+    order_count = fields.Integer(string="Orders", readonly=True)
+    passenger_count = fields.Integer(string="Passengers", readonly=True)
+    load_factor = fields.Float(string="Load Factor (%)", readonly=True, aggregator='avg')
+    sale_line_ids = fields.One2many('sale.order.line', 'archive_id', string="Order Lines", readonly=True)
+
+    def _get_seat_states(self):
+        """Rozbalí stavy sedadel archivovaného spoje: {číslo sedadla: stav}."""
+        self.ensure_one()
+        return {
+            number: _SEAT_STATES_BY_CODE[code]
+            for number, code in enumerate(decode_seat_states(self.seat_states), start=1)
+        }
+
+    @api.model
+    def _archive_trips(self, trips):
+        """Přesune spoje do archivu: jeden řádek archivu na spoj, přepojí na něj řádky objednávek
+        a smaže spoje i s jejich sedadly, zprávami, sledujícími a aktivitami.
+        """
+        if not trips:
+            return self.browse()
+        cr = self.env.cr
+        trip_ids = tuple(trips.ids)
+        self.env['bus.ticket.trip.stats']._rebuild(trip_ids)
+        stats = {row['trip_id']: row for row in self.env['bus.ticket.trip.stats'].search_read(
+            [('trip_id', 'in', trip_ids)], ['trip_id', 'revenue', 'order_count', 'passenger_count', 'load_factor'], load=None)}
+        self.env['bus.ticket.trip.seat'].flush_model(['trip_id', 'number', 'state'])
+        cr.execute("""
+            SELECT trip_id, array_agg(state ORDER BY number, id) FROM bus_ticket_trip_seat
+             WHERE trip_id IN %s GROUP BY trip_id
+        """, [trip_ids])
+        seat_states = dict(cr.fetchall())
+
+        vals_list = []
+        for trip in trips:
+            states = seat_states.get(trip.id, [])
+            trip_stats = stats.get(trip.id, {})
+            vals_list.append({
+                'name': trip.name,
+                'original_trip_id': trip.id,
+                'route_id': trip.route_id.id,
+                'trip_template_id': trip.trip_template_id.id,
+                'vehicle_id': trip.vehicle_id.id,
+                'driver_id': trip.driver_id.id,
+                'departure_time': trip.departure_time,
+                'arrival_time': trip.arrival_time,
+                'state': trip.state,
+                'company_id': trip.company_id.id,
+                'seat_states': encode_seat_states(SEAT_STATE_CODES.get(state, 'A') for state in states),
+                'seat_count': len(states),
+                'sold_seats_count': sum(1 for state in states if state != 'available'),
+                'revenue': trip_stats.get('revenue', 0.0),
+                'order_count': trip_stats.get('order_count', 0),
+                'passenger_count': trip_stats.get('passenger_count', 0),
+                'load_factor': trip_stats.get('load_factor', 0.0),
+            })
+        archives = self.create(vals_list)
+
+        # Řádky objednávek (jízdenky) odkazují dál na archiv místo na spoj a sedadlo
+        self.env['sale.order.line'].flush_model(['trip_id', 'seat_id'])
+        cr.execute("""
+            UPDATE sale_order_line AS line
+               SET archive_id = archive.id
+              FROM bus_ticket_trip_archive AS archive
+             WHERE archive.id IN %s
+               AND line.trip_id = archive.original_trip_id
+        """, [tuple(archives.ids)])
+        cr.execute("""
+            UPDATE sale_order_line AS line
+               SET archive_id = archive.id
+              FROM bus_ticket_trip_seat AS seat, bus_ticket_trip_archive AS archive
+             WHERE line.archive_id IS NULL
+               AND seat.id = line.seat_id
+               AND seat.trip_id IN %s
+               AND archive.original_trip_id = seat.trip_id
+        """, [trip_ids])
+
+        # Sedadla a historie chatteru se mažou hromadně v SQL, zbytek (přílohy, vazby) řeší unlink spojů
+        for table, model_column in (('mail_message', 'model'), ('mail_followers', 'res_model'), ('mail_activity', 'res_model')):
+            cr.execute(f"DELETE FROM {table} WHERE {model_column} = 'bus.ticket.trip' AND res_id IN %s", [trip_ids])
+        cr.execute("DELETE FROM bus_ticket_trip_seat WHERE trip_id IN %s", [trip_ids])
+        self.env['sale.order.line'].invalidate_model(['archive_id', 'trip_id', 'seat_id'])
+        for model in ('bus.ticket.trip.seat', 'mail.message', 'mail.followers', 'mail.activity'):
+            self.env[model].invalidate_model()
+        trips.invalidate_recordset()
+        trips.unlink()
+        return archives
+
+    @api.model
+    @metrics.instrument_job('archive_trips')
+    def _cron_archive_trips(self):
+        """Metoda volaná CRONem: archivuje dokončené a zrušené spoje starší než
+        bus_ticket_core.archive_after_days dní (výchozí _DEFAULT_ARCHIVE_AFTER_DAYS).
+        """
+        days = int(self.env['ir.config_parameter'].sudo().get_param(
+            'bus_ticket_core.archive_after_days', self._DEFAULT_ARCHIVE_AFTER_DAYS))
+        if days <= 0:
+            return
+        trips = self.env['bus.ticket.trip'].search([
+            ('state', 'in', ['done', 'cancelled']),
+            ('departure_time', '<', fields.Datetime.now() - timedelta(days=days)),
+        ])
+        Trip = trips.with_context(tracking_disable=True)
+        archived = 0
+        for batch in split_every(self._ARCHIVE_BATCH_SIZE, trips.ids, Trip.browse):
+            archived += len(self._archive_trips(batch))
+            metrics.checkpoint('batch')
+        if archived:
+            _logger.info("Bus Tickets: archived %s trips older than %s days.", archived, days)
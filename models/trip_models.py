@@ -1,5 +1,17 @@
 # -*- coding: utf-8 -*-
-from odoo import models, fields, api
+from odoo import models, fields, api, tools
+from odoo.exceptions import ConcurrencyError
+from odoo.tools import create_index, split_every
+from psycopg2 import IntegrityError
+from ..tools import metrics
+from ..tools.journey_planner import ConnectionIndex, to_seconds
+from ..tools.search_cache import (
+    SEARCH_CACHE_TTL, create_invalidation_log, get_connection_index_cache, invalidate_search_cache, prune_invalidation_log,
+)
+from .city_pair_models import normalize_city
+from .seat_models import SEAT_STATE_CODES, encode_seat_states
+from .trip_stats_models import mark_trip_stats_dirty
+from collections import defaultdict
 from datetime import date, timedelta, datetime
 
 class BusTrip(models.Model):
@@ -21,19 +33,31 @@ class BusTrip(models.Model):
     
     seat_ids = fields.One2many('bus.ticket.trip.seat', 'trip_id', 'Seats')
     seat_map_html = fields.Html(string="Seat Map", compute='_compute_seat_map_html', sanitize=False)
+    # Verze stavu sedadel - zvyšuje se při každé změně sedadel spoje (klíč pro cache mapy sedadel, ETag)
+    seat_version = fields.Integer("Seat Version", default=0, readonly=True, copy=False)
+    # Předrenderovaná mapa sedadel a klíč "verze:layout", pro který platí
+    seat_map_cache = fields.Text("Rendered Seat Map", readonly=True, copy=False, prefetch=False)
+    seat_map_cache_key = fields.Char("Rendered Seat Map Key", readonly=True, copy=False)
     
     # Nová pole pro lepší přehled
     is_sellable = fields.Boolean("Is Sellable", default=True, help="Uncheck to hide this trip from the website.")
-    available_seats_count = fields.Integer("Available Seats", compute='_compute_seat_counts', store=True)
-    sold_seats_count = fields.Integer("Sold/Reserved Seats", compute='_compute_seat_counts', store=True)
+    # Čítače se udržují jako delty při každé změně stavu sedadla (viz _apply_seat_count_deltas)
+    available_seats_count = fields.Integer("Available Seats", default=0, readonly=True)
+    sold_seats_count = fields.Integer("Sold/Reserved Seats", default=0, readonly=True)
     order_line_ids = fields.One2many(related='seat_ids.order_line_ids', string="Order Lines")
-    order_count = fields.Integer("Order Count", compute='_compute_order_count', store=True)
-    total_revenue = fields.Monetary("Total Revenue", compute='_compute_total_revenue', store=True)
+    # Prodejní statistiky se čtou z knihy bus.ticket.trip.stats (viz mark_trip_stats_dirty). Pole nejsou
+    # uložená, nejde podle nich řadit ani seskupovat; seznamy a reporty prodejů jsou nad modelem statistik
+    stats_ids = fields.One2many('bus.ticket.trip.stats', 'trip_id', string="Statistics")
+    order_count = fields.Integer("Order Count", related='stats_ids.order_count')
+    total_revenue = fields.Monetary("Total Revenue", related='stats_ids.revenue')
+    passenger_count = fields.Integer("Passengers", related='stats_ids.passenger_count')
+    load_factor = fields.Float("Load Factor (%)", related='stats_ids.load_factor')
     company_id = fields.Many2one('res.company', 'Company', related='route_id.company_id', store=True)
     currency_id = fields.Many2one('res.currency', 'Currency', related='company_id.currency_id')
     
     # Pole pro řazení
-    display_group = fields.Selection([('today', 'Today'), ('future', 'Future'), ('past', 'Past')], "Display Group", compute='_compute_display_group', store=True)
+    # Nastavuje se při zápisu času odjezdu, o půlnoci ho posune _cron_rollover_display_group
+    display_group = fields.Selection([('today', 'Today'), ('future', 'Future'), ('past', 'Past')], "Display Group", default='future', readonly=True)
     
     start_city = fields.Char(string="From", related='route_id.start_stop_id.city', store=True)
     end_city = fields.Char(string="To", related='route_id.end_stop_id.city', store=True)
@@ -46,73 +70,461 @@ class BusTrip(models.Model):
             else:
                 trip.name = "New Trip"
 
-    @api.depends('seat_ids', 'seat_ids.state')
+    @api.depends('seat_version', 'vehicle_id.seat_layout_id')
+    @api.depends_context('lang')
     def _compute_seat_map_html(self):
         for trip in self:
-            if not trip.seat_ids:
-                trip.seat_map_html = "<p>Please generate seats for this trip first.</p>"
-                continue
-            trip.seat_map_html = self.env['ir.qweb']._render('bus_ticket_core.qweb_seat_map', {'seats': trip.seat_ids})
+            cache_key = trip._get_seat_map_cache_key()
+            if trip.seat_map_cache_key == cache_key:
+                trip.seat_map_html = trip.seat_map_cache
+            else:
+                trip.seat_map_html = self._render_seat_map(trip.id, trip.seat_version, trip.vehicle_id.seat_layout_id.id)
+
+    def _get_seat_map_cache_key(self):
+        self.ensure_one()
+        return f"{self.seat_version}:{self.vehicle_id.seat_layout_id.id or 0}:{self.env.lang or ''}"
+
+    @tools.ormcache('trip_id', 'seat_version', 'layout_id', 'self.env.lang')
+    def _render_seat_map(self, trip_id, seat_version, layout_id):
+        """Vyrenderuje mapu sedadel; výsledek je v cache pro danou verzi sedadel, layout a jazyk.
+
+        Renderuje se jako superuživatel, aby výsledek v cache nezávisel na právech toho, kdo ho vyrenderoval první.
+        """
+        trip = self.sudo().browse(trip_id)
+        if not trip.seat_ids:
+            return "<p>Please generate seats for this trip first.</p>"
+        return str(trip.env['ir.qweb']._render('bus_ticket_core.qweb_seat_map', {'seats': trip.seat_ids}))
 
-    @api.depends('departure_time', 'route_id.stop_line_ids.offset_time', 'route_id.stop_line_ids.offset_days')
+    def _prerender_seat_maps(self):
+        """Předrenderuje a uloží mapy sedadel spojů v self, jejichž uložená mapa neodpovídá aktuální verzi."""
+        stale_trips = self.filtered(lambda t: t.seat_map_cache_key != t._get_seat_map_cache_key())
+        if not stale_trips:
+            return
+        stale_trips.seat_ids.mapped('state')  # načte sedadla všech spojů jedním dotazem
+        rendered = {
+            trip.id: (trip._get_seat_map_cache_key(), self._render_seat_map(trip.id, trip.seat_version, trip.vehicle_id.seat_layout_id.id))
+            for trip in stale_trips
+        }
+        self.env.cr.execute("""
+            UPDATE bus_ticket_trip AS trip
+               SET seat_map_cache_key = rendered.cache_key, seat_map_cache = rendered.html
+              FROM unnest(%s::int[], %s::varchar[], %s::text[]) AS rendered(id, cache_key, html)
+             WHERE trip.id = rendered.id
+        """, [list(rendered), [r[0] for r in rendered.values()], [r[1] for r in rendered.values()]])
+        stale_trips.invalidate_recordset(['seat_map_cache', 'seat_map_cache_key'])
+
+    @api.model
+    @metrics.instrument_job('prerender_seat_maps')
+    def _cron_prerender_seat_maps(self):
+        """Metoda volaná CRONem: zahřeje cache map sedadel pro dnešní odjezdy."""
+        today = fields.Date.today()
+        trips = self.search([
+            ('departure_time', '>=', datetime.combine(today, datetime.min.time())),
+            ('departure_time', '<', datetime.combine(today + timedelta(days=1), datetime.min.time())),
+            ('state', '!=', 'cancelled'),
+        ])
+        for batch in split_every(500, trips.ids, self.browse):
+            batch._prerender_seat_maps()
+
+    @api.depends('departure_time', 'route_id.stop_line_ids.sequence',
+                 'route_id.stop_line_ids.offset_time', 'route_id.stop_line_ids.offset_days')
     def _compute_arrival_time(self):
+        timetables = self.route_id._get_timetables()
         for trip in self:
-            if trip.departure_time and trip.route_id and trip.route_id.stop_line_ids:
-                last_stop = trip.route_id.stop_line_ids.sorted('sequence')[-1]
-                trip.arrival_time = trip.departure_time + timedelta(days=last_stop.offset_days, hours=last_stop.offset_time)
+            timetable = timetables.get(trip.route_id.id)
+            if trip.departure_time and timetable:
+                trip.arrival_time = trip.departure_time + timetable[-1][1]
             else:
                 trip.arrival_time = trip.departure_time
 
-    @api.depends('departure_time')
-    def _compute_display_group(self):
-        for trip in self:
-            if not trip.departure_time: trip.display_group = 'future'; continue
-            departure_date = trip.departure_time.date()
-            today = fields.Date.today()
-            if departure_date > today: trip.display_group = 'future'
-            elif departure_date < today: trip.display_group = 'past'
-            else: trip.display_group = 'today'
-
-    @api.depends('seat_ids.state')
-    def _compute_seat_counts(self):
-        for trip in self:
-            trip.sold_seats_count = len(trip.seat_ids.filtered(lambda s: s.state in ['sold', 'reserved']))
-            trip.available_seats_count = len(trip.seat_ids.filtered(lambda s: s.state == 'available'))
+    def _get_stop_etas(self):
+        """Časy průjezdu zastávkami pro všechny spoje v self: {trip_id: [(stop_id, čas), ...]}.
 
-    @api.depends('order_line_ids.price_total', 'order_line_ids.order_id.state')
-    def _compute_total_revenue(self):
-        for trip in self:
-            sold_lines = trip.order_line_ids.filtered(lambda l: l.order_id.state in ['sale', 'done'])
-            trip.total_revenue = sum(sold_lines.mapped('price_total'))
+        Jízdní řády tras jsou v cache, takže bez ohledu na počet spojů stačí načíst jejich trasy a odjezdy.
+        """
+        timetables = self.route_id._get_timetables()
+        return {
+            trip.id: [(stop_id, trip.departure_time + offset) for stop_id, offset in timetables.get(trip.route_id.id, ())]
+            for trip in self if trip.departure_time
+        }
+
+    @api.model
+    def _get_display_group(self, departure_time, today=None):
+        if not departure_time:
+            return 'future'
+        departure_date = fields.Datetime.to_datetime(departure_time).date()
+        today = today or fields.Date.today()
+        if departure_date > today: return 'future'
+        elif departure_date < today: return 'past'
+        return 'today'
+
+    def init(self):
+        # Index odpovídá výchozímu řazení (_order), seznamy spojů se tak čtou bez třídění celé tabulky
+        create_index(self.env.cr, 'bus_ticket_trip_display_order_index', self._table,
+                     ['display_group', 'departure_time DESC'])
+        # Log zneplatnění cache vyhledávání sdílený workery (viz tools/search_cache.py)
+        create_invalidation_log(self.env.cr)
+
+    @api.autovacuum
+    def _gc_search_invalidation_log(self):
+        """Smaže řádky logu zneplatnění starší než desetinásobek TTL (jejich výsledky už dávno vypršely)."""
+        prune_invalidation_log(self.env.cr, 10 * SEARCH_CACHE_TTL)
+
+    @api.model
+    @metrics.instrument_job('rollover_display_group')
+    def _cron_rollover_display_group(self):
+        """Metoda volaná CRONem po půlnoci: jedním UPDATE přeřadí jen spoje, jejichž den odjezdu
+        se právě stal dneškem nebo minulostí (ostatní skupiny se s datem nemění).
+        """
+        today = fields.Date.today()
+        self.flush_model(['display_group', 'departure_time'])
+        self.env.cr.execute("""
+            UPDATE bus_ticket_trip
+               SET display_group = CASE WHEN departure_time < %(today)s THEN 'past' ELSE 'today' END
+             WHERE departure_time < %(tomorrow)s
+               AND (display_group IS NULL OR display_group != 'past')
+               AND display_group IS DISTINCT FROM CASE WHEN departure_time < %(today)s THEN 'past' ELSE 'today' END
+         RETURNING id
+        """, {'today': today, 'tomorrow': today + timedelta(days=1)})
+        rolled_ids = [row[0] for row in self.env.cr.fetchall()]
+        self.browse(rolled_ids).invalidate_recordset(['display_group'])
+        return rolled_ids
+
+    @api.model
+    def _apply_seat_count_deltas(self, deltas):
+        """Přičte k čítačům sedadel delty {trip_id: (Δ volná, Δ prodaná/rezervovaná)} jedním UPDATE.
+
+        Každému uvedenému spoji (i s nulovou deltou) se zároveň zvýší seat_version.
+        """
+        deltas = {trip_id: delta for trip_id, delta in deltas.items() if trip_id}
+        if not deltas:
+            return
+        self.flush_model(['available_seats_count', 'sold_seats_count', 'seat_version'])
+        self.env.cr.execute("""
+            UPDATE bus_ticket_trip AS trip
+               SET available_seats_count = trip.available_seats_count + delta.available,
+                   sold_seats_count = trip.sold_seats_count + delta.sold,
+                   seat_version = trip.seat_version + 1
+              FROM unnest(%s::int[], %s::int[], %s::int[]) AS delta(id, available, sold)
+             WHERE trip.id = delta.id
+        """, [list(deltas), [d[0] for d in deltas.values()], [d[1] for d in deltas.values()]])
+        trips = self.browse(deltas)
+        trips.invalidate_recordset(['available_seats_count', 'sold_seats_count', 'seat_version'])
+        invalidate_search_cache(self.env, trip_ids=trips.ids)
+
+    def _recount_seats(self):
+        """Přepočítá čítače sedadel spojů v self od nuly jedním seskupeným dotazem (oprava driftu)."""
+        if not self:
+            return
+        self.env['bus.ticket.trip.seat'].flush_model(['trip_id', 'state'])
+        self.flush_model(['available_seats_count', 'sold_seats_count'])
+        self.env.cr.execute("""
+            UPDATE bus_ticket_trip AS trip
+               SET available_seats_count = counts.available, sold_seats_count = counts.sold
+              FROM (
+                    SELECT t.id,
+                           count(seat.id) FILTER (WHERE seat.state = 'available') AS available,
+                           count(seat.id) FILTER (WHERE seat.state IN ('sold', 'reserved')) AS sold
+                      FROM unnest(%s::int[]) AS t(id)
+                 LEFT JOIN bus_ticket_trip_seat AS seat ON seat.trip_id = t.id
+                  GROUP BY t.id
+                   ) AS counts
+             WHERE trip.id = counts.id
+               AND (trip.available_seats_count, trip.sold_seats_count) IS DISTINCT FROM (counts.available, counts.sold)
+         RETURNING trip.id
+        """, [self.ids])
+        fixed_ids = [row[0] for row in self.env.cr.fetchall()]
+        self.invalidate_recordset(['available_seats_count', 'sold_seats_count'])
+        invalidate_search_cache(self.env, trip_ids=fixed_ids)
+        return fixed_ids
+
+    @api.model
+    @metrics.instrument_job('recount_seats')
+    def _cron_recount_seats(self):
+        """Metoda volaná CRONem: opraví případný drift čítačů u všech nedokončených spojů."""
+        trips = self.search([('state', 'not in', ['done', 'cancelled'])])
+        for batch in split_every(10000, trips.ids, self.browse):
+            batch._recount_seats()
+
+    _sql_constraints = [
+        ('template_departure_unique', 'UNIQUE(trip_template_id, departure_time)',
+         "A trip for this template and departure time already exists."),
+    ]
+
+    # Pole, ze kterých se skládá výsledek /api/v1/trips/search (jejich změna zneplatní cache vyhledávání)
+    _SEARCH_RESULT_FIELDS = {
+        'name', 'route_id', 'vehicle_id', 'driver_id', 'departure_time', 'arrival_time',
+        'state', 'is_sellable', 'available_seats_count',
+    }
 
-    @api.depends('order_line_ids')
-    def _compute_order_count(self):
-        for trip in self: trip.order_count = len(trip.order_line_ids.mapped('order_id'))
-    
     def action_confirm(self):
         self.write({'state': 'confirmed'})
 
+    def write(self, vals):
+        if 'departure_time' in vals:
+            vals = dict(vals, display_group=self._get_display_group(vals['departure_time']))
+        if self._SEARCH_RESULT_FIELDS.intersection(vals):
+            invalidate_search_cache(self.env, route_ids=self.route_id.ids, trip_ids=self.ids)
+        res = super().write(vals)
+        if 'route_id' in vals:
+            invalidate_search_cache(self.env, route_ids=self.route_id.ids)
+        return res
+
+    def unlink(self):
+        invalidate_search_cache(self.env, route_ids=self.route_id.ids, trip_ids=self.ids)
+        return super().unlink()
+
+    def _get_compact_availability(self, stop_from_id=None, stop_to_id=None):
+        """Vrátí kompaktní dostupnost sedadel všech spojů v self; sedadla načte jediným dotazem.
+
+        Stavy sedadel (seřazené podle čísla) jsou run-length řetězec kódů A/R/S; při zadání úseku
+        je sedadlo 'A', pokud je volné právě na tomto úseku.
+        """
+        segment_masks = self._get_segment_masks(stop_from_id, stop_to_id)
+        self.env['bus.ticket.trip.seat'].flush_model(['trip_id', 'number', 'state', 'leg_mask', 'pos_x', 'pos_y'])
+        self.env.cr.execute("""
+            SELECT trip_id, array_agg(state ORDER BY number), array_agg(leg_mask ORDER BY number),
+                   max(pos_x), max(pos_y)
+              FROM bus_ticket_trip_seat
+             WHERE trip_id IN %s
+             GROUP BY trip_id
+        """, [tuple(self.ids) or (None,)])
+        seats_by_trip = {row[0]: row[1:] for row in self.env.cr.fetchall()}
+        segment_query = bool(stop_from_id or stop_to_id)
+        availability = {}
+        for trip in self:
+            states, leg_masks, max_x, max_y = seats_by_trip.get(trip.id, ([], [], 0, 0))
+            mask = segment_masks[trip.id]
+            if segment_query:
+                codes = [
+                    'A' if mask and not leg_mask & mask else SEAT_STATE_CODES['sold' if state == 'available' else state]
+                    for state, leg_mask in zip(states, leg_masks)
+                ]
+            else:
+                codes = [SEAT_STATE_CODES[state] for state in states]
+            layout = trip.vehicle_id.seat_layout_id
+            availability[trip.id] = {
+                'served': bool(mask),
+                'seat_version': trip.seat_version,
+                'available': codes.count('A'),
+                'states': encode_seat_states(codes),
+                'layout': {'id': layout.id or None, 'type': layout.layout_type or 'other', 'max_x': max_x or 0, 'max_y': max_y or 0},
+            }
+        return availability
+
+    _API_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+    @api.model
+    def _read_api_related(self, route_ids, vehicle_ids, driver_ids):
+        """Načte názvy tras, vozidel a řidičů pro API po jednom dávkovém dotazu na model."""
+        routes = self.env['bus.ticket.route'].browse(set(filter(None, route_ids))).read(['name'])
+        vehicles = self.env['fleet.vehicle'].browse(set(filter(None, vehicle_ids))).read(['name', 'license_plate', 'seat_layout_total_seats'])
+        drivers = self.env['res.partner'].browse(set(filter(None, driver_ids))).read(['name'])
+        return (
+            {route['id']: route['name'] for route in routes},
+            {vehicle['id']: vehicle for vehicle in vehicles},
+            {driver['id']: driver['name'] for driver in drivers},
+        )
+
+    @api.model
+    def _format_api_trip(self, values, route_names, vehicles, drivers):
+        vehicle = vehicles.get(values['vehicle_id']) or {}
+        departure_time, arrival_time = values['departure_time'], values['arrival_time']
+        return {
+            'name': values['name'],
+            'route': route_names.get(values['route_id']),
+            'departure_time': departure_time.strftime(self._API_DATETIME_FORMAT) if departure_time else None,
+            'arrival_time': arrival_time.strftime(self._API_DATETIME_FORMAT) if arrival_time else None,
+            'available_seats': values['available_seats'],
+            'vehicle': {'name': vehicle.get('name', False), 'license_plate': vehicle.get('license_plate', False)},
+            'driver': {'name': drivers.get(values['driver_id'], False)},
+        }
+
+    def _serialize_for_api(self):
+        """Naformátuje spoje v self pro API. Všechny sloupce se načtou několika dávkovými dotazy,
+        payload se skládá bez přístupu k ORM po jednotlivých záznamech. Pořadí odpovídá self.
+        """
+        rows = self.read(['name', 'route_id', 'vehicle_id', 'driver_id', 'departure_time', 'arrival_time', 'available_seats_count'], load=None)
+        related = self._read_api_related(
+            [row['route_id'] for row in rows], [row['vehicle_id'] for row in rows], [row['driver_id'] for row in rows])
+        trips_data = []
+        for row in rows:
+            trip_data = {'id': row['id']}
+            trip_data.update(self._format_api_trip(dict(row, available_seats=row['available_seats_count']), *related))
+            trips_data.append(trip_data)
+        return trips_data
+
+    @api.model
+    def _get_seat_versions(self, trip_ids):
+        """Vrátí {trip_id: seat_version} jedním dotazem bez načítání spojů do ORM (pro ETagy)."""
+        if not trip_ids:
+            return {}
+        self.flush_model(['seat_version'])
+        self.env.cr.execute("SELECT id, seat_version FROM bus_ticket_trip WHERE id IN %s", [tuple(trip_ids)])
+        return dict(self.env.cr.fetchall())
+
+    @api.model
+    def _resolve_trip_ref(self, trip_ref):
+        """Vrátí spoj podle id nebo podle reference virtuálního odjezdu (ten se při tom materializuje)."""
+        if isinstance(trip_ref, int) or str(trip_ref).isdigit():
+            return self.browse(int(trip_ref)).exists()
+        template, departure_dt = self.env['bus.ticket.trip.template']._parse_departure_ref(trip_ref)
+        if not departure_dt:
+            return self.browse()
+        return template._materialize_departure(departure_dt)
+
+    # Počet dní od zvoleného data, které pokrývá index spojení plánovače (noční a vícedenní cesty)
+    _CONNECTION_INDEX_DAYS = 2
+
+    @api.model
+    def _get_connection_index(self, departure_date):
+        """Index spojení plánovače cest pro odjezdy od departure_date; drží se ve vlastní cache.
+
+        Zneplatní ho změna kterékoli trasy (nové, přesunuté nebo zrušené spoje, šablony, waypointy),
+        jinak TTL cache. Změny jen čítačů sedadel ho nechávají (viz ConnectionIndexCache).
+        """
+        index_cache = get_connection_index_cache(self.env.cr.dbname)
+        snapshot = index_cache.sync(self.env.cr)
+        index = index_cache.get(departure_date)
+        if index is None:
+            index = self._build_connection_index(departure_date, departure_date + timedelta(days=self._CONNECTION_INDEX_DAYS))
+            index_cache.put(departure_date, index, snapshot=snapshot)
+        return index
+
+    @api.model
+    def _build_connection_index(self, date_from, date_to):
+        """Sestaví časově seřazené pole spojení ze všech prodejných spojů a virtuálních odjezdů
+        v intervalu <date_from, date_to> a jízdních řádů jejich tras (pár dávkových dotazů celkem).
+        """
+        trips = self.search([
+            ('state', 'in', ['confirmed', 'in_progress', 'draft']), ('is_sellable', '=', True),
+            ('departure_time', '>=', datetime.combine(date_from, datetime.min.time())),
+            ('departure_time', '<=', datetime.combine(date_to, datetime.max.time())),
+        ])
+        departures = [
+            (('t', row['id']), row['route_id'], row['departure_time'], row['id'], None)
+            for row in trips.read(['route_id', 'departure_time'], load=None)
+        ]
+        Route = self.env['bus.ticket.route']
+        virtual_departures = self.env['bus.ticket.trip.template']._get_virtual_departures(
+            Route.search([]).ids, date_from, date_to)
+        departures += [
+            (('v', departure['ref']), departure['template'].route_id.id, departure['departure_time'], None, departure['ref'])
+            for departure in virtual_departures
+        ]
+        routes = Route.browse({departure[1] for departure in departures})
+        timetables = routes._get_timetables()
+        route_names = {route['id']: route['name'] for route in routes.read(['name'])}
+
+        connections, trips_info = [], {}
+        for trip_key, route_id, departure_dt, trip_id, ref in departures:
+            timetable = timetables.get(route_id, ())
+            departure_ts = to_seconds(departure_dt)
+            for (stop_from, offset_from), (stop_to, offset_to) in zip(timetable, timetable[1:]):
+                connections.append((departure_ts + int(offset_from.total_seconds()),
+                                    departure_ts + int(offset_to.total_seconds()), stop_from, stop_to, trip_key))
+            trips_info[trip_key] = {
+                'trip_id': trip_id, 'ref': ref, 'route_id': route_id,
+                'route': route_names.get(route_id), 'departure_time': departure_dt,
+            }
+        stops_by_city = defaultdict(set)
+        stop_ids = {stop_id for timetable in timetables.values() for stop_id, _offset in timetable}
+        for stop in self.env['bus.ticket.stop'].browse(stop_ids).read(['city']):
+            stops_by_city[normalize_city(stop['city'])].add(stop['id'])
+        return ConnectionIndex(connections, trips_info, dict(stops_by_city))
+
+    def _get_segment_masks(self, stop_from_id=None, stop_to_id=None):
+        """Vrátí {trip_id: maska úseku} pro všechny spoje v self; maska se počítá jednou na linku."""
+        masks_by_route = {}
+        segment_masks = {}
+        for trip in self:
+            route = trip.route_id
+            if route not in masks_by_route:
+                masks_by_route[route] = route._get_segment_mask(stop_from_id, stop_to_id) if route else 0
+            segment_masks[trip.id] = masks_by_route[route]
+        return segment_masks
+
+    def _get_free_seat_ids(self, stop_from_id=None, stop_to_id=None):
+        """Vrátí {trip_id: [id volných sedadel]} pro úsek stop_from_id -> stop_to_id jedním dotazem.
+
+        Sedadlo je na úseku volné, pokud jeho leg_mask nemá společný bit s maskou úseku. Spoje,
+        jejichž linka úsek neobsluhuje, mají prázdný seznam.
+        """
+        free_seat_ids = {trip_id: [] for trip_id in self.ids}
+        segment_masks = {trip_id: mask for trip_id, mask in self._get_segment_masks(stop_from_id, stop_to_id).items() if mask}
+        if not segment_masks:
+            return free_seat_ids
+        self.env['bus.ticket.trip.seat'].flush_model(['trip_id', 'leg_mask', 'number'])
+        self.env.cr.execute("""
+            SELECT seat.trip_id, array_agg(seat.id ORDER BY seat.number)
+              FROM bus_ticket_trip_seat AS seat
+              JOIN unnest(%s::int[], %s::int[]) AS segment(trip_id, mask) ON segment.trip_id = seat.trip_id
+             WHERE seat.leg_mask & segment.mask = 0
+             GROUP BY seat.trip_id
+        """, [list(segment_masks), list(segment_masks.values())])
+        free_seat_ids.update(self.env.cr.fetchall())
+        return free_seat_ids
+
     def generate_seats(self):
         self.ensure_one()
-        self.seat_ids.unlink()
-        Seat = self.env['bus.ticket.trip.seat']
-        layout = self.vehicle_id.seat_layout_id
-        if not layout or not layout.total_seats: return
-        seat_vals = []
-        cols = 5
-        current_row, current_col = 0, 0
-        for i in range(1, layout.total_seats + 1):
-            if current_col == 2: current_col += 1
-            seat_vals.append({'trip_id': self.id, 'number': i, 'pos_x': current_col, 'pos_y': current_row})
-            current_col += 1
-            if current_col >= cols: current_col, current_row = 0, current_row + 1
-        if seat_vals: Seat.create(seat_vals)
+        self._generate_seats_bulk()
+
+    def _generate_seats_bulk(self):
+        """Přegeneruje sedadla všech spojů v self ze šablony sedadel jejich layoutu.
+
+        Stará sedadla se smažou jedním DELETE a nová se vloží jedním INSERT ... SELECT na každý layout,
+        čítače sedadel se nastaví rovnou (nová sedadla jsou vždy volná).
+        """
+        if not self:
+            return
+        cr = self.env.cr
+        self.flush_recordset(['vehicle_id', 'available_seats_count', 'sold_seats_count', 'seat_version'])
+        self.env['bus.ticket.trip.seat'].flush_model()
+        cr.execute("DELETE FROM bus_ticket_trip_seat WHERE trip_id IN %s", [tuple(self.ids)])
+
+        trips_by_layout = defaultdict(list)
+        for trip in self:
+            layout = trip.vehicle_id.seat_layout_id
+            if layout and layout.seat_template:
+                trips_by_layout[layout].append(trip.id)
+
+        seat_counts = dict.fromkeys(self.ids, 0)
+        for layout, trip_ids in trips_by_layout.items():
+            numbers, pos_xs, pos_ys, names = zip(*layout.seat_template)
+            cr.execute("""
+                INSERT INTO bus_ticket_trip_seat (trip_id, number, pos_x, pos_y, name, state, leg_mask,
+                                                  create_uid, create_date, write_uid, write_date)
+                SELECT trip.id, tpl.number, tpl.pos_x, tpl.pos_y, tpl.name, 'available', 0,
+                       %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+                  FROM unnest(%(trip_ids)s::int[]) AS trip(id)
+                 CROSS JOIN unnest(%(numbers)s::int[], %(pos_xs)s::int[], %(pos_ys)s::int[], %(names)s::varchar[])
+                            AS tpl(number, pos_x, pos_y, name)
+            """, {
+                'uid': self.env.uid, 'trip_ids': trip_ids,
+                'numbers': list(numbers), 'pos_xs': list(pos_xs), 'pos_ys': list(pos_ys), 'names': list(names),
+            })
+            seat_counts.update(dict.fromkeys(trip_ids, len(numbers)))
+        metrics.increment('bus_ticket_seats_created_total', sum(seat_counts.values()), "Seats generated for trips.")
+
+        cr.execute("""
+            UPDATE bus_ticket_trip AS trip
+               SET available_seats_count = c.total, sold_seats_count = 0, seat_version = trip.seat_version + 1
+              FROM unnest(%s::int[], %s::int[]) AS c(id, total)
+             WHERE trip.id = c.id
+        """, [list(seat_counts), list(seat_counts.values())])
+        self.env['bus.ticket.trip.seat'].invalidate_model()
+        self.env['sale.order.line'].invalidate_model(['seat_id'])
+        self.invalidate_recordset(['seat_ids', 'available_seats_count', 'sold_seats_count', 'seat_version'])
+        invalidate_search_cache(self.env, trip_ids=self.ids)
+        # Počet sedadel mění obsazenost spoje
+        mark_trip_stats_dirty(self.env, self.ids)
 
     @api.model_create_multi
     def create(self, vals_list):
         # Načteme si jména tras dopředu, abychom se neptali databáze v cyklu
         route_ids = [vals.get('route_id') for vals in vals_list if vals.get('route_id')]
         route_names = {r.id: r.name for r in self.env['bus.ticket.route'].browse(route_ids)}
+        today = fields.Date.today()
 
         for vals in vals_list:
             # Sestavíme název a vložíme ho do slovníku hodnot 'vals'
@@ -120,13 +532,16 @@ class BusTrip(models.Model):
                 route_name = route_names.get(vals['route_id'], '')
                 departure_dt = fields.Datetime.to_datetime(vals['departure_time'])
                 vals['name'] = f"{route_name} on {departure_dt.strftime('%d.%m.%Y')}"
+            vals['display_group'] = self._get_display_group(vals.get('departure_time'), today)
         
         # Zavoláme původní metodu create, ale už s doplněnými názvy
         trips = super(BusTrip, self).create(vals_list)
         
-        # Zbytek logiky zůstává
-        for trip in trips.filtered(lambda t: t.vehicle_id.seat_layout_id):
-            trip.generate_seats()
+        # Sedadla pro celou dávku spojů vytvoříme najednou
+        trips.filtered(lambda t: t.vehicle_id.seat_layout_id)._generate_seats_bulk()
+        metrics.increment('bus_ticket_trips_created_total', len(trips), "Trips created.")
+        # Nové spoje se musí objevit ve výsledcích vyhledávání jejich tras
+        invalidate_search_cache(self.env, route_ids=trips.route_id.ids)
         return trips
 
 class BusTripTemplate(models.Model):
@@ -156,45 +571,267 @@ class BusTripTemplate(models.Model):
     
     company_id = fields.Many2one('res.company', 'Company', related='route_id.company_id', store=True)
 
+    # Hranice, do které už jsou spoje z této šablony vygenerované (watermark CRONu)
+    generated_until = fields.Date(string="Generated Until", readonly=True, copy=False,
+                                  help="Trips up to this date have already been generated from this template.")
+
+    # Změna těchto polí zneplatní watermark a CRON projde celý horizont znovu
+    _SCHEDULE_FIELDS = {
+        'route_id', 'vehicle_id', 'driver_id', 'departure_time', 'date_from', 'date_to', 'exception_date_ids',
+        'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday', 'active',
+    }
+    _GENERATION_HORIZON_DAYS = 90
+    _GENERATION_BATCH_SIZE = 200
+    _TRIP_CREATE_CHUNK_SIZE = 500
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        templates = super().create(vals_list)
+        invalidate_search_cache(self.env, route_ids=templates.route_id.ids)
+        return templates
+
+    def write(self, vals):
+        if self._SCHEDULE_FIELDS.intersection(vals):
+            # Virtuální odjezdy ve výsledcích vyhledávání se počítají ze šablon
+            invalidate_search_cache(self.env, route_ids=self.route_id.ids)
+            if 'generated_until' not in vals:
+                vals = dict(vals, generated_until=False)
+        res = super().write(vals)
+        if 'route_id' in vals:
+            invalidate_search_cache(self.env, route_ids=self.route_id.ids)
+        return res
+
+    def unlink(self):
+        invalidate_search_cache(self.env, route_ids=self.route_id.ids)
+        return super().unlink()
+
+    def _reset_generation_watermark(self):
+        """Zneplatní watermark šablon v self (změna výjimek): CRON příště projde celý horizont znovu."""
+        invalidate_search_cache(self.env, route_ids=self.route_id.ids)
+        self.filtered('generated_until').write({'generated_until': False})
+
+    def _get_travel_duration(self):
+        self.ensure_one()
+        return self.route_id._get_travel_duration() if self.route_id else timedelta()
+
     def _get_arrival_datetime(self, departure_dt):
         self.ensure_one()
-        if not self.route_id or not self.route_id.stop_line_ids: return departure_dt
-        last_stop = self.route_id.stop_line_ids.sorted('sequence')[-1]
-        return departure_dt + timedelta(days=last_stop.offset_days, hours=last_stop.offset_time)
+        return departure_dt + self._get_travel_duration()
 
-    def _cron_generate_trips(self):
-        """Metoda volaná CRONem pro generování spojů na X dní dopředu."""
-        Trip = self.env['bus.ticket.trip']
+    def _get_departure_datetime(self, departure_date):
+        self.ensure_one()
+        departure_hour = int(self.departure_time)
+        departure_minute = int((self.departure_time * 60) % 60)
+        return datetime.combine(departure_date, datetime.min.time()).replace(hour=departure_hour, minute=departure_minute)
+
+    def _get_departures(self, start_date, end_date, exception_dates=()):
+        """Vrátí seznam časů odjezdů šablony v intervalu <start_date, end_date> (bez dotazů do DB)."""
+        self.ensure_one()
+        start_date = max(start_date, self.date_from) if self.date_from else start_date
+        end_date = min(end_date, self.date_to) if self.date_to else end_date
+        weekdays = (self.monday, self.tuesday, self.wednesday, self.thursday, self.friday, self.saturday, self.sunday)
+        departures = []
+        current_date = start_date
+        while current_date <= end_date:
+            if weekdays[current_date.weekday()] and current_date not in exception_dates:
+                departures.append(self._get_departure_datetime(current_date))
+            current_date += timedelta(days=1)
+        return departures
+
+    def _get_exception_dates(self):
+        """Načte výjimky všech šablon v self jedním dotazem: {template_id: {date, ...}}."""
+        exception_dates = {template.id: set() for template in self}
+        if self:
+            for row in self.env['bus.ticket.trip.template.exception'].search_read([('template_id', 'in', self.ids)], ['template_id', 'date']):
+                exception_dates[row['template_id'][0]].add(row['date'])
+        return exception_dates
+
+    def _prepare_trip_vals(self, departure_dt, travel_duration):
+        self.ensure_one()
+        return {
+            'route_id': self.route_id.id,
+            'vehicle_id': self.vehicle_id.id,
+            'driver_id': self.driver_id.id,
+            'departure_time': departure_dt,
+            'arrival_time': departure_dt + travel_duration,
+            'trip_template_id': self.id,
+        }
+
+    def _get_existing_departures(self, date_from, date_to):
+        """Vrátí množinu (template_id, departure_time) již existujících spojů jedním dotazem."""
+        if not self:
+            return set()
+        self.env['bus.ticket.trip'].flush_model(['trip_template_id', 'departure_time'])
+        self.env.cr.execute("""
+            SELECT trip_template_id, departure_time
+              FROM bus_ticket_trip
+             WHERE trip_template_id IN %s
+               AND departure_time BETWEEN %s AND %s
+        """, [tuple(self.ids), date_from, date_to])
+        return set(self.env.cr.fetchall())
+
+    def _generate_trips_until(self, horizon_date):
+        """Dogeneruje spoje všech šablon v self až do horizon_date a posune jejich watermark.
+
+        Kandidátní odjezdy se spočítají v paměti, existující spoje se načtou jedním dotazem
+        a chybějící spoje se vytvoří po dávkách jediným voláním create(vals_list).
+        """
         today = date.today()
+        exception_dates = self._get_exception_dates()
+        candidates = []
+        for template in self:
+            start_date = today
+            if template.generated_until and template.generated_until >= today:
+                start_date = template.generated_until + timedelta(days=1)
+            departures = template._get_departures(start_date, horizon_date, exception_dates[template.id])
+            if departures:
+                travel_duration = template._get_travel_duration()
+                candidates.extend((template, departure_dt, travel_duration) for departure_dt in departures)
+
+        trips = self.env['bus.ticket.trip']
+        if candidates:
+            existing = self._get_existing_departures(min(c[1] for c in candidates), max(c[1] for c in candidates))
+            vals_list = [
+                template._prepare_trip_vals(departure_dt, travel_duration)
+                for template, departure_dt, travel_duration in candidates
+                if (template.id, departure_dt) not in existing
+            ]
+            Trip = trips.with_context(tracking_disable=True, mail_create_nolog=True, mail_create_nosubscribe=True)
+            for chunk in split_every(self._TRIP_CREATE_CHUNK_SIZE, vals_list, list):
+                trips |= Trip.create(chunk)
+        self.write({'generated_until': horizon_date})
+        return trips
+
+    # ---------------------------------------------------------------
+    # Virtuální odjezdy: odjezdy ze šablon, pro které ještě neexistuje spoj
+    # ---------------------------------------------------------------
+    _DEPARTURE_REF_FORMAT = '%Y%m%d%H%M'
+
+    def _get_departure_ref(self, departure_dt):
+        """Stabilní identifikátor virtuálního odjezdu, např. 'T12-202601311430'."""
+        self.ensure_one()
+        return f"T{self.id}-{departure_dt.strftime(self._DEPARTURE_REF_FORMAT)}"
+
+    @api.model
+    def _parse_departure_ref(self, ref):
+        """Opak _get_departure_ref: vrátí (šablona, čas odjezdu), nebo (prázdná šablona, None)."""
+        try:
+            template_part, departure_part = ref.split('-', 1)
+            template = self.browse(int(template_part.removeprefix('T'))).exists()
+            departure_dt = datetime.strptime(departure_part, self._DEPARTURE_REF_FORMAT)
+        except (AttributeError, ValueError):
+            return self.browse(), None
+        # Reference musí odpovídat skutečnému odjezdu aktivní šablony (dny v týdnu, platnost, výjimky)
+        # v okně prodeje; jinak by šlo materializovat spoje v minulosti nebo daleko za horizontem
+        if not template.active:
+            return self.browse(), None
+        departure_date = departure_dt.date()
+        if not date.today() <= departure_date <= date.today() + timedelta(days=self._GENERATION_HORIZON_DAYS):
+            return self.browse(), None
+        if departure_dt not in template._get_departures(departure_date, departure_date, template._get_exception_dates()[template.id]):
+            return self.browse(), None
+        return template, departure_dt
+
+    @api.model
+    def _get_virtual_departures(self, route_ids, date_from, date_to):
+        """Spočítá v paměti odjezdy aktivních šablon tras v intervalu <date_from, date_to>,
+        pro které zatím neexistuje spoj. Nic nezapisuje, takže je lze volat i na read-only kurzoru.
+        Interval se ořízne na okno prodeje (dnešek až horizont generování), stejně jako _parse_departure_ref.
+
+        Vrací seznam slovníků {'template', 'departure_time', 'arrival_time', 'ref'}.
+        """
+        date_from = max(date_from, date.today())
+        date_to = min(date_to, date.today() + timedelta(days=self._GENERATION_HORIZON_DAYS))
+        if date_from > date_to:
+            return []
+        templates = self.search([('active', '=', True), ('route_id', 'in', route_ids)])
+        exception_dates = templates._get_exception_dates()
+        candidates = [
+            (template, departure_dt)
+            for template in templates
+            for departure_dt in template._get_departures(date_from, date_to, exception_dates[template.id])
+        ]
+        if not candidates:
+            return []
+        existing = templates._get_existing_departures(min(c[1] for c in candidates), max(c[1] for c in candidates))
+        travel_durations = {}
+        departures = []
+        for template, departure_dt in candidates:
+            if (template.id, departure_dt) in existing:
+                continue
+            if template not in travel_durations:
+                travel_durations[template] = template._get_travel_duration()
+            departures.append({
+                'template': template,
+                'departure_time': departure_dt,
+                'arrival_time': departure_dt + travel_durations[template],
+                'ref': template._get_departure_ref(departure_dt),
+            })
+        return departures
+
+    @api.model
+    def _serialize_virtual_departures(self, departures):
+        """Naformátuje virtuální odjezdy (viz _get_virtual_departures) stejně jako spoje; místo id nesou 'ref'."""
+        Trip = self.env['bus.ticket.trip']
+        templates = self.browse({departure['template'].id for departure in departures})
+        template_rows = {row['id']: row for row in templates.read(['route_id', 'vehicle_id', 'driver_id'], load=None)}
+        route_names, vehicles, drivers = Trip._read_api_related(
+            [row['route_id'] for row in template_rows.values()],
+            [row['vehicle_id'] for row in template_rows.values()],
+            [row['driver_id'] for row in template_rows.values()])
+        departures_data = []
+        for departure in departures:
+            template_row = template_rows[departure['template'].id]
+            vehicle = vehicles.get(template_row['vehicle_id']) or {}
+            trip_data = {'id': None, 'ref': departure['ref'], 'virtual': True}
+            trip_data.update(Trip._format_api_trip(dict(
+                template_row,
+                name=f"{route_names.get(template_row['route_id'], '')} on {departure['departure_time'].strftime('%d.%m.%Y')}",
+                departure_time=departure['departure_time'],
+                arrival_time=departure['arrival_time'],
+                available_seats=vehicle.get('seat_layout_total_seats', 0),
+            ), route_names, vehicles, drivers))
+            departures_data.append(trip_data)
+        return departures_data
+
+    def _materialize_departure(self, departure_dt):
+        """Vrátí spoj šablony s daným odjezdem; pokud neexistuje, vytvoří ho (i se sedadly).
+
+        Vytvoří-li týž spoj souběžná transakce, snímek REPEATABLE READ ho nevidí a hledání by vrátilo
+        prázdno; proto se vyvolá ConcurrencyError a Odoo (service.model.retrying) požadavek zopakuje
+        v novém snímku, kde už spoj najde první search.
+        """
+        self.ensure_one()
+        Trip = self.env['bus.ticket.trip']
+        domain = [('trip_template_id', '=', self.id), ('departure_time', '=', departure_dt)]
+        trip = Trip.search(domain, limit=1)
+        if trip:
+            return trip
+        vals = dict(self._prepare_trip_vals(departure_dt, self._get_travel_duration()), state='confirmed')
+        try:
+            with self.env.cr.savepoint():
+                return Trip.with_context(tracking_disable=True, mail_create_nolog=True).create(vals)
+        except IntegrityError as exc:
+            if exc.diag.constraint_name != 'bus_ticket_trip_template_departure_unique':
+                raise
+            # Souběžný požadavek spoj právě vytvořil
+            raise ConcurrencyError(f"Departure {self._get_departure_ref(departure_dt)} was materialized concurrently") from exc
+
+    @api.model
+    @metrics.instrument_job('generate_trips')
+    def _cron_generate_trips(self):
+        """Metoda volaná CRONem pro generování spojů na X dní dopředu.
+
+        Zpracovává jen šablony, jejichž watermark nedosahuje horizontu, a u nich jen nový konec horizontu.
+        """
         # Generujeme na 90 dní dopředu
-        future_date = today + timedelta(days=90) 
-        
-        for template in self.search([('active', '=', True)]):
-            start_date = max(today, template.date_from) if template.date_from else today
-            end_date = min(future_date, template.date_to) if template.date_to else future_date
-            
-            exception_dates = {ex.date for ex in template.exception_date_ids}
-            weekdays_map = {0: template.monday, 1: template.tuesday, 2: template.wednesday, 3: template.thursday, 4: template.friday, 5: template.saturday, 6: template.sunday}
-            
-            current_date = start_date
-            while current_date <= end_date:
-                if weekdays_map.get(current_date.weekday()) and current_date not in exception_dates:
-                    departure_hour = int(template.departure_time)
-                    departure_minute = int((template.departure_time * 60) % 60)
-                    departure_dt = datetime.combine(current_date, datetime.min.time()).replace(hour=departure_hour, minute=departure_minute)
-                    
-                    # Zkontrolujeme, zda spoj již neexistuje
-                    if not Trip.search_count([('trip_template_id', '=', template.id), ('departure_time', '=', departure_dt)]):
-                        arrival_dt = template._get_arrival_datetime(departure_dt)
-                        Trip.create({
-                            'route_id': template.route_id.id,
-                            'vehicle_id': template.vehicle_id.id,
-                            'driver_id': template.driver_id.id,
-                            'departure_time': departure_dt,
-                            'arrival_time': arrival_dt,
-                            'trip_template_id': template.id,
-                        })
-                current_date += timedelta(days=1)
+        horizon_date = date.today() + timedelta(days=self._GENERATION_HORIZON_DAYS)
+        templates = self.search([
+            ('active', '=', True),
+            '|', ('generated_until', '=', False), ('generated_until', '<', horizon_date),
+        ])
+        for batch in split_every(self._GENERATION_BATCH_SIZE, templates.ids, self.browse):
+            batch._generate_trips_until(horizon_date)
 
 class TripTemplateException(models.Model):
     _name = 'bus.ticket.trip.template.exception'
@@ -202,3 +839,22 @@ class TripTemplateException(models.Model):
     template_id = fields.Many2one('bus.ticket.trip.template', required=True, ondelete='cascade')
     date = fields.Date(string="Date", required=True)
     reason = fields.Char(string="Reason")
+
+    # Výjimky mění odjezdy šablony -> vygenerované spoje i virtuální odjezdy se musí přepočítat
+    @api.model_create_multi
+    def create(self, vals_list):
+        exceptions = super().create(vals_list)
+        exceptions.template_id._reset_generation_watermark()
+        return exceptions
+
+    def write(self, vals):
+        templates = self.template_id
+        res = super().write(vals)
+        (templates | self.template_id)._reset_generation_watermark()
+        return res
+
+    def unlink(self):
+        templates = self.template_id
+        res = super().unlink()
+        templates.exists()._reset_generation_watermark()
+        return res
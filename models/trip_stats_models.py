@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/models/trip_stats_models.py
+
+from odoo import models, fields, api
+from ..tools import metrics
+
+# Klíč v cr.precommit.data: id spojů, jejichž statistiky je třeba přepočítat před commitem
+DIRTY_TRIPS_KEY = 'bus_ticket_core.trip_stats_dirty'
+
+
+def mark_trip_stats_dirty(env, trip_ids):
+    """Označí statistiky spojů k přepočtu; přepočítají se jednou za transakci těsně před commitem."""
+    trip_ids = {trip_id for trip_id in trip_ids if trip_id}
+    if not trip_ids:
+        return
+    dirty = env.cr.precommit.data.get(DIRTY_TRIPS_KEY)
+    if dirty is None:
+        dirty = env.cr.precommit.data[DIRTY_TRIPS_KEY] = set()
+
+        @env.cr.precommit.add
+        def _rebuild_dirty_trip_stats():
+            env['bus.ticket.trip.stats'].sudo()._rebuild(env.cr.precommit.data.pop(DIRTY_TRIPS_KEY, ()))
+    dirty.update(trip_ids)
+
+
+# ===================================================================
+# Statistiky prodeje spojů (materializovaná kniha, jeden řádek na spoj)
+# ===================================================================
+class BusTripStats(models.Model):
+    _name = 'bus.ticket.trip.stats'
+    _description = 'Bus Trip Sales Statistics'
+    _order = 'departure_time desc'
+    _log_access = False
+
+    trip_id = fields.Many2one('bus.ticket.trip', string="Trip", required=True, ondelete='cascade', index=True)
+    route_id = fields.Many2one('bus.ticket.route', string="Route", readonly=True)
+    departure_time = fields.Datetime(string="Departure Time", readonly=True)
+    currency_id = fields.Many2one('res.currency', string="Currency", related='trip_id.currency_id')
+    revenue = fields.Monetary(string="Revenue", readonly=True)
+    order_count = fields.Integer(string="Orders", readonly=True)
+    passenger_count = fields.Integer(string="Passengers", readonly=True)
+    seat_count = fields.Integer(string="Seats", readonly=True)
+    load_factor = fields.Float(string="Load Factor (%)", readonly=True, aggregator='avg')
+    updated_at = fields.Datetime(string="Updated At", readonly=True)
+
+    _sql_constraints = [
+        ('trip_uniq', 'UNIQUE(trip_id)', "Each trip can have only one statistics row."),
+    ]
+
+    @api.model
+    def _rebuild(self, trip_ids=None):
+        """Přepočítá statistiky zadaných spojů (bez trip_ids všech) jedním agregačním dotazem.
+
+        Tržby a cestující se počítají z potvrzených objednávek, počet objednávek ze všech nezrušených.
+        """
+        if trip_ids is not None:
+            trip_ids = tuple(trip_ids)
+            if not trip_ids:
+                return
+        self.env['sale.order.line'].flush_model(['trip_id', 'seat_id', 'order_id', 'price_total'])
+        self.env['sale.order'].flush_model(['state'])
+        self.env['bus.ticket.trip'].flush_model(['route_id', 'departure_time', 'available_seats_count', 'sold_seats_count'])
+        self.env['bus.ticket.trip.seat'].flush_model(['trip_id'])
+        trip_filter = "WHERE trip.id IN %(trip_ids)s" if trip_ids is not None else ""
+        sales_filter = "AND COALESCE(line.trip_id, seat.trip_id) IN %(trip_ids)s" if trip_ids is not None else ""
+        self.env.cr.execute(f"""
+            WITH sales AS (
+                SELECT COALESCE(line.trip_id, seat.trip_id) AS trip_id,
+                       SUM(line.price_total) FILTER (WHERE so.state IN ('sale', 'done')) AS revenue,
+                       COUNT(DISTINCT line.order_id) FILTER (WHERE so.state != 'cancel') AS order_count,
+                       COUNT(line.id) FILTER (WHERE so.state IN ('sale', 'done')) AS passenger_count
+                  FROM sale_order_line AS line
+                  JOIN sale_order AS so ON so.id = line.order_id
+             LEFT JOIN bus_ticket_trip_seat AS seat ON seat.id = line.seat_id
+                 WHERE COALESCE(line.trip_id, seat.trip_id) IS NOT NULL
+                   {sales_filter}
+                 GROUP BY 1
+            )
+            INSERT INTO bus_ticket_trip_stats AS stats (trip_id, route_id, departure_time, revenue, order_count,
+                                                        passenger_count, seat_count, load_factor, updated_at)
+            SELECT trip.id, trip.route_id, trip.departure_time,
+                   COALESCE(sales.revenue, 0), COALESCE(sales.order_count, 0), COALESCE(sales.passenger_count, 0),
+                   trip.available_seats_count + trip.sold_seats_count,
+                   COALESCE(100.0 * sales.passenger_count / NULLIF(trip.available_seats_count + trip.sold_seats_count, 0), 0),
+                   now() at time zone 'UTC'
+              FROM bus_ticket_trip AS trip
+         LEFT JOIN sales ON sales.trip_id = trip.id
+              {trip_filter}
+            ON CONFLICT (trip_id) DO UPDATE
+               SET route_id = EXCLUDED.route_id,
+                   departure_time = EXCLUDED.departure_time,
+                   revenue = EXCLUDED.revenue,
+                   order_count = EXCLUDED.order_count,
+                   passenger_count = EXCLUDED.passenger_count,
+                   seat_count = EXCLUDED.seat_count,
+                   load_factor = EXCLUDED.load_factor,
+                   updated_at = EXCLUDED.updated_at
+        """, {'trip_ids': trip_ids})
+        self.invalidate_model()
+
+    @api.model
+    @metrics.instrument_job('rebuild_trip_stats')
+    def _cron_rebuild_trip_stats(self):
+        """Metoda volaná CRONem: přepočítá statistiky všech spojů (pojistka proti rozjetí knihy)."""
+        self._rebuild()
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 # soubor: bus_ticket_core/models/way_point.py
 
+from collections import defaultdict
+
 from odoo import models, fields, api
 from itertools import combinations
 
@@ -16,4 +18,72 @@ class BusTicketWayPoint(models.Model):
     stop_id = fields.Many2one('bus.ticket.stop', required=True)
     sequence = fields.Integer(string="Sequence", default=10)
     offset_days = fields.Integer(string="Day Offset", default=0)
-    offset_time = fields.Float(string="Time")
\ No newline at end of file
+    offset_time = fields.Float(string="Time")
+    # Kumulativní jízdné od první zastávky linky (obdoba offset_time pro ceny); bez zadání ho create
+    # převezme z předchozí zastávky linky (viz _default_fare_offsets)
+    fare_offset = fields.Float(string="Cumulative Fare",
+                               help="Fare from the first stop of the route to this stop. "
+                                    "Defaults to the fare of the previous stop, which leaves the new leg unpriced.")
+
+    # Pole, ze kterých se skládá jízdní řád linky (viz BusRoute._load_timetable)
+    _TIMETABLE_FIELDS = {'route_id', 'stop_id', 'sequence', 'offset_days', 'offset_time'}
+    # Pole, která určují pořadí zastávek a tím úseky linky (bity leg_mask sedadel a jízdenek) i dvojice měst indexu
+    _LEG_FIELDS = {'route_id', 'stop_id', 'sequence'}
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.env['bus.ticket.route'].browse({vals['route_id'] for vals in vals_list if vals.get('route_id')})._check_legs_editable()
+        self._default_fare_offsets(vals_list)
+        way_points = super().create(vals_list)
+        way_points.route_id._bump_timetable_version()
+        self.env['bus.ticket.city.pair']._refresh_routes(way_points.route_id.ids)
+        return way_points
+
+    def write(self, vals):
+        routes = self.route_id
+        leg_change = bool(self._LEG_FIELDS.intersection(vals))
+        if leg_change:
+            stops_before = {route.id: route._get_stop_ids() for route in routes}
+        res = super().write(vals)
+        if leg_change:
+            # Přečíslování bez změny pořadí zastávek (např. z formuláře linky) úseky neposouvá
+            (routes | self.route_id).filtered(lambda route: route._get_stop_ids() != stops_before.get(route.id))._check_legs_editable()
+        if self._TIMETABLE_FIELDS.intersection(vals):
+            (routes | self.route_id)._bump_timetable_version()
+        # Dvojice měst se skládají znovu jen při změně zastávek, změna jízdného přepíše jen ceny
+        if leg_change:
+            self.env['bus.ticket.city.pair']._refresh_routes(routes.ids + self.route_id.ids)
+        elif 'fare_offset' in vals:
+            self.env['bus.ticket.city.pair']._refresh_prices(routes.ids)
+        return res
+
+    @api.model
+    def _default_fare_offsets(self, vals_list):
+        """Waypointům bez zadaného jízdného doplní kumulativní jízdné předchozí zastávky linky.
+
+        Úsek k nové zastávce tak zůstane neoceněný (lookup_fare vrátí None), místo aby nulové
+        jízdné vložené zastávky udělalo ceny navazujících úseků záporné.
+        """
+        missing_route_ids = {vals['route_id'] for vals in vals_list if vals.get('route_id') and 'fare_offset' not in vals}
+        if not missing_route_ids:
+            return
+        fares_by_route = defaultdict(list)  # route_id -> [(sequence, fare_offset)]
+        for way_point in self.search([('route_id', 'in', list(missing_route_ids))]):
+            fares_by_route[way_point.route_id.id].append((way_point.sequence, way_point.fare_offset))
+        for vals in vals_list:
+            if vals.get('route_id') not in missing_route_ids:
+                continue
+            route_fares = fares_by_route[vals['route_id']]
+            sequence = vals.get('sequence', self._fields['sequence'].default(self))
+            if 'fare_offset' not in vals:
+                previous = [(way_point_sequence, fare) for way_point_sequence, fare in route_fares if way_point_sequence <= sequence]
+                vals['fare_offset'] = sorted(previous, key=lambda item: item[0])[-1][1] if previous else 0.0
+            route_fares.append((sequence, vals['fare_offset']))
+
+    def unlink(self):
+        routes = self.route_id
+        routes._check_legs_editable()
+        res = super().unlink()
+        routes.exists()._bump_timetable_version()
+        self.env['bus.ticket.city.pair']._refresh_routes(routes.ids)
+        return res
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/tests/__init__.py
+
+from . import test_benchmarks
+from . import test_seats
+from . import test_trip_generation
+from . import test_orders
+from . import test_batch_orders
+from . import test_fares
+from . import test_search_cache
+from . import test_api_auth
+from . import test_seat_counters
+from . import test_seat_map
+from . import test_conditional_get
+from . import test_availability
+from . import test_search
+from . import test_trip_stats
+from . import test_timetables
+from . import test_journeys
+from . import test_trip_archive
+from . import test_metrics
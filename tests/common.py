@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/tests/common.py
+
+import json
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from unittest.mock import patch
+
+from odoo.tests import HttpCase, TransactionCase
+
+_logger = logging.getLogger(__name__)
+
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), 'benchmark_baselines.json')
+# Nastavením proměnné prostředí se místo porovnání s baseline naměřené hodnoty uloží jako nové baseline
+UPDATE_BASELINES_ENV = 'BUS_TICKET_BENCHMARK_UPDATE'
+# Tolerance regresí: počet dotazů je deterministický, čas závisí na stroji
+QUERY_TOLERANCE = 0.10
+QUERY_SLACK = 5
+TIME_TOLERANCE = 3.0
+
+
+class BusTicketDataGenerator:
+    """Reprodukovatelný generátor sítě linek pro benchmarky (stejný seed -> stejná data).
+
+    Síť má n_routes linek po n_waypoints zastávkách vybraných ze sdíleného fondu zastávek (linky se
+    tak potkávají a dají se na nich plánovat přestupy) a n_templates šablon jízdního řádu na linku.
+    """
+
+    def __init__(self, env, seed=42):
+        self.env = env
+        self.rng = random.Random(seed)
+
+    def create_seat_layout(self, rows=10, seats_per_row=4):
+        return self.env['bus.ticket.seat.layout'].create({
+            'name': f"Benchmark Layout {rows}x{seats_per_row}",
+            'layout_line_ids': [(0, 0, {'row_name': str(row), 'seat_count': seats_per_row}) for row in range(1, rows + 1)],
+        })
+
+    def create_vehicles(self, layout, count):
+        brand = self.env['fleet.vehicle.model.brand'].create({'name': "Benchmark Coaches"})
+        model = self.env['fleet.vehicle.model'].create({'name': "Benchmark Coach", 'brand_id': brand.id})
+        return self.env['fleet.vehicle'].create([
+            {'model_id': model.id, 'seat_layout_id': layout.id, 'license_plate': f"BENCH-{number:04d}"}
+            for number in range(count)
+        ])
+
+    def create_network(self, n_routes, n_waypoints, n_templates, rows=10, seats_per_row=4):
+        """Vytvoří zastávky, linky s waypointy a kumulativními cenami, vozidla a šablony jízdních řádů."""
+        n_stops = max(n_waypoints, n_routes * n_waypoints // 2)
+        stops = self.env['bus.ticket.stop'].create([
+            {'name': f"Bench City {number:04d}, Main Station"} for number in range(n_stops)
+        ])
+        routes = self.env['bus.ticket.route'].create([{
+            'name': f"Benchmark Route {number:04d}",
+            'stop_line_ids': [(0, 0, {
+                'stop_id': stop.id,
+                'sequence': position * 10,
+                'offset_time': position * self.rng.uniform(0.5, 1.5),
+                'fare_offset': position * self.rng.randint(40, 120),
+            }) for position, stop in enumerate(self.rng.sample(list(stops), n_waypoints))],
+        } for number in range(n_routes)])
+        vehicles = self.create_vehicles(self.create_seat_layout(rows, seats_per_row), n_routes)
+        templates = self.env['bus.ticket.trip.template'].create([{
+            'name': f"{route.name} / {number}",
+            'route_id': route.id,
+            'vehicle_id': vehicle.id,
+            'departure_time': self.rng.choice(range(5, 22)) + self.rng.choice((0.0, 0.25, 0.5, 0.75)),
+            'saturday': True,
+            'sunday': True,
+        } for route, vehicle in zip(routes, vehicles) for number in range(n_templates)])
+        return {'stops': stops, 'routes': routes, 'vehicles': vehicles, 'templates': templates}
+
+    def generate_trips(self, templates, days):
+        return templates._generate_trips_until(date.today() + timedelta(days=days))
+
+    def presell_seats(self, trips, ratio):
+        """Prodá náhodný podíl sedadel spojů (celé linky), jako by je koupili dřívější zákazníci."""
+        seats = trips.seat_ids
+        sold = seats.browse(self.rng.sample(seats.ids, int(len(seats) * ratio)))
+        claimed = sold._claim_seats()
+        claimed.write({'state': 'sold'})
+        return claimed
+
+    def create_orders(self, trips, n_orders, seats_per_order=2):
+        """Vytvoří nepotvrzené objednávky jízdenek se zarezervovanými sedadly (vstup pro action_confirm)."""
+        partners = self.env['res.partner'].create([
+            {'name': f"Benchmark Customer {number}", 'email': f"customer{number}@bench.example.com"}
+            for number in range(n_orders)
+        ])
+        product = self.env.ref('bus_ticket_core.product_product_bus_ticket')
+        orders = self.env['sale.order'].create([{'partner_id': partner.id} for partner in partners])
+        line_vals = []
+        for order in orders:
+            trip = self.rng.choice(trips)
+            free_seats = trip.seat_ids.filtered(lambda seat: seat.state == 'available')
+            seats = free_seats.browse(self.rng.sample(free_seats.ids, min(seats_per_order, len(free_seats))))
+            for seat in seats._claim_seats():
+                line_vals.append({
+                    'order_id': order.id, 'product_id': product.id, 'name': f"Ticket {seat.name}",
+                    'price_unit': 100.0, 'trip_id': trip.id, 'seat_id': seat.id,
+                    'leg_mask': seat.leg_mask,
+                })
+        self.env['sale.order.line'].create(line_vals)
+        return orders
+
+
+class BusTicketCase(TransactionCase):
+    """Malá pevná síť pro testy chování: linka Praha - Brno - Olomouc - Ostrava se čtyřmi sedadly.
+
+    Kumulativní jízdné waypointů je 0 / 200 / 300 / 450, jízdní doby 0 / 2,5 / 3,5 / 5 h.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.env = cls.env(context=dict(cls.env.context, tracking_disable=True))
+        cls.generator = BusTicketDataGenerator(cls.env)
+        cls.stop_praha, cls.stop_brno, cls.stop_olomouc, cls.stop_ostrava = cls.env['bus.ticket.stop'].create([
+            {'name': "Praha, Florenc"},
+            {'name': "Brno, Zvonařka"},
+            {'name': "Olomouc, Hlavní nádraží"},
+            {'name': "Ostrava, ÚAN"},
+        ])
+        cls.stops = cls.stop_praha | cls.stop_brno | cls.stop_olomouc | cls.stop_ostrava
+        cls.route = cls.env['bus.ticket.route'].create({
+            'name': "Praha - Ostrava",
+            'stop_line_ids': [(0, 0, {
+                'stop_id': stop.id, 'sequence': (position + 1) * 10, 'offset_time': offset_time, 'fare_offset': fare,
+            }) for position, (stop, offset_time, fare) in enumerate(zip(cls.stops, (0.0, 2.5, 3.5, 5.0), (0.0, 200.0, 300.0, 450.0)))],
+        })
+        cls.layout = cls.generator.create_seat_layout(rows=2, seats_per_row=2)
+        cls.vehicle = cls.generator.create_vehicles(cls.layout, 1)
+        cls.template = cls.env['bus.ticket.trip.template'].create({
+            'name': "Praha - Ostrava 08:00",
+            'route_id': cls.route.id,
+            'vehicle_id': cls.vehicle.id,
+            'departure_time': 8.0,
+            'saturday': True,
+            'sunday': True,
+        })
+        cls.product = cls.env.ref('bus_ticket_core.product_product_bus_ticket')
+        cls.partner = cls.env['res.partner'].create({'name': "Test Customer", 'email': "customer@bus-ticket.example.com"})
+
+    @classmethod
+    def departure(cls, days=3, hour=8):
+        return datetime.combine(date.today() + timedelta(days=days), datetime.min.time()).replace(hour=hour)
+
+    @classmethod
+    def create_trip(cls, days=3, hour=8, **vals):
+        return cls.env['bus.ticket.trip'].create(dict({
+            'route_id': cls.route.id,
+            'vehicle_id': cls.vehicle.id,
+            'departure_time': cls.departure(days, hour),
+            'state': 'confirmed',
+        }, **vals))
+
+    def create_ticket_order(self, seats, stop_from=None, stop_to=None, hold_expires_at=None):
+        """Nepotvrzená objednávka s řádkem na každé sedadlo (sedadla se zaberou jako v /api/v1/order/create)."""
+        claimed = seats._claim_seats(stop_from and stop_from.id, stop_to and stop_to.id, allow_partial=False)
+        self.assertEqual(claimed, seats)
+        trip = seats.trip_id
+        leg_mask = trip._get_segment_masks(stop_from and stop_from.id, stop_to and stop_to.id)[trip.id]
+        return self.env['sale.order'].create({
+            'partner_id': self.partner.id,
+            'order_line': [(0, 0, {
+                'product_id': self.product.id, 'name': f"Ticket {seat.name}", 'price_unit': 100.0,
+                'trip_id': trip.id, 'seat_id': seat.id, 'leg_mask': leg_mask,
+                'stop_from_id': stop_from and stop_from.id, 'stop_to_id': stop_to and stop_to.id,
+                'hold_expires_at': hold_expires_at,
+            }) for seat in seats],
+        })
+
+
+class BusTicketApiCase(BusTicketCase, HttpCase):
+    """Testy HTTP API nad sítí BusTicketCase; požadavky se ověřují API klíčem administrátora."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.api_user = cls.env.ref('base.user_admin')
+        cls.api_key_name = 'bus-ticket-test'
+        cls.env['res.users.apikeys'].with_user(cls.api_user)._generate(None, cls.api_key_name, False)
+
+    def api_headers(self, **headers):
+        return dict({'X-API-Key': self.api_key_name, 'Content-Type': 'application/json'}, **headers)
+
+    def api_get(self, path, **headers):
+        return self.url_open(path, headers=self.api_headers(**headers))
+
+    def api_post(self, path, data, **headers):
+        return self.url_open(path, data=json.dumps(data), headers=self.api_headers(**headers))
+
+    def api_json(self, path, params):
+        """Zavolá JSON-RPC endpoint a vrátí jeho 'result' (i s případným {'error': ...})."""
+        response = self.api_post(path, {'jsonrpc': '2.0', 'params': params})
+        response.raise_for_status()
+        return response.json()['result']
+
+    @contextmanager
+    def serialization_failure_once(self, model_name, method_name):
+        """První volání metody modelu selže serializační chybou PostgreSQL (jako při souběžném zápisu),
+        další volání proběhnou normálně. Vrací seznam volání, podle kterého test ověří, že Odoo požadavek zopakoval.
+        """
+        model_class = type(self.env[model_name])
+        original = getattr(model_class, method_name)
+        calls = []
+
+        def fail_once(records, *args, **kwargs):
+            calls.append(args)
+            if len(calls) == 1:
+                records.env.cr.execute(
+                    "DO $$ BEGIN RAISE EXCEPTION 'concurrent update' USING ERRCODE = 'serialization_failure'; END $$")
+            return original(records, *args, **kwargs)
+
+        with patch.object(model_class, method_name, fail_once):
+            yield calls
+
+
+class BusTicketBenchmarkCase(HttpCase):
+    """Základ benchmarků: měří čas a počet SQL dotazů operací a porovnává je s uloženými baseline."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with open(BASELINES_PATH) as baselines_file:
+            cls.baselines = json.load(baselines_file).get('benchmarks', {})
+        cls.measurements = {}
+        cls.api_user = cls.env.ref('base.user_admin')
+        cls.api_key_name = 'bus-ticket-benchmark'
+        cls.env['res.users.apikeys'].with_user(cls.api_user)._generate(None, cls.api_key_name, False)
+
+    @classmethod
+    def tearDownClass(cls):
+        _logger.info("Bus Tickets benchmark results:\n%s", "\n".join(
+            f"  {name:<40} {result['time']:>9.3f} s {result['queries']:>7} queries"
+            for name, result in sorted(cls.measurements.items())
+        ))
+        if os.environ.get(UPDATE_BASELINES_ENV):
+            with open(BASELINES_PATH) as baselines_file:
+                stored = json.load(baselines_file)
+            stored.setdefault('benchmarks', {}).update(cls.measurements)
+            with open(BASELINES_PATH, 'w') as baselines_file:
+                json.dump(stored, baselines_file, indent=2, sort_keys=True)
+                baselines_file.write('\n')
+        super().tearDownClass()
+
+    def api_headers(self, **headers):
+        return dict({'X-API-Key': self.api_key_name, 'Content-Type': 'application/json'}, **headers)
+
+    def api_json(self, path, params):
+        response = self.url_open(path, data=json.dumps({'jsonrpc': '2.0', 'params': params}), headers=self.api_headers())
+        response.raise_for_status()
+        result = response.json()['result']
+        self.assertNotIn('error', result)
+        return result
+
+    @contextmanager
+    def benchmark(self, name):
+        """Změří blok: čas a počet SQL dotazů; bez UPDATE_BASELINES_ENV selže při regresi proti baseline,
+        benchmark bez baseline se přeskočí.
+        """
+        self.env.flush_all()
+        queries_before = self.cr.sql_log_count
+        started = time.perf_counter()
+        yield
+        self.env.flush_all()
+        result = {'time': round(time.perf_counter() - started, 4), 'queries': self.cr.sql_log_count - queries_before}
+        self.measurements[name] = result
+        if os.environ.get(UPDATE_BASELINES_ENV):
+            return
+        baseline = self.baselines.get(name)
+        if not baseline:
+            # Bez baseline není s čím porovnat; přeskočení se objeví ve výsledcích testů, ne jen v logu
+            self.skipTest(f"{name}: no baseline recorded (run the benchmarks with {UPDATE_BASELINES_ENV}=1 to record it)")
+        max_queries = int(baseline['queries'] * (1 + QUERY_TOLERANCE)) + QUERY_SLACK
+        self.assertLessEqual(result['queries'], max_queries,
+                             f"{name}: {result['queries']} queries, baseline {baseline['queries']}")
+        self.assertLessEqual(result['time'], baseline['time'] * TIME_TOLERANCE,
+                             f"{name}: {result['time']} s, baseline {baseline['time']} s")
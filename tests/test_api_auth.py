@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/tests/test_api_auth.py
+
+import time
+from unittest.mock import patch
+
+from odoo.tests import TransactionCase, tagged
+
+from ..models.res_users_apikeys import API_KEY_CACHE_TTL
+
+
+@tagged('post_install', '-at_install')
+class TestApiKeyAuthentication(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = cls.env.ref('base.user_admin')
+        cls.ApiKeys = cls.env['res.users.apikeys'].sudo()
+        cls.ApiKeys.with_user(cls.user)._generate(None, "Partner Integration", False)
+
+    def test_authenticates_by_key_description(self):
+        self.assertEqual(self.ApiKeys._bus_ticket_authenticate("Partner Integration"), self.user.id)
+        self.assertFalse(self.ApiKeys._bus_ticket_authenticate("Unknown Integration"))
+
+    def test_verification_is_cached(self):
+        self.ApiKeys._bus_ticket_authenticate("Partner Integration")
+        with self.assertQueryCount(0):
+            self.assertEqual(self.ApiKeys._bus_ticket_authenticate("Partner Integration"), self.user.id)
+
+    def test_revoking_a_key_clears_the_cache(self):
+        self.ApiKeys._bus_ticket_authenticate("Partner Integration")
+        self.ApiKeys.search([('name', '=', "Partner Integration")]).unlink()
+        self.assertFalse(self.ApiKeys._bus_ticket_authenticate("Partner Integration"))
+
+    def test_new_key_is_accepted_immediately(self):
+        self.assertFalse(self.ApiKeys._bus_ticket_authenticate("Second Integration"))
+        self.ApiKeys.with_user(self.user)._generate(None, "Second Integration", False)
+        self.assertEqual(self.ApiKeys._bus_ticket_authenticate("Second Integration"), self.user.id)
+
+    def test_cached_verification_expires_after_ttl(self):
+        self.ApiKeys._bus_ticket_authenticate("Partner Integration")
+        # Smazání mimo ORM cache nezneplatní; ověření vydrží nejvýš do konce TTL
+        self.env.cr.execute("DELETE FROM res_users_apikeys WHERE name = %s", ["Partner Integration"])
+        self.assertEqual(self.ApiKeys._bus_ticket_authenticate("Partner Integration"), self.user.id)
+        with patch('time.time', return_value=time.time() + API_KEY_CACHE_TTL):
+            self.assertFalse(self.ApiKeys._bus_ticket_authenticate("Partner Integration"))
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/tests/test_availability.py
+
+from odoo.tests import tagged
+
+from ..controllers.main_api import BATCH_AVAILABILITY_LIMIT
+from ..models.seat_models import decode_seat_states, encode_seat_states
+from .common import BusTicketApiCase
+
+
+@tagged('post_install', '-at_install')
+class TestCompactAvailability(BusTicketApiCase):
+
+    def test_run_length_encoding(self):
+        self.assertEqual(encode_seat_states('AAAARRA'), 'A4R2A1')
+        self.assertEqual(encode_seat_states(''), '')
+        for codes in ('AAAARRA', 'S' * 12 + 'A', 'ARSA'):
+            self.assertEqual(decode_seat_states(encode_seat_states(codes)), codes)
+
+    def test_availability_of_whole_trips(self):
+        trip, empty_trip = self.create_trip(days=1), self.create_trip(days=2, vehicle_id=False)
+        trip.seat_ids[1]._claim_seats()
+        trip.seat_ids[2].state = 'sold'
+        availability = (trip | empty_trip)._get_compact_availability()
+        self.assertEqual(availability[trip.id], {
+            'served': True, 'seat_version': trip.seat_version, 'available': 2, 'states': 'A1R1S1A1',
+            'layout': {'id': self.layout.id, 'type': self.layout.layout_type,
+                       'max_x': max(trip.seat_ids.mapped('pos_x')), 'max_y': max(trip.seat_ids.mapped('pos_y'))},
+        })
+        self.assertEqual((availability[empty_trip.id]['states'], availability[empty_trip.id]['available']), ('', 0))
+
+    def test_availability_of_a_segment(self):
+        trip = self.create_trip()
+        trip.seat_ids[0]._claim_seats(self.stop_praha.id, self.stop_brno.id)
+        trip.seat_ids[1]._claim_seats(self.stop_olomouc.id, self.stop_ostrava.id)
+        availability = trip._get_compact_availability
+        self.assertEqual(availability(self.stop_brno.id, self.stop_olomouc.id)[trip.id]['states'], 'A4')
+        self.assertEqual(availability(self.stop_praha.id, self.stop_olomouc.id)[trip.id]['states'], 'R1A3')
+        self.assertEqual(availability(self.stop_brno.id, self.stop_ostrava.id)[trip.id]['states'], 'A1R1A2')
+        unserved = availability(self.stop_ostrava.id, self.stop_praha.id)[trip.id]
+        self.assertEqual((unserved['served'], unserved['available']), (False, 0))
+
+    def test_batch_endpoint(self):
+        trips = self.create_trip(days=1) | self.create_trip(days=2)
+        trips[0].seat_ids[0]._claim_seats()
+        result = self.api_json('/api/v1/trips/seats', {
+            'trip_ids': trips.ids + [trips[1].id + 1000000],
+            'from_stop_id': self.stop_praha.id, 'to_stop_id': self.stop_ostrava.id,
+        })
+        self.assertEqual(set(result['trips']), {str(trip.id) for trip in trips})
+        self.assertEqual(result['trips'][str(trips[0].id)]['states'], 'R1A3')
+        self.assertEqual(result['trips'][str(trips[1].id)]['available'], 4)
+
+    def test_batch_endpoint_rejects_invalid_input(self):
+        for params in ({}, {'trip_ids': 'abc'}, {'trip_ids': [1, 'x']}, {'trip_ids': list(range(1, BATCH_AVAILABILITY_LIMIT + 2))}):
+            self.assertEqual(self.api_json('/api/v1/trips/seats', params)['error']['code'], 400, params)
+        self.api_key_name = 'unknown'
+        self.assertEqual(self.api_json('/api/v1/trips/seats', {'trip_ids': [1]})['error']['code'], 401)
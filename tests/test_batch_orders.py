@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/tests/test_batch_orders.py
+
+from odoo.tests import tagged
+
+from ..controllers.order_api import BATCH_ORDER_LIMIT
+from .common import BusTicketApiCase
+
+
+@tagged('post_install', '-at_install')
+class TestBatchOrderApi(BusTicketApiCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.customer_info = {'name': "Jana Nováková", 'email': "jana@bus-ticket.example.com", 'phone': "+420 777 000 111"}
+
+    def _create_batch(self, items, **data):
+        response = self.api_post('/api/v1/order/batch', dict({'items': items, 'customer_info': self.customer_info}, **data))
+        return response.status_code, response.json()
+
+    def _orders(self):
+        return self.env['sale.order'].search([('partner_id.email', '=', self.customer_info['email'])])
+
+    def test_batch_creates_one_order_per_item(self):
+        outbound, later = self.create_trip(days=1), self.create_trip(days=2)
+        status, result = self._create_batch([
+            {'trip_id': outbound.id, 'seat_ids': outbound.seat_ids[:2].ids, 'from_stop_id': self.stop_praha.id, 'to_stop_id': self.stop_brno.id},
+            {'trip_id': later.id, 'seat_ids': later.seat_ids[:1].ids},
+        ])
+        self.assertEqual(status, 200)
+        self.assertEqual([item['trip_id'] for item in result['items']], [outbound.id, later.id])
+        orders = self.env['sale.order'].browse([item['order']['id'] for item in result['items']])
+        self.assertEqual(orders, self._orders())
+        self.assertEqual(len(orders.partner_id), 1)
+        self.assertEqual(orders[0].order_line.mapped('price_unit'), [200.0, 200.0])
+        self.assertEqual(orders[0].order_line.mapped('leg_mask'), [0b001, 0b001])
+        self.assertEqual((orders[1].order_line.price_unit, orders[1].order_line.leg_mask), (450.0, 0b111))
+        self.assertTrue(all(orders.order_line.mapped('hold_expires_at')))
+        self.assertEqual((outbound.sold_seats_count, later.sold_seats_count), (2, 1))
+
+    def test_batch_is_all_or_nothing(self):
+        outbound, later = self.create_trip(days=1), self.create_trip(days=2)
+        later.seat_ids[0]._claim_seats()
+        status, _result = self._create_batch([
+            {'trip_id': outbound.id, 'seat_ids': outbound.seat_ids[:1].ids},
+            {'trip_id': later.id, 'seat_ids': later.seat_ids[:2].ids},
+        ])
+        self.assertEqual(status, 409)
+        self.assertEqual((outbound.sold_seats_count, later.sold_seats_count), (0, 1))
+        self.assertFalse(self._orders())
+
+    def test_batch_validation(self):
+        trip, other_trip = self.create_trip(days=1), self.create_trip(days=2)
+        for items in (
+            [],
+            [{'trip_id': trip.id, 'seat_ids': trip.seat_ids[:1].ids}] * (BATCH_ORDER_LIMIT + 1),
+            [{'trip_id': trip.id, 'seat_ids': trip.seat_ids[:1].ids}, {'trip_id': trip.id, 'seat_ids': trip.seat_ids[:1].ids}],
+            [{'trip_id': trip.id, 'seat_ids': other_trip.seat_ids[:1].ids}],
+            [{'trip_id': trip.id, 'seat_ids': trip.seat_ids[:1].ids, 'from_stop_id': self.stop_ostrava.id, 'to_stop_id': self.stop_praha.id}],
+            [{'trip_id': trip.id}],
+        ):
+            status, _result = self._create_batch(items)
+            self.assertEqual(status, 400, items)
+        self.assertEqual(trip.sold_seats_count, 0)
+        self.assertFalse(self._orders())
+
+    def test_serialization_failure_is_retried(self):
+        outbound, later = self.create_trip(days=1), self.create_trip(days=2)
+        items = [
+            {'trip_id': outbound.id, 'seat_ids': outbound.seat_ids[:2].ids},
+            {'trip_id': later.id, 'seat_ids': later.seat_ids[:1].ids},
+        ]
+        with self.serialization_failure_once('bus.ticket.trip.seat', '_claim_seat_masks') as calls:
+            status, result = self._create_batch(items)
+        # Chyba neskončí jako 500, Odoo požadavek zopakuje a sedadla zabere napodruhé
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(status, 200)
+        self.assertEqual(len(result['items']), 2)
+        self.assertEqual(len(self._orders()), 2)
+        self.assertEqual((outbound.sold_seats_count, later.sold_seats_count), (2, 1))
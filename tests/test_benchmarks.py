@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/tests/test_benchmarks.py
+
+import json
+from unittest.mock import patch
+
+from odoo.tests import tagged
+
+from .common import BusTicketBenchmarkCase, BusTicketDataGenerator
+from ..tools.search_cache import get_search_cache
+
+# Velikosti sítě: (název, linek, zastávek na linku, šablon na linku)
+SIZES = [
+    ('small', 5, 6, 2),
+    ('medium', 20, 10, 3),
+]
+# Na kolik dní dopředu se v benchmarcích generují spoje
+TRIP_DAYS = 7
+PRESOLD_RATIO = 0.3
+
+
+@tagged('post_install', '-at_install', '-standard', 'bus_ticket_benchmark')
+class TestBookingBenchmarks(BusTicketBenchmarkCase):
+    """Benchmarky hlavních rezervačních cest; v běžném běhu testů se nespouští (-standard),
+    spuštění: --test-tags bus_ticket_benchmark.
+    """
+
+    def _network(self, n_routes, n_waypoints, n_templates, with_trips=True):
+        generator = BusTicketDataGenerator(self.env)
+        network = generator.create_network(n_routes, n_waypoints, n_templates)
+        if with_trips:
+            network['trips'] = generator.generate_trips(network['templates'], TRIP_DAYS)
+            generator.presell_seats(network['trips'], PRESOLD_RATIO)
+        network['generator'] = generator
+        return network
+
+    def test_cron_generate_trips(self):
+        Template = self.env['bus.ticket.trip.template']
+        for size, n_routes, n_waypoints, n_templates in SIZES:
+            with self.subTest(size=size):
+                self._network(n_routes, n_waypoints, n_templates, with_trips=False)
+                with patch.object(type(Template), '_GENERATION_HORIZON_DAYS', TRIP_DAYS), \
+                        self.benchmark(f'cron_generate_trips.{size}'):
+                    Template._cron_generate_trips()
+
+    def test_search_trips(self):
+        for size, n_routes, n_waypoints, n_templates in SIZES:
+            with self.subTest(size=size):
+                network = self._network(n_routes, n_waypoints, n_templates)
+                route = network['routes'][0]
+                trip = network['trips'].filtered(lambda t: t.route_id == route)[0]
+                params = {
+                    'from_city': route.start_stop_id.city,
+                    'to_city': route.end_stop_id.city,
+                    'departure_date': trip.departure_time.strftime('%Y-%m-%d'),
+                    'passengers': 2,
+                }
+                get_search_cache(self.env.cr.dbname).clear()
+                with self.benchmark(f'search_trips.{size}'):
+                    result = self.api_json('/api/v1/trips/search', params)
+                self.assertTrue(result['trips'])
+                with self.benchmark(f'search_trips_cached.{size}'):
+                    self.api_json('/api/v1/trips/search', params)
+
+    def test_get_trip_seats(self):
+        for size, n_routes, n_waypoints, n_templates in SIZES:
+            with self.subTest(size=size):
+                trip = self._network(n_routes, n_waypoints, n_templates)['trips'][0]
+                with self.benchmark(f'get_trip_seats.{size}'):
+                    response = self.url_open(f'/api/v1/trip/{trip.id}/seats', headers=self.api_headers())
+                self.assertEqual(response.status_code, 200)
+
+    def test_create_order(self):
+        for size, n_routes, n_waypoints, n_templates in SIZES:
+            with self.subTest(size=size):
+                trip = self._network(n_routes, n_waypoints, n_templates)['trips'][0]
+                seats = trip.seat_ids.filtered(lambda seat: seat.state == 'available')[:2]
+                payload = {
+                    'trip_id': trip.id,
+                    'seat_ids': seats.ids,
+                    'customer_info': {'name': "Benchmark Buyer", 'email': f"buyer.{size}@bench.example.com"},
+                }
+                with self.benchmark(f'create_order.{size}'):
+                    response = self.url_open('/api/v1/order/create', data=json.dumps(payload), headers=self.api_headers())
+                self.assertEqual(response.status_code, 200, response.text)
+
+    def test_action_confirm(self):
+        for size, n_routes, n_waypoints, n_templates in SIZES:
+            with self.subTest(size=size):
+                network = self._network(n_routes, n_waypoints, n_templates)
+                orders = network['generator'].create_orders(network['trips'], n_orders=10 * n_routes)
+                with self.benchmark(f'action_confirm.{size}'):
+                    orders.action_confirm()
+                self.assertTrue(all(seat.state == 'sold' for seat in orders.order_line.seat_id))
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/tests/test_conditional_get.py
+
+from unittest.mock import patch
+
+from odoo.modules.registry import Registry
+from odoo.tests import tagged
+
+from .common import BusTicketApiCase
+
+
+@tagged('post_install', '-at_install')
+class TestConditionalGet(BusTicketApiCase):
+
+    def test_seats_etag(self):
+        trip = self.create_trip()
+        path = f'/api/v1/trip/{trip.id}/seats'
+        response = self.api_get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['seats']), 4)
+        etag = response.headers['ETag']
+        self.assertEqual(etag, f'"trip-{trip.id}-{trip.seat_version}"')
+
+        self.assertEqual(self.api_get(path, **{'If-None-Match': etag}).status_code, 304)
+        trip.seat_ids[0]._claim_seats()
+        response = self.api_get(path, **{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(self.api_get(f'/api/v1/trip/{trip.id + 1000000}/seats').status_code, 404)
+
+    def test_seat_layout_changes_bump_seat_version(self):
+        trip = self.create_trip()
+        for vals in ({'number': 9}, {'pos_x': 3}, {'pos_y': 5}):
+            seat_version = trip.seat_version
+            trip.seat_ids[0].write(vals)
+            self.assertGreater(trip.seat_version, seat_version, vals)
+        self.assertEqual((trip.available_seats_count, trip.sold_seats_count), (4, 0))
+
+    def test_cities_etag(self):
+        response = self.url_open('/api/v1/cities')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue({"Praha", "Brno", "Olomouc", "Ostrava"} <= set(response.json()['cities']))
+        self.assertIn('s-maxage', response.headers['Cache-Control'])
+        etag = response.headers['ETag']
+        self.assertEqual(self.url_open('/api/v1/cities', headers={'If-None-Match': etag}).status_code, 304)
+
+        self.env['bus.ticket.stop'].create({'name': "Zlín, Autobusové nádraží"})
+        response = self.url_open('/api/v1/cities', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Zlín", response.json()['cities'])
+
+    def test_stop_version_does_not_clear_caches(self):
+        Stop = self.env['bus.ticket.stop']
+        version = int(Stop._get_stop_version())
+        with patch.object(Registry, 'clear_cache') as clear_cache:
+            stop = Stop.create({'name': "Zlín, Autobusové nádraží"})
+            stop.name = "Zlín, Zámečnická"
+            stop.unlink()
+        clear_cache.assert_not_called()
+        self.assertGreater(int(Stop._get_stop_version()), version)
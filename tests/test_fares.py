@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/tests/test_fares.py
+
+from odoo.tests import tagged
+
+from .common import BusTicketCase
+
+
+@tagged('post_install', '-at_install')
+class TestCityPairs(BusTicketCase):
+
+    def _pair(self, from_city, to_city):
+        return self.env['bus.ticket.city.pair']._lookup(from_city, to_city).filtered(lambda pair: pair.route_id == self.route)
+
+    def test_lookup_by_normalized_city(self):
+        pair = self._pair("  PRAHA ", "ostrava")
+        self.assertEqual((pair.stop_from_id, pair.stop_to_id, pair.price), (self.stop_praha, self.stop_ostrava, 450.0))
+        self.assertEqual(self._pair("Brno", "Olomouc").price, 100.0)
+        self.assertFalse(self._pair("Ostrava", "Praha"))
+
+    def test_fare_change_updates_prices_in_place(self):
+        pairs = self.env['bus.ticket.city.pair'].search([('route_id', '=', self.route.id)])
+        self.assertEqual(len(pairs), 6)
+        self.route.stop_line_ids.filtered(lambda line: line.stop_id == self.stop_ostrava).fare_offset = 500.0
+        self.assertEqual(self.env['bus.ticket.city.pair'].search([('route_id', '=', self.route.id)]), pairs)
+        self.assertEqual(self._pair("Praha", "Ostrava").price, 500.0)
+        self.assertEqual(self._pair("Olomouc", "Ostrava").price, 200.0)
+
+    def test_price_override_updates_index(self):
+        price = self.env['bus.ticket.price'].create({
+            'route_id': self.route.id, 'stop_from_id': self.stop_praha.id, 'stop_to_id': self.stop_brno.id, 'price': 180.0,
+        })
+        self.assertEqual(self._pair("Praha", "Brno").price, 180.0)
+        price.unlink()
+        self.assertEqual(self._pair("Praha", "Brno").price, 200.0)
+
+    def test_stop_changes_rebuild_pairs(self):
+        stop_zlin = self.env['bus.ticket.stop'].create({'name': "Zlín, Autobusové nádraží"})
+        self.env['bus.ticket.way.point'].create({
+            'route_id': self.route.id, 'stop_id': stop_zlin.id, 'sequence': 50, 'offset_time': 6.0, 'fare_offset': 520.0,
+        })
+        self.assertEqual(self._pair("Praha", "Zlín").price, 520.0)
+        self.stop_ostrava.name = "Havířov, Autobusové nádraží"
+        self.assertFalse(self._pair("Praha", "Ostrava"))
+        self.assertEqual(self._pair("Brno", "Havířov").price, 250.0)
+
+
+@tagged('post_install', '-at_install')
+class TestFareTable(BusTicketCase):
+
+    def _add_way_point(self, stop_name, sequence, **vals):
+        stop = self.env['bus.ticket.stop'].create({'name': stop_name})
+        way_point = self.env['bus.ticket.way.point'].create(dict({'route_id': self.route.id, 'stop_id': stop.id, 'sequence': sequence}, **vals))
+        return stop, way_point
+
+    def test_lookup_from_cumulative_fares(self):
+        fare = self.route._get_fare
+        self.assertEqual(fare(self.stop_praha.id, self.stop_ostrava.id), 450.0)
+        self.assertEqual(fare(self.stop_brno.id, self.stop_olomouc.id), 100.0)
+        self.assertIsNone(fare(self.stop_ostrava.id, self.stop_brno.id))
+        self.assertIsNone(fare(self.stop_praha.id, self.stop_praha.id))
+
+    def test_override_takes_precedence(self):
+        self.env['bus.ticket.price'].create({
+            'route_id': self.route.id, 'stop_from_id': self.stop_brno.id, 'stop_to_id': self.stop_ostrava.id, 'price': 199.0,
+        })
+        self.assertEqual(self.route._get_fare(self.stop_brno.id, self.stop_ostrava.id), 199.0)
+        self.assertEqual(self.route._get_fare(self.stop_praha.id, self.stop_ostrava.id), 450.0)
+
+    def test_inserted_stop_without_fare_keeps_prices_positive(self):
+        stop_jihlava, way_point = self._add_way_point("Jihlava, Autobusové nádraží", 15)
+        self.assertEqual(way_point.fare_offset, 0.0)
+        stop_prostejov, way_point = self._add_way_point("Prostějov, Autobusové nádraží", 25)
+        self.assertEqual(way_point.fare_offset, 200.0)
+        fare = self.route._get_fare
+        self.assertEqual(fare(self.stop_praha.id, stop_prostejov.id), 200.0)
+        self.assertEqual(fare(stop_prostejov.id, self.stop_olomouc.id), 100.0)
+        # Úseky k zastávkám bez vlastního jízdného nejsou oceněné, ceny dalších úseků se nemění
+        self.assertIsNone(fare(self.stop_praha.id, stop_jihlava.id))
+        self.assertIsNone(fare(self.stop_brno.id, stop_prostejov.id))
+        self.assertEqual(fare(stop_jihlava.id, self.stop_brno.id), 200.0)
+        self.assertEqual(fare(self.stop_praha.id, self.stop_ostrava.id), 450.0)
+
+    def test_appended_stop_without_fare(self):
+        stop_zlin, way_point = self._add_way_point("Zlín, Autobusové nádraží", 50)
+        self.assertEqual(way_point.fare_offset, 450.0)
+        self.assertIsNone(self.route._get_fare(self.stop_ostrava.id, stop_zlin.id))
+        # Neoceněný úsek zůstává ve vyhledávání, cenu mu dá až _quote_route_fares
+        self.assertEqual(self.env['bus.ticket.city.pair']._lookup("Ostrava", "Zlín").price, 0.0)
+        way_point.fare_offset = 520.0
+        self.assertEqual(self.route._get_fare(self.stop_ostrava.id, stop_zlin.id), 70.0)
+        self.assertEqual(self.env['bus.ticket.city.pair']._lookup("Ostrava", "Zlín").price, 70.0)
+
+    def test_explicit_fares_are_kept(self):
+        _stop, way_point = self._add_way_point("Zlín, Autobusové nádraží", 50, fare_offset=600.0)
+        self.assertEqual(way_point.fare_offset, 600.0)
+        route = self.env['bus.ticket.route'].create({
+            'name': "Brno - Olomouc",
+            'stop_line_ids': [(0, 0, {'stop_id': self.stop_brno.id, 'sequence': 10}),
+                              (0, 0, {'stop_id': self.stop_olomouc.id, 'sequence': 20, 'fare_offset': 120.0}),
+                              (0, 0, {'stop_id': self.stop_ostrava.id, 'sequence': 30})],
+        })
+        self.assertEqual(route.stop_line_ids.sorted('sequence').mapped('fare_offset'), [0.0, 120.0, 120.0])
+
+    def test_non_positive_differences_are_unpriced(self):
+        self.route.stop_line_ids.filtered(lambda line: line.stop_id == self.stop_olomouc).fare_offset = 150.0
+        self.assertIsNone(self.route._get_fare(self.stop_brno.id, self.stop_olomouc.id))
+        self.assertEqual(self.route._get_fare(self.stop_olomouc.id, self.stop_ostrava.id), 300.0)
+        self.assertEqual(self.env['bus.ticket.city.pair']._lookup("Brno", "Olomouc").price, 0.0)
+
+    def test_generate_pricing_keeps_overrides_of_unpriced_segments(self):
+        stop_zlin, _way_point = self._add_way_point("Zlín, Autobusové nádraží", 50)
+        Price = self.env['bus.ticket.price']
+        kept = Price.create({'route_id': self.route.id, 'stop_from_id': self.stop_ostrava.id, 'stop_to_id': stop_zlin.id, 'price': 80.0})
+        Price.create([
+            {'route_id': self.route.id, 'stop_from_id': self.stop_praha.id, 'stop_to_id': self.stop_brno.id, 'price': 200.0},
+            {'route_id': self.route.id, 'stop_from_id': self.stop_ostrava.id, 'stop_to_id': self.stop_praha.id, 'price': 90.0},
+        ])
+        self.route.generate_pricing()
+        self.assertEqual(self.route.price_ids, kept)
+        self.assertEqual(self.env['bus.ticket.city.pair']._lookup("Ostrava", "Zlín").price, 80.0)
+
+
+@tagged('post_install', '-at_install')
+class TestFareQuotes(BusTicketCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.product.list_price = 123.0
+
+    def test_quotes_for_segments_and_whole_route(self):
+        trip = self.create_trip()
+        currency = self.route.company_id.currency_id.name
+        quotes = self.env['bus.ticket.route']._quote_fares([
+            (trip.id, self.stop_praha.id, self.stop_brno.id, 2),
+            (trip.id, None, None, 1),
+            (trip.id, self.stop_ostrava.id, self.stop_praha.id, 1),
+        ])
+        self.assertEqual(quotes, [
+            {'unit_price': 200.0, 'total': 400.0, 'currency': currency},
+            {'unit_price': 450.0, 'total': 450.0, 'currency': currency},
+            None,
+        ])
+
+    def test_quotes_do_not_query_per_item(self):
+        trips = self.create_trip(days=1) | self.create_trip(days=2)
+        Route = self.env['bus.ticket.route']
+
+        def count_queries(items):
+            self.env.invalidate_all()
+            queries_before = self.env.cr.sql_log_count
+            Route._quote_fares(items)
+            return self.env.cr.sql_log_count - queries_before
+
+        items = [(trip.id, self.stop_praha.id, self.stop_brno.id, 1) for trip in trips]
+        self.assertEqual(count_queries(items), count_queries(items * 250))
+
+    def test_unpriced_segment_falls_back_to_product_price(self):
+        route = self.env['bus.ticket.route'].create({
+            'name': "Brno - Olomouc",
+            'stop_line_ids': [(0, 0, {'stop_id': self.stop_brno.id, 'sequence': 10}),
+                              (0, 0, {'stop_id': self.stop_olomouc.id, 'sequence': 20})],
+        })
+        trip = self.create_trip(route_id=route.id)
+        quote = self.env['bus.ticket.route']._quote_fares([(trip.id, self.stop_brno.id, self.stop_olomouc.id, 2)])[0]
+        self.assertEqual((quote['unit_price'], quote['total']), (123.0, 246.0))
+        self.assertIsNone(self.env['bus.ticket.route']._quote_fares([(trip.id, self.stop_olomouc.id, self.stop_brno.id, 1)])[0])
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/tests/test_journeys.py
+
+from datetime import datetime
+
+from odoo.tests import TransactionCase, tagged
+
+from ..tools.journey_planner import ConnectionIndex, from_seconds, to_seconds
+from ..tools.search_cache import get_connection_index_cache, get_search_cache
+from .common import BusTicketApiCase, BusTicketCase
+
+
+@tagged('post_install', '-at_install')
+class TestConnectionIndex(TransactionCase):
+
+    def _ts(self, hour, minute=0):
+        return to_seconds(datetime(2026, 5, 4, hour, minute))
+
+    def setUp(self):
+        super().setUp()
+        # Zastávky 1 -> 2 -> 3: spoj 'a' s přestupem na 'b' ve 2, nebo přímý pomalejší spoj 'direct'
+        self.index = ConnectionIndex([
+            (self._ts(8), self._ts(9), 1, 2, 'a'),
+            (self._ts(9, 10), self._ts(10), 2, 3, 'b'),
+            (self._ts(8), self._ts(9, 30), 1, 2, 'direct'),
+            (self._ts(9, 30), self._ts(11), 2, 3, 'direct'),
+        ])
+
+    def test_transfer_respects_minimum_connection_time(self):
+        journeys = self.index.earliest_arrivals({1}, {3}, self._ts(7), min_connection_time=5 * 60)
+        self.assertEqual(journeys, [
+            [('direct', 1, 3, self._ts(8), self._ts(11))],
+            [('a', 1, 2, self._ts(8), self._ts(9)), ('b', 2, 3, self._ts(9, 10), self._ts(10))],
+        ])
+        journeys = self.index.earliest_arrivals({1}, {3}, self._ts(7), min_connection_time=15 * 60)
+        self.assertEqual([[leg[0] for leg in journey] for journey in journeys], [['direct']])
+        self.assertEqual(self.index.earliest_arrivals({1}, {3}, self._ts(7), max_legs=1), journeys)
+
+    def test_plan_stays_in_departure_window(self):
+        self.assertEqual(len(self.index.plan({1}, {3}, self._ts(7), self._ts(12), min_connection_time=0)), 2)
+        self.assertFalse(self.index.plan({1}, {3}, self._ts(8, 1), self._ts(12)))
+        self.assertEqual(from_seconds(self._ts(9, 10)), datetime(2026, 5, 4, 9, 10))
+
+
+@tagged('post_install', '-at_install')
+class TestConnectionIndexCache(BusTicketCase):
+
+    def setUp(self):
+        super().setUp()
+        get_connection_index_cache(self.env.cr.dbname).clear()
+        self.departure_date = self.departure(3).date()
+        self.stop_zlin = self.env['bus.ticket.stop'].create({'name': "Zlín, Autobusové nádraží"})
+
+    def _index(self):
+        return self.env['bus.ticket.trip']._get_connection_index(self.departure_date)
+
+    def _create_route(self):
+        return self.env['bus.ticket.route'].create({
+            'name': "Ostrava - Zlín",
+            'stop_line_ids': [(0, 0, {'stop_id': self.stop_ostrava.id, 'sequence': 10, 'offset_time': 0.0}),
+                              (0, 0, {'stop_id': self.stop_zlin.id, 'sequence': 20, 'offset_time': 1.0, 'fare_offset': 100.0})],
+        })
+
+    def test_index_is_cached_outside_search_stats(self):
+        index_cache = get_connection_index_cache(self.env.cr.dbname)
+        search_stats = get_search_cache(self.env.cr.dbname).stats()
+        hits, misses = index_cache.hits, index_cache.misses
+        index = self._index()
+        self.assertIs(self._index(), index)
+        self.assertEqual((index_cache.hits - hits, index_cache.misses - misses), (1, 1))
+        self.assertEqual(get_search_cache(self.env.cr.dbname).stats(), search_stats)
+
+    def test_trip_on_route_without_departures_drops_index(self):
+        route = self._create_route()
+        index = self._index()
+        self.assertNotIn(route.id, {trip['route_id'] for trip in index.trips.values()})
+        trip = self.create_trip(route_id=route.id, hour=14)
+        index = self._index()
+        self.assertIn(('t', trip.id), index.trips)
+        self.assertIn(self.stop_zlin.id, index.stops_by_city['zlin'])
+
+        # Prodej sedadel jízdní řád nemění, index zůstává
+        trip.seat_ids[0]._claim_seats()
+        self.assertIs(self._index(), index)
+        trip.unlink()
+        self.assertNotIn(('t', trip.id), self._index().trips)
+
+
+@tagged('post_install', '-at_install')
+class TestJourneyApi(BusTicketApiCase):
+
+    def setUp(self):
+        super().setUp()
+        get_connection_index_cache(self.env.cr.dbname).clear()
+        stop_zlin = self.env['bus.ticket.stop'].create({'name': "Zlín, Autobusové nádraží"})
+        self.route_zlin = self.env['bus.ticket.route'].create({
+            'name': "Ostrava - Zlín",
+            'stop_line_ids': [(0, 0, {'stop_id': self.stop_ostrava.id, 'sequence': 10, 'offset_time': 0.0}),
+                              (0, 0, {'stop_id': stop_zlin.id, 'sequence': 20, 'offset_time': 1.0, 'fare_offset': 100.0})],
+        })
+
+    def _search(self, **params):
+        return self.api_json('/api/v1/journeys/search', dict({
+            'from_city': "Praha", 'to_city': "Zlín", 'departure_date': self.departure(3).strftime('%Y-%m-%d'),
+        }, **params))
+
+    def test_journey_with_transfer(self):
+        # Šablona jede z Prahy v 8:00 a do Ostravy přijede ve 13:00
+        self.assertEqual(self._search(), {'journeys': []})
+        trip = self.create_trip(route_id=self.route_zlin.id, hour=14)
+        journeys = self._search(passengers=2)['journeys']
+        self.assertEqual(len(journeys), 1)
+        journey = journeys[0]
+        self.assertEqual((journey['transfers'], journey['duration_minutes'], journey['total_price']), (1, 7 * 60, 1100.0))
+        first_leg, second_leg = journey['legs']
+        self.assertEqual(first_leg['ref'], self.template._get_departure_ref(self.departure(3)))
+        self.assertEqual((first_leg['from_stop_id'], first_leg['to_stop_id']), (self.stop_praha.id, self.stop_ostrava.id))
+        self.assertEqual(second_leg['trip_id'], trip.id)
+        self.assertEqual(second_leg['arrival_time'], (self.departure(3, hour=15)).strftime('%Y-%m-%d %H:%M:%S'))
+
+    def test_invalid_parameters(self):
+        for params in ({'limit': 'abc'}, {'max_transfers': 'one'}, {'passengers': 'two'}, {'departure_date': '2026-13-40'}):
+            self.assertEqual(self._search(**params)['error']['code'], 400, params)
+
+    def test_passengers_and_limit_are_clamped(self):
+        self.create_trip(route_id=self.route_zlin.id, hour=14)
+        for passengers in (0, -3):
+            journeys = self._search(passengers=passengers, limit=-1)['journeys']
+            self.assertEqual(len(journeys), 1)
+            self.assertEqual(journeys[0]['total_price'], 550.0)
+
+    def test_transfer_too_short_is_skipped(self):
+        self.create_trip(route_id=self.route_zlin.id, hour=13)
+        self.assertEqual(self._search(), {'journeys': []})
+        self.assertEqual(self._search(to_city="Ostrava")['journeys'][0]['transfers'], 0)
+        self.assertEqual(self._search(departure_date=None)['error']['code'], 400)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/tests/test_metrics.py
+
+import time
+from unittest.mock import patch
+
+from odoo.tests import TransactionCase, tagged
+
+from ..tools import metrics
+from .common import BusTicketApiCase
+
+
+@tagged('post_install', '-at_install')
+class TestMetrics(TransactionCase):
+
+    def setUp(self):
+        super().setUp()
+        self.registry_patch = patch.object(metrics, 'registry', metrics.MetricsRegistry())
+        self.registry = self.registry_patch.start()
+        self.addCleanup(self.registry_patch.stop)
+
+    def test_render_prometheus(self):
+        self.registry.increment('bus_ticket_orders_total', 2, "Orders.", endpoint='order "create"')
+        self.registry.increment('bus_ticket_orders_total', 1, endpoint='order "create"')
+        for value in (1, 3, 3, 700):
+            self.registry.observe('bus_ticket_queries', value, (2, 5), "Queries.", job='demo')
+        self.assertEqual(self.registry.render_prometheus(), "\n".join([
+            "# HELP bus_ticket_orders_total Orders.",
+            "# TYPE bus_ticket_orders_total counter",
+            'bus_ticket_orders_total{endpoint="order \\"create\\""} 3',
+            "# HELP bus_ticket_queries Queries.",
+            "# TYPE bus_ticket_queries histogram",
+            'bus_ticket_queries_bucket{job="demo",le="2"} 1',
+            'bus_ticket_queries_bucket{job="demo",le="5"} 3',
+            'bus_ticket_queries_bucket{job="demo",le="+Inf"} 4',
+            'bus_ticket_queries_sum{job="demo"} 707',
+            'bus_ticket_queries_count{job="demo"} 4',
+        ]) + "\n")
+
+    def test_trace_records_stages_and_counters(self):
+        with metrics.traced('job', 'demo', self.env) as trace:
+            self.env.cr.execute("SELECT 1")
+            metrics.checkpoint('load')
+            with metrics.stage('save'):
+                self.env.cr.execute("SELECT 2")
+                self.env.cr.execute("SELECT 3")
+            metrics.increment('bus_ticket_demo_total', 5)
+            # Vnořené měření se započítá jako fáze vnějšího
+            with metrics.traced('job', 'nested', self.env) as nested:
+                self.assertIs(nested, trace)
+        self.assertIsNone(metrics.current_trace())
+        self.assertEqual([(name, queries) for name, _duration, queries in trace.stages], [('load', 1), ('save', 2), ('nested', 0)])
+
+        output = self.registry.render_prometheus()
+        self.assertIn('bus_ticket_demo_total{job="demo"} 5', output)
+        self.assertIn('bus_ticket_job_duration_seconds_count{job="demo",status="ok"} 1', output)
+        self.assertIn('bus_ticket_job_queries_sum{job="demo"} 3', output)
+        self.assertIn('bus_ticket_stage_queries_sum{job="demo",stage="save"} 2', output)
+        self.assertNotIn('job="nested"', output)
+        # Mimo měření se fáze ignorují a čítače nemají štítek operace
+        metrics.checkpoint('ignored')
+        metrics.increment('bus_ticket_demo_total')
+        self.assertIn('bus_ticket_demo_total 1', self.registry.render_prometheus())
+
+    def test_failed_and_slow_operations(self):
+        with self.assertRaises(ZeroDivisionError), metrics.traced('job', 'broken', self.env):
+            1 / 0
+        self.assertIn('bus_ticket_job_duration_seconds_count{job="broken",status="error"} 1', self.registry.render_prometheus())
+
+        self.env['ir.config_parameter'].sudo().set_param(metrics.SLOW_REQUEST_PARAM, 1)
+        with self.assertLogs(metrics.__name__, 'WARNING') as logs, metrics.traced('job', 'slow', self.env):
+            time.sleep(0.005)
+            metrics.checkpoint('sleep')
+        self.assertIn("Slow job slow", logs.output[0])
+        self.assertIn("sleep", logs.output[0])
+
+    def test_instrumented_cron(self):
+        self.env['bus.ticket.trip']._cron_rollover_display_group()
+        self.assertIn('bus_ticket_job_duration_seconds_count{job="rollover_display_group",status="ok"} 1',
+                      self.registry.render_prometheus())
+
+
+@tagged('post_install', '-at_install')
+class TestMetricsApi(BusTicketApiCase):
+
+    def setUp(self):
+        super().setUp()
+        self.registry_patch = patch.object(metrics, 'registry', metrics.MetricsRegistry())
+        self.registry = self.registry_patch.start()
+        self.addCleanup(self.registry_patch.stop)
+
+    def test_requests_are_labelled_with_status(self):
+        self.assertEqual(self.api_json('/api/v1/journeys/search', {})['error']['code'], 400)
+        response = self.api_get('/api/v1/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('bus_ticket_request_duration_seconds_count{request="journeys_search",status="400"} 1', response.text)
+        self.assertIn('bus_ticket_stage_queries_count{request="journeys_search",stage="auth"} 1', response.text)
+
+        self.api_key_name = 'unknown'
+        self.assertEqual(self.api_get('/api/v1/metrics').status_code, 401)
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/tests/test_orders.py
+
+from datetime import timedelta
+
+from odoo import fields
+from odoo.tests import tagged
+
+from .common import BusTicketApiCase, BusTicketCase
+
+
+@tagged('post_install', '-at_install')
+class TestSeatHolds(BusTicketCase):
+
+    def test_expired_holds_are_released(self):
+        trip = self.create_trip()
+        now = fields.Datetime.now()
+        expired = self.create_ticket_order(trip.seat_ids[0], hold_expires_at=now - timedelta(minutes=1))
+        active = self.create_ticket_order(trip.seat_ids[1], hold_expires_at=now + timedelta(minutes=10))
+        self.env['sale.order.line']._cron_release_expired_holds()
+
+        self.assertEqual(expired.state, 'cancel')
+        self.assertFalse(expired.order_line.seat_id)
+        self.assertFalse(expired.order_line.hold_expires_at)
+        self.assertEqual((trip.seat_ids[0].state, trip.seat_ids[0].leg_mask), ('available', 0))
+        self.assertEqual(active.state, 'draft')
+        self.assertEqual(trip.seat_ids[1].state, 'reserved')
+        self.assertEqual((trip.available_seats_count, trip.sold_seats_count), (3, 1))
+
+    def test_expired_partial_hold_keeps_other_legs(self):
+        trip = self.create_trip()
+        seat = trip.seat_ids[0]
+        now = fields.Datetime.now()
+        self.create_ticket_order(seat, self.stop_praha, self.stop_brno, hold_expires_at=now - timedelta(minutes=1))
+        kept = self.create_ticket_order(seat, self.stop_brno, self.stop_ostrava, hold_expires_at=now + timedelta(minutes=10))
+        self.env['sale.order.line']._cron_release_expired_holds()
+        self.assertEqual((seat.state, seat.leg_mask), ('reserved', 0b110))
+        self.assertEqual(kept.order_line.seat_id, seat)
+
+    def test_confirmed_orders_keep_their_seats(self):
+        trip = self.create_trip()
+        order = self.create_ticket_order(trip.seat_ids[0], hold_expires_at=fields.Datetime.now() + timedelta(minutes=10))
+        order.action_confirm()
+        self.assertFalse(order.order_line.hold_expires_at)
+        order.order_line.hold_expires_at = fields.Datetime.now() - timedelta(minutes=1)
+        self.env['sale.order.line']._cron_release_expired_holds()
+        self.assertEqual(order.state, 'sale')
+        self.assertEqual(trip.seat_ids[0].state, 'sold')
+
+    def test_hold_expiry_parameter(self):
+        self.env['ir.config_parameter'].sudo().set_param('bus_ticket_core.seat_hold_minutes', 30)
+        expiry = self.env['sale.order.line']._get_seat_hold_expiry()
+        self.assertAlmostEqual(expiry, fields.Datetime.now() + timedelta(minutes=30), delta=timedelta(seconds=5))
+
+
+@tagged('post_install', '-at_install')
+class TestOrderApi(BusTicketApiCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.product.list_price = 123.0
+        cls.customer_info = {'name': "Jana Nováková", 'email': "jana@bus-ticket.example.com", 'phone': "+420 777 000 111"}
+
+    def _create_order(self, trip, seats, stop_from=None, stop_to=None, **data):
+        response = self.api_post('/api/v1/order/create', dict({
+            'trip_id': trip.id, 'seat_ids': seats.ids, 'customer_info': self.customer_info,
+            'from_stop_id': stop_from and stop_from.id, 'to_stop_id': stop_to and stop_to.id,
+        }, **data))
+        return response.status_code, response.json()
+
+    def test_order_is_priced_by_segment(self):
+        trip = self.create_trip()
+        status, result = self._create_order(trip, trip.seat_ids[:2], self.stop_brno, self.stop_ostrava)
+        self.assertEqual(status, 200)
+        order = self.env['sale.order'].browse(result['order']['id'])
+        self.assertEqual(order.order_line.mapped('price_unit'), [250.0, 250.0])
+        self.assertEqual(order.order_line.mapped('leg_mask'), [0b110, 0b110])
+        self.assertEqual(result['reserved_seat_ids'], trip.seat_ids[:2].ids)
+
+    def test_unpriced_route_uses_product_price(self):
+        route = self.env['bus.ticket.route'].create({
+            'name': "Brno - Olomouc",
+            'stop_line_ids': [(0, 0, {'stop_id': self.stop_brno.id, 'sequence': 10}),
+                              (0, 0, {'stop_id': self.stop_olomouc.id, 'sequence': 20})],
+        })
+        trip = self.create_trip(route_id=route.id)
+        status, result = self._create_order(trip, trip.seat_ids[:1])
+        self.assertEqual(status, 200)
+        self.assertEqual(self.env['sale.order'].browse(result['order']['id']).order_line.price_unit, 123.0)
+
+    def test_serialization_failure_is_retried(self):
+        trip = self.create_trip()
+        with self.serialization_failure_once('bus.ticket.trip.seat', '_claim_seat_masks') as calls:
+            status, result = self._create_order(trip, trip.seat_ids[:2])
+        # Chyba neskončí jako 500, Odoo požadavek zopakuje a sedadla zabere napodruhé
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(status, 200)
+        self.assertEqual(result['reserved_seat_ids'], trip.seat_ids[:2].ids)
+        self.assertEqual(trip.sold_seats_count, 2)
+        self.assertEqual(len(self.env['sale.order'].browse(result['order']['id']).order_line), 2)
+
+    def test_order_for_unserved_segment_is_rejected(self):
+        trip = self.create_trip()
+        status, _result = self._create_order(trip, trip.seat_ids[:1], self.stop_ostrava, self.stop_praha)
+        self.assertEqual(status, 400)
+        self.assertEqual(trip.sold_seats_count, 0)
+
+
+@tagged('post_install', '-at_install')
+class TestBulkConfirmation(BusTicketApiCase):
+
+    def _ticket_orders(self):
+        trips = self.create_trip(days=1) | self.create_trip(days=2)
+        now = fields.Datetime.now()
+        return trips, (
+            self.create_ticket_order(trips[0].seat_ids[:2], hold_expires_at=now + timedelta(minutes=10))
+            | self.create_ticket_order(trips[0].seat_ids[2], self.stop_praha, self.stop_brno, hold_expires_at=now + timedelta(minutes=10))
+            | self.create_ticket_order(trips[1].seat_ids[0], hold_expires_at=now + timedelta(minutes=10))
+        )
+
+    def test_bulk_confirmation_sells_seats(self):
+        trips, orders = self._ticket_orders()
+        confirmed = self.env['sale.order']._bus_ticket_confirm_orders(orders.ids + [orders[-1].id + 1000000], batch_size=2)
+        self.assertEqual(confirmed, orders)
+        self.assertEqual(set(orders.mapped('state')), {'sale'})
+        self.assertEqual(set(orders.order_line.seat_id.mapped('state')), {'sold'})
+        self.assertFalse(any(orders.order_line.mapped('hold_expires_at')))
+        self.assertEqual(orders[1].order_line.seat_id.leg_mask, 0b001)
+        self.assertEqual([(trip.available_seats_count, trip.sold_seats_count) for trip in trips], [(1, 3), (3, 1)])
+        # Opakované oznámení už nic nepotvrzuje
+        self.assertFalse(self.env['sale.order']._bus_ticket_confirm_orders(orders.ids))
+
+    def _api_ticket_orders(self):
+        """Objednávky jízdenek vytvořené přes API, tj. uživatelem API klíče (jen ty smí webhook potvrdit)."""
+        trips = self.create_trip(days=1) | self.create_trip(days=2)
+        orders = self.env['sale.order']
+        for seats in (trips[0].seat_ids[:2], trips[0].seat_ids[2], trips[1].seat_ids[0]):
+            response = self.api_post('/api/v1/order/create', {
+                'trip_id': seats.trip_id.id, 'seat_ids': seats.ids,
+                'customer_info': {'name': "Jana Nováková", 'email': "jana@bus-ticket.example.com"},
+            })
+            orders |= orders.browse(response.json()['order']['id'])
+        return trips, orders
+
+    def test_payment_webhook(self):
+        _trips, orders = self._api_ticket_orders()
+        response = self.api_post('/api/v1/payment/confirm', {'order_ids': orders[:2].ids})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'confirmed_order_ids': orders[:2].ids, 'skipped_order_ids': []})
+        self.assertEqual(orders.mapped('state'), ['sale', 'sale', 'draft'])
+
+        response = self.api_post('/api/v1/payment/confirm', {'order_ids': orders.ids})
+        self.assertEqual(response.json(), {'confirmed_order_ids': orders[2:].ids, 'skipped_order_ids': orders[:2].ids})
+
+    def test_payment_webhook_confirms_only_own_ticket_orders(self):
+        trips, orders = self._api_ticket_orders()
+        foreign = self.create_ticket_order(trips[1].seat_ids[1])
+        plain = self.env['sale.order'].with_user(self.api_user).create({'partner_id': self.partner.id})
+        response = self.api_post('/api/v1/payment/confirm', {'order_ids': [orders[0].id, foreign.id, plain.id]})
+        self.assertEqual(response.json(), {'confirmed_order_ids': orders[:1].ids, 'skipped_order_ids': sorted([foreign.id, plain.id])})
+        self.assertEqual((foreign.state, plain.state), ('draft', 'draft'))
+        self.assertEqual(trips[1].seat_ids[1].state, 'reserved')
+
+    def test_payment_webhook_retries_serialization_failure(self):
+        trips, orders = self._api_ticket_orders()
+        with self.serialization_failure_once('sale.order.line', '_sell_ticket_seats') as calls:
+            response = self.api_post('/api/v1/payment/confirm', {'order_ids': orders.ids})
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['confirmed_order_ids'], orders.ids)
+        self.assertEqual(set(orders.order_line.seat_id.mapped('state')), {'sold'})
+        self.assertEqual([trip.sold_seats_count for trip in trips], [3, 1])
+
+    def test_payment_webhook_validation(self):
+        for data in ({}, {'order_ids': []}, {'order_ids': ['1']}, {'order_ids': 5}):
+            self.assertEqual(self.api_post('/api/v1/payment/confirm', data).status_code, 400, data)
+        self.api_key_name = 'unknown'
+        self.assertEqual(self.api_post('/api/v1/payment/confirm', {'order_ids': [1]}).status_code, 401)
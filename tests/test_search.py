@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/tests/test_search.py
+
+import base64
+from datetime import date, timedelta
+from unittest.mock import patch
+
+from odoo.tests import tagged
+
+from ..controllers.main_api import _encode_cursor
+from ..tools.search_cache import get_search_cache
+from .common import BusTicketApiCase
+
+
+@tagged('post_install', '-at_install')
+class TestTripSearch(BusTicketApiCase):
+
+    def setUp(self):
+        super().setUp()
+        get_search_cache(self.env.cr.dbname).clear()
+        self.target_date = date.today() + timedelta(days=3)
+        # Okno hledání je den před až dva dny po datu: šablona v něm má 4 odjezdy, k nim jeden spoj navíc
+        self.trip = self.create_trip(days=3, hour=10)
+
+    def _search(self, **params):
+        return self.api_json('/api/v1/trips/search', dict({
+            'from_city': "Brno", 'to_city': "Ostrava", 'departure_date': self.target_date.strftime('%Y-%m-%d'),
+        }, **params))
+
+    def test_search_merges_trips_and_virtual_departures(self):
+        result = self._search(passengers=2)
+        trips = result['trips']
+        self.assertIsNone(result['next_cursor'])
+        self.assertEqual([trip['departure_time'] for trip in trips], sorted(trip['departure_time'] for trip in trips))
+        self.assertEqual(len(trips), 5)
+        self.assertEqual([trip['id'] for trip in trips if not trip.get('virtual')], [self.trip.id])
+        self.assertEqual(len({trip['ref'] for trip in trips if trip.get('virtual')}), 4)
+        for trip in trips:
+            self.assertEqual((trip['from_stop_id'], trip['to_stop_id']), (self.stop_brno.id, self.stop_ostrava.id))
+            self.assertEqual((trip['price']['czk'], trip['price']['total']), (250.0, 500.0))
+        self.assertEqual([trip['is_target_date'] for trip in trips], [False, True, True, False, False])
+
+    def test_boarding_times_at_intermediate_stops(self):
+        trip = next(trip for trip in self._search()['trips'] if trip['id'] == self.trip.id)
+        self.assertEqual(trip['departure_time'], self.trip.departure_time.strftime('%Y-%m-%d %H:%M:%S'))
+        self.assertEqual(trip['boarding_time'], (self.trip.departure_time + timedelta(hours=2.5)).strftime('%Y-%m-%d %H:%M:%S'))
+        self.assertEqual(trip['alighting_time'], (self.trip.departure_time + timedelta(hours=5)).strftime('%Y-%m-%d %H:%M:%S'))
+
+    def test_pagination_walks_all_results(self):
+        everything = self._search()['trips']
+        seen, cursor = [], None
+        while True:
+            result = self._search(limit=2, **({'cursor': cursor} if cursor else {}))
+            self.assertLessEqual(len(result['trips']), 2)
+            seen += result['trips']
+            cursor = result['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual([(trip['id'], trip.get('ref')) for trip in seen], [(trip['id'], trip.get('ref')) for trip in everything])
+
+    def test_only_one_page_of_virtual_departures_is_serialized(self):
+        Template = type(self.env['bus.ticket.trip.template'])
+        with patch.object(Template, '_serialize_virtual_departures', autospec=True,
+                          side_effect=Template._serialize_virtual_departures) as serialize:
+            self._search(limit=1)
+        self.assertEqual(len(serialize.call_args.args[1]), 2)
+
+    def test_invalid_parameters(self):
+        for params in ({'limit': 'abc'}, {'passengers': 'two'}, {'departure_date': '2026-13-40'}, {'cursor': '!!'}, {'departure_date': None}):
+            self.assertEqual(self._search(**params)['error']['code'], 400, params)
+
+    def test_invalid_cursor(self):
+        departure = self.trip.departure_time.strftime('%Y-%m-%d %H:%M:%S')
+        for sort_key in (('2026-13-40 08:00:00', 't1'), ('tomorrow', 't1'), (departure, 'tabc'), (departure, 't'),
+                         (departure, 'v'), (departure, 'x1'), (departure, 't1', 'extra')):
+            self.assertEqual(self._search(cursor=_encode_cursor(sort_key))['error']['code'], 400, sort_key)
+        self.assertEqual(self._search(cursor=base64.urlsafe_b64encode(b'{"a": 1}').decode())['error']['code'], 400)
+        self.assertEqual(self._search(cursor=_encode_cursor((departure, f't{self.trip.id:012d}')))['next_cursor'], None)
+
+    def test_limit_is_clamped(self):
+        for limit in (0, -5):
+            result = self._search(limit=limit)
+            self.assertEqual(len(result['trips']), 1)
+            self.assertTrue(result['next_cursor'])
+
+    def test_unknown_city_pair(self):
+        self.assertEqual(self._search(to_city="Plzeň"), {'trips': [], 'next_cursor': None})
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/tests/test_search_cache.py
+
+from unittest.mock import patch
+
+from odoo.tests import TransactionCase, tagged
+
+from ..tools.search_cache import (
+    INVALIDATION_LOG_TABLE, SearchResultCache, Snapshot, invalidate_search_cache, prune_invalidation_log,
+)
+
+
+@tagged('post_install', '-at_install')
+class TestSearchResultCache(TransactionCase):
+
+    def test_lru_and_ttl(self):
+        cache = SearchResultCache(max_size=2, ttl=60)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        with patch('time.monotonic', return_value=10 ** 9):
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['size'], 1)
+
+    def test_invalidate_by_route_and_trip(self):
+        cache = SearchResultCache()
+        cache.put('a', 1, route_ids=[1], trip_ids=[10])
+        cache.put('b', 2, route_ids=[2], trip_ids=[20])
+        cache.invalidate(trip_ids=[10])
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), 2)
+        cache.invalidate(route_ids=[2])
+        self.assertIsNone(cache.get('b'))
+
+    def test_snapshot_visibility(self):
+        snapshot = Snapshot.parse('100:105:101,103')
+        self.assertEqual(snapshot, Snapshot(100, 105, frozenset({101, 103})))
+        self.assertEqual([snapshot.is_visible(xid) for xid in (99, 101, 102, 105)], [True, False, True, False])
+        self.assertEqual(Snapshot.parse('7:7:'), Snapshot(7, 7, frozenset()))
+
+    def test_other_workers_apply_logged_invalidations(self):
+        other_worker = SearchResultCache()
+        other_worker.sync(self.env.cr)
+        other_worker.put('a', 1, route_ids=[1])
+        other_worker.put('b', 2, route_ids=[2], trip_ids=[7])
+        other_worker.put('c', 3, route_ids=[3])
+        invalidate_search_cache(self.env, route_ids=[1])
+        invalidate_search_cache(self.env, trip_ids=[7])
+        self.env.cr.precommit.run()
+        # Všechna zneplatnění transakce jsou v logu jedním řádkem
+        self.env.cr.execute(f"SELECT route_ids, trip_ids FROM {INVALIDATION_LOG_TABLE} WHERE xid = txid_current()")
+        self.assertEqual(self.env.cr.fetchall(), [([1], [7])])
+
+        other_worker.sync(self.env.cr)
+        self.assertIsNone(other_worker.get('a'))
+        self.assertIsNone(other_worker.get('b'))
+        self.assertEqual(other_worker.get('c'), 3)
+        # Zpracovaný řádek se podruhé nepoužije
+        other_worker.put('a', 1, route_ids=[1])
+        other_worker.sync(self.env.cr)
+        self.assertEqual(other_worker.get('a'), 1)
+
+    def test_results_from_stale_snapshot_are_not_stored(self):
+        cache = SearchResultCache()
+        stale_snapshot = Snapshot(100, 105, frozenset({102}))
+        cache._mark_applied(1, 102, [1], [])
+        cache.put('a', 1, route_ids=[1], snapshot=stale_snapshot)
+        cache.put('b', 2, route_ids=[2], snapshot=stale_snapshot)
+        cache.put('c', 3, route_ids=[1], snapshot=Snapshot(110, 110, frozenset()))
+        self.assertEqual([cache.get(key) for key in 'abc'], [None, 2, 3])
+
+    def test_prune_invalidation_log(self):
+        self.env.cr.execute(f"""
+            INSERT INTO {INVALIDATION_LOG_TABLE} (route_ids, create_date)
+            VALUES ('{{1}}', (now() AT TIME ZONE 'UTC') - interval '1 hour'), ('{{2}}', now() AT TIME ZONE 'UTC')
+        """)
+        prune_invalidation_log(self.env.cr, 600)
+        self.env.cr.execute(f"SELECT route_ids FROM {INVALIDATION_LOG_TABLE} WHERE xid = txid_current()")
+        self.assertEqual(self.env.cr.fetchall(), [([2],)])
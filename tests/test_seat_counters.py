@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/tests/test_seat_counters.py
+
+from odoo.tests import tagged
+
+from .common import BusTicketCase
+
+
+@tagged('post_install', '-at_install')
+class TestSeatCounters(BusTicketCase):
+
+    def _counts(self, trip):
+        return trip.available_seats_count, trip.sold_seats_count
+
+    def test_counters_follow_seat_states(self):
+        trip = self.create_trip()
+        seats = trip.seat_ids
+        seats[:2]._claim_seats()
+        self.assertEqual(self._counts(trip), (2, 2))
+        seats[2].state = 'sold'
+        self.assertEqual(self._counts(trip), (1, 3))
+        seats[2].state = 'available'
+        seats[0].unlink()
+        self.assertEqual(self._counts(trip), (2, 1))
+
+    def test_claim_updates_counters_with_one_statement(self):
+        trips = self.create_trip(days=1) | self.create_trip(days=2)
+        seat_masks = {trip.seat_ids[0].id: 0b111 for trip in trips}
+        versions = trips.mapped('seat_version')
+        self.env['bus.ticket.trip.seat']._claim_seats_with_masks(seat_masks)
+        self.assertEqual([self._counts(trip) for trip in trips], [(3, 1), (3, 1)])
+        self.assertTrue(all(new > old for new, old in zip(trips.mapped('seat_version'), versions)))
+
+    def test_partial_legs_count_the_seat_once(self):
+        trip = self.create_trip()
+        seat = trip.seat_ids[0]
+        seat._claim_seats(self.stop_praha.id, self.stop_brno.id)
+        seat._claim_seats(self.stop_brno.id, self.stop_olomouc.id)
+        self.assertEqual(self._counts(trip), (3, 1))
+
+    def test_recount_fixes_drift(self):
+        trips = self.create_trip(days=1) | self.create_trip(days=2) | self.create_trip(days=3, vehicle_id=False)
+        trips[0].seat_ids[0]._claim_seats()
+        self.env.cr.execute("UPDATE bus_ticket_trip SET available_seats_count = 99, sold_seats_count = 0 WHERE id = %s", [trips[0].id])
+        trips.invalidate_recordset(['available_seats_count', 'sold_seats_count'])
+        self.assertEqual(trips._recount_seats(), [trips[0].id])
+        self.assertEqual([self._counts(trip) for trip in trips], [(3, 1), (4, 0), (0, 0)])
+        self.assertEqual(trips._recount_seats(), [])
+
+    def test_cron_recounts_open_trips(self):
+        trip = self.create_trip()
+        self.env.cr.execute("UPDATE bus_ticket_trip SET available_seats_count = 0 WHERE id = %s", [trip.id])
+        trip.invalidate_recordset(['available_seats_count'])
+        self.env['bus.ticket.trip']._cron_recount_seats()
+        self.assertEqual(self._counts(trip), (4, 0))
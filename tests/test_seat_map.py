@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/tests/test_seat_map.py
+
+from unittest.mock import patch
+
+from odoo.tests import tagged
+
+from .common import BusTicketCase
+
+
+@tagged('post_install', '-at_install')
+class TestSeatMapRendering(BusTicketCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.env['res.lang']._activate_lang('cs_CZ')
+
+    def setUp(self):
+        super().setUp()
+        self.env.registry.clear_cache()
+        IrQweb = type(self.env['ir.qweb'])
+        patcher = patch.object(IrQweb, '_render', autospec=True, side_effect=IrQweb._render)
+        self.render = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _seat_map(self, trip, lang='en_US'):
+        trip = trip.with_context(lang=lang)
+        trip.invalidate_recordset(['seat_map_html'])
+        return trip.seat_map_html
+
+    def test_unchanged_trip_is_rendered_once(self):
+        trip = self.create_trip()
+        html = self._seat_map(trip)
+        self.assertIn('title="Driver"', html)
+        self.assertEqual(self._seat_map(trip), html)
+        self.assertEqual(self.render.call_count, 1)
+
+    def test_seat_change_renders_new_version(self):
+        trip = self.create_trip()
+        self._seat_map(trip)
+        trip.seat_ids[0]._claim_seats()
+        self.assertIn('#ffc107', self._seat_map(trip))
+        self.assertEqual(self.render.call_count, 2)
+
+    def test_languages_are_cached_separately(self):
+        trip = self.create_trip()
+        self._seat_map(trip, 'en_US')
+        self._seat_map(trip, 'cs_CZ')
+        self._seat_map(trip, 'cs_CZ')
+        self.assertEqual(self.render.call_count, 2)
+        self.assertEqual([call.args[0].env.lang for call in self.render.call_args_list], ['en_US', 'cs_CZ'])
+
+    def test_prerendered_map_is_stored(self):
+        trips = self.create_trip(days=0, hour=23) | self.create_trip(days=1)
+        trips.with_context(lang='en_US')._prerender_seat_maps()
+        self.assertEqual(self.render.call_count, 2)
+        self.assertEqual(trips[0].seat_map_cache_key, trips[0].with_context(lang='en_US')._get_seat_map_cache_key())
+        self.env.registry.clear_cache()
+        self.assertEqual(self._seat_map(trips[0]), trips[0].seat_map_cache)
+        self.assertEqual(self.render.call_count, 2)
+        # Uložená mapa je jen pro jazyk, ve kterém vznikla
+        self._seat_map(trips[0], 'cs_CZ')
+        self.assertEqual(self.render.call_count, 3)
+
+    def test_trip_without_seats(self):
+        trip = self.create_trip(vehicle_id=False)
+        self.assertIn("Please generate seats", self._seat_map(trip))
+        self.assertFalse(self.render.called)
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/tests/test_seats.py
+
+from datetime import date, timedelta
+
+from odoo.exceptions import UserError
+from odoo.tests import tagged
+
+from .common import BusTicketCase
+
+
+@tagged('post_install', '-at_install')
+class TestSeatLegs(BusTicketCase):
+
+    def test_trip_with_layout_gets_free_seats(self):
+        trip = self.create_trip()
+        self.assertEqual(trip.seat_ids.mapped('number'), [1, 2, 3, 4])
+        self.assertEqual(set(trip.seat_ids.mapped('leg_mask')), {0})
+        self.assertEqual(set(trip.seat_ids.mapped('state')), {'available'})
+        self.assertEqual((trip.available_seats_count, trip.sold_seats_count), (4, 0))
+
+    def test_generated_trips_get_seats(self):
+        trips = self.template._generate_trips_until(date.today() + timedelta(days=2))
+        self.assertTrue(trips)
+        for trip in trips:
+            self.assertEqual(len(trip.seat_ids), 4)
+            self.assertEqual(set(trip.seat_ids.mapped('leg_mask')), {0})
+
+    def test_segment_masks(self):
+        route = self.route
+        self.assertEqual(route._get_full_leg_mask(), 0b111)
+        self.assertEqual(route._get_segment_mask(self.stop_praha.id, self.stop_brno.id), 0b001)
+        self.assertEqual(route._get_segment_mask(self.stop_brno.id, self.stop_ostrava.id), 0b110)
+        self.assertEqual(route._get_segment_mask(self.stop_olomouc.id), 0b100)
+        self.assertEqual(route._get_segment_mask(self.stop_ostrava.id, self.stop_praha.id), 0)
+
+    def test_disjoint_segments_share_a_seat(self):
+        trip = self.create_trip()
+        seat = trip.seat_ids[0]
+        self.assertEqual(seat._claim_seats(self.stop_praha.id, self.stop_brno.id), seat)
+        self.assertEqual(seat._claim_seats(self.stop_olomouc.id, self.stop_ostrava.id), seat)
+        self.assertFalse(seat._claim_seats(self.stop_brno.id, self.stop_ostrava.id))
+        self.assertEqual((seat.state, seat.leg_mask), ('reserved', 0b101))
+        self.assertEqual(trip._get_free_seat_ids(self.stop_brno.id, self.stop_olomouc.id)[trip.id], trip.seat_ids.ids)
+        self.assertEqual(trip._get_free_seat_ids(self.stop_praha.id, self.stop_ostrava.id)[trip.id], trip.seat_ids[1:].ids)
+
+    def test_cancelling_an_order_frees_only_its_legs(self):
+        trip = self.create_trip()
+        seat = trip.seat_ids[0]
+        first = self.create_ticket_order(seat, self.stop_praha, self.stop_brno)
+        second = self.create_ticket_order(seat, self.stop_olomouc, self.stop_ostrava)
+        first._action_cancel()
+        self.assertEqual((seat.state, seat.leg_mask), ('reserved', 0b100))
+        second._action_cancel()
+        self.assertEqual((seat.state, seat.leg_mask), ('available', 0))
+
+    def test_manual_release_rejected_while_tickets_hold_legs(self):
+        trip = self.create_trip()
+        seat = trip.seat_ids[0]
+        order = self.create_ticket_order(seat, self.stop_praha, self.stop_brno)
+        self.create_ticket_order(seat, self.stop_olomouc, self.stop_ostrava)
+        with self.assertRaises(UserError):
+            seat.state = 'available'
+        self.assertEqual(seat.leg_mask, 0b101)
+        order._action_cancel()
+        with self.assertRaises(UserError):
+            seat.state = 'available'
+
+    def test_manual_state_changes_keep_mask_in_sync(self):
+        trip = self.create_trip()
+        seat = trip.seat_ids[0]
+        seat.state = 'sold'
+        self.assertEqual(seat.leg_mask, 0b111)
+        seat.state = 'available'
+        self.assertEqual(seat.leg_mask, 0)
+        self.assertEqual((trip.available_seats_count, trip.sold_seats_count), (4, 0))
+
+    def test_stops_locked_while_seats_are_occupied(self):
+        trip = self.create_trip()
+        WayPoint = self.env['bus.ticket.way.point']
+        stop_zlin = self.env['bus.ticket.stop'].create({'name': "Zlín, Autobusové nádraží"})
+        way_points = self.route.stop_line_ids.sorted('sequence')
+        # Bez obsazených sedadel lze zastávky měnit volně
+        extra = WayPoint.create({'route_id': self.route.id, 'stop_id': stop_zlin.id, 'sequence': 45, 'fare_offset': 500.0})
+        extra.unlink()
+
+        trip.seat_ids[0]._claim_seats(self.stop_brno.id, self.stop_olomouc.id)
+        with self.assertRaises(UserError):
+            WayPoint.create({'route_id': self.route.id, 'stop_id': stop_zlin.id, 'sequence': 15, 'fare_offset': 100.0})
+        with self.assertRaises(UserError):
+            way_points[1].unlink()
+        with self.assertRaises(UserError):
+            way_points[1].sequence = 35
+        # Časy, ceny a přečíslování se stejným pořadím zastávek úseky neposouvají
+        way_points[1].write({'offset_time': 2.0, 'fare_offset': 210.0})
+        for position, way_point in reversed(list(enumerate(way_points))):
+            way_point.sequence = (position + 1) * 100
+
+        trip.state = 'done'
+        way_points[1].sequence = 350
+        self.assertEqual(self.route._get_stop_ids()[2], self.stop_brno.id)
+
+
+@tagged('post_install', '-at_install')
+class TestSeatGeneration(BusTicketCase):
+
+    def test_layout_seat_template(self):
+        self.assertEqual(self.layout.total_seats, 4)
+        self.assertEqual([seat[0] for seat in self.layout.seat_template], [1, 2, 3, 4])
+        self.layout.layout_line_ids[0].seat_count = 4
+        self.assertEqual(self.layout.total_seats, 6)
+        self.assertEqual(len(self.layout.seat_template), 6)
+
+    def test_regenerate_seats_replaces_seats(self):
+        trip = self.create_trip()
+        old_seats = trip.seat_ids
+        seat_version = trip.seat_version
+        trip.generate_seats()
+        self.assertFalse(old_seats.exists())
+        self.assertEqual(len(trip.seat_ids), 4)
+        self.assertEqual((trip.available_seats_count, trip.sold_seats_count), (4, 0))
+        self.assertGreater(trip.seat_version, seat_version)
+
+    def test_bulk_generation_per_layout(self):
+        big_layout = self.generator.create_seat_layout(rows=3, seats_per_row=3)
+        big_vehicle = self.generator.create_vehicles(big_layout, 1)
+        trips = self.create_trip(days=1) | self.create_trip(days=2, vehicle_id=big_vehicle.id) | self.create_trip(days=3, vehicle_id=False)
+        self.assertEqual([len(trip.seat_ids) for trip in trips], [4, 9, 0])
+        self.assertEqual(trips.mapped('available_seats_count'), [4, 9, 0])
+
+
+@tagged('post_install', '-at_install')
+class TestSeatClaims(BusTicketCase):
+
+    def test_claim_is_all_or_nothing(self):
+        trip = self.create_trip()
+        seats = trip.seat_ids[:2]
+        self.assertEqual(seats[0]._claim_seats(), seats[0])
+        self.assertFalse(seats._claim_seats(allow_partial=False))
+        self.assertEqual((seats[1].state, seats[1].leg_mask), ('available', 0))
+        self.assertEqual(trip.sold_seats_count, 1)
+        self.assertEqual(seats._claim_seats(), seats[1])
+        self.assertEqual((trip.available_seats_count, trip.sold_seats_count), (2, 2))
+
+    def test_claim_rejects_unserved_segment(self):
+        trip = self.create_trip()
+        stop_elsewhere = self.env['bus.ticket.stop'].create({'name': "Plzeň, CAN"})
+        self.assertFalse(trip.seat_ids[:1]._claim_seats(stop_elsewhere.id, self.stop_brno.id))
+        self.assertFalse(trip.seat_ids[:1]._claim_seats(self.stop_ostrava.id, self.stop_praha.id))
+        self.assertEqual(trip.sold_seats_count, 0)
+
+    def test_claim_with_masks_across_trips(self):
+        outbound, inbound = self.create_trip(days=1), self.create_trip(days=2)
+        Seat = self.env['bus.ticket.trip.seat']
+        seat_masks = {outbound.seat_ids[0].id: 0b001, inbound.seat_ids[0].id: 0b110}
+        claimed = Seat._claim_seats_with_masks(seat_masks, allow_partial=False)
+        self.assertEqual(claimed, outbound.seat_ids[0] | inbound.seat_ids[0])
+        self.assertEqual(claimed.mapped('leg_mask'), [0b001, 0b110])
+        # Jedno sedadlo dávky je už obsazené -> nezabere se nic
+        seat_masks = {outbound.seat_ids[0].id: 0b001, outbound.seat_ids[1].id: 0b001}
+        self.assertFalse(Seat._claim_seats_with_masks(seat_masks, allow_partial=False))
+        self.assertEqual(outbound.seat_ids[1].leg_mask, 0)
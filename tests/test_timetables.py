@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/tests/test_timetables.py
+
+from datetime import timedelta
+
+from odoo.tests import tagged
+
+from ..models.route_models import timetable_offset
+from .common import BusTicketCase
+
+
+@tagged('post_install', '-at_install')
+class TestTimetables(BusTicketCase):
+
+    def _way_point(self, stop):
+        return self.route.stop_line_ids.filtered(lambda line: line.stop_id == stop)
+
+    def test_timetable_is_ordered_by_sequence(self):
+        timetable = self.route._get_timetables()[self.route.id]
+        self.assertEqual(timetable, (
+            (self.stop_praha.id, timedelta()),
+            (self.stop_brno.id, timedelta(hours=2.5)),
+            (self.stop_olomouc.id, timedelta(hours=3.5)),
+            (self.stop_ostrava.id, timedelta(hours=5)),
+        ))
+        self.assertEqual(timetable_offset(timetable, self.stop_olomouc.id), timedelta(hours=3.5))
+        self.assertIsNone(timetable_offset(timetable, self.env['bus.ticket.stop'].create({'name': "Plzeň, CAN"}).id))
+        self.assertEqual(self.route._get_travel_duration(), timedelta(hours=5))
+
+    def test_waypoint_changes_bump_version(self):
+        trip = self.create_trip()
+        version = self.route.timetable_version
+        self._way_point(self.stop_brno).fare_offset = 210.0
+        self.assertEqual(self.route.timetable_version, version)
+
+        self._way_point(self.stop_ostrava).write({'offset_days': 1, 'offset_time': 1.0})
+        self.assertGreater(self.route.timetable_version, version)
+        self.assertEqual(trip.arrival_time, self.departure(3) + timedelta(days=1, hours=1))
+        self.assertEqual(self.template._get_arrival_datetime(self.departure(5)), self.departure(5) + timedelta(days=1, hours=1))
+
+        version = self.route.timetable_version
+        self._way_point(self.stop_olomouc).unlink()
+        self.assertGreater(self.route.timetable_version, version)
+        self.assertNotIn(self.stop_olomouc.id, [stop_id for stop_id, _offset in self.route._get_timetables()[self.route.id]])
+
+    def test_stop_etas_in_bulk(self):
+        trips = self.env['bus.ticket.trip'].browse()
+        for days in range(1, 6):
+            trips |= self.create_trip(days=days)
+        self.route._get_timetables()
+        self.env.invalidate_all()
+        # Jízdní řád je v cache, stačí načíst spoje (odjezdy) a verze jejich tras
+        with self.assertQueryCount(2):
+            etas = trips._get_stop_etas()
+        self.assertEqual(etas[trips[0].id], [
+            (self.stop_praha.id, self.departure(1)),
+            (self.stop_brno.id, self.departure(1) + timedelta(hours=2.5)),
+            (self.stop_olomouc.id, self.departure(1) + timedelta(hours=3.5)),
+            (self.stop_ostrava.id, self.departure(1) + timedelta(hours=5)),
+        ])
+        self.assertEqual([trip_etas[-1][1] for trip_etas in etas.values()], trips.mapped('arrival_time'))
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/tests/test_trip_archive.py
+
+from odoo.tests import tagged
+
+from .common import BusTicketCase
+
+
+@tagged('post_install', '-at_install')
+class TestTripArchive(BusTicketCase):
+
+    def setUp(self):
+        super().setUp()
+        self.env['ir.config_parameter'].sudo().set_param('bus_ticket_core.archive_after_days', 30)
+
+    def _archives(self):
+        return self.env['bus.ticket.trip.archive'].search([('route_id', '=', self.route.id)])
+
+    def test_cron_archives_only_old_finished_trips(self):
+        old_done = self.create_trip(days=-60, state='done')
+        old_cancelled = self.create_trip(days=-45, state='cancelled')
+        old_confirmed = self.create_trip(days=-60)
+        recent_done = self.create_trip(days=-10, state='done')
+        self.env['bus.ticket.trip.archive']._cron_archive_trips()
+
+        archives = self._archives()
+        self.assertEqual(sorted(archives.mapped('original_trip_id')), sorted([old_done.id, old_cancelled.id]))
+        self.assertFalse((old_done | old_cancelled).exists())
+        self.assertEqual((old_confirmed | recent_done).exists(), old_confirmed | recent_done)
+        self.assertFalse(self.env['bus.ticket.trip.seat'].search([('trip_id', 'in', [old_done.id, old_cancelled.id])]))
+
+    def test_archive_keeps_seats_sales_and_aggregates(self):
+        trip = self.create_trip(days=-60)
+        order = self.create_ticket_order(trip.seat_ids[:2])
+        order.action_confirm()
+        lines = order.order_line
+        trip.message_post(body="Delayed by 10 minutes")
+        trip.state = 'done'
+        trip_id, name, departure_time = trip.id, trip.name, trip.departure_time
+
+        archive = self.env['bus.ticket.trip.archive']._archive_trips(trip)
+        self.assertEqual((archive.original_trip_id, archive.name, archive.departure_time, archive.state), (trip_id, name, departure_time, 'done'))
+        self.assertEqual(archive.seat_states, 'S2A2')
+        self.assertEqual(archive._get_seat_states(), {1: 'sold', 2: 'sold', 3: 'available', 4: 'available'})
+        self.assertEqual((archive.seat_count, archive.sold_seats_count), (4, 2))
+        self.assertEqual((archive.order_count, archive.passenger_count), (1, 2))
+        self.assertAlmostEqual(archive.revenue, order.amount_total)
+        self.assertAlmostEqual(archive.load_factor, 50.0)
+        # Jízdenky zůstávají dohledatelné přes archiv
+        self.assertEqual(archive.sale_line_ids, lines)
+        self.assertFalse(lines.trip_id or lines.seat_id)
+        self.assertFalse(self.env['mail.message'].search([('model', '=', 'bus.ticket.trip'), ('res_id', '=', trip_id)]))
+
+    def test_archiving_can_be_disabled(self):
+        self.env['ir.config_parameter'].sudo().set_param('bus_ticket_core.archive_after_days', 0)
+        trip = self.create_trip(days=-60, state='done')
+        self.env['bus.ticket.trip.archive']._cron_archive_trips()
+        self.assertTrue(trip.exists())
+        self.assertFalse(self._archives())
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/tests/test_trip_generation.py
+
+from datetime import date, timedelta
+
+from odoo.tests import tagged
+
+from .common import BusTicketCase
+
+
+@tagged('post_install', '-at_install')
+class TestTripGeneration(BusTicketCase):
+
+    def _template_trips(self):
+        return self.env['bus.ticket.trip'].search([('trip_template_id', '=', self.template.id)])
+
+    def test_generation_advances_watermark(self):
+        horizon = date.today() + timedelta(days=6)
+        trips = self.template._generate_trips_until(horizon)
+        self.assertEqual(len(trips), 7)
+        self.assertEqual(self.template.generated_until, horizon)
+        self.assertEqual(sorted(trips.mapped('departure_time')),
+                         [self.departure(days) for days in range(7)])
+        # Druhý běh do stejného horizontu nic nevytváří
+        self.assertFalse(self.template._generate_trips_until(horizon))
+
+    def test_generation_only_extends_horizon(self):
+        self.template._generate_trips_until(date.today() + timedelta(days=2))
+        trips = self.template._generate_trips_until(date.today() + timedelta(days=4))
+        self.assertEqual(trips.mapped('departure_time'), [self.departure(3), self.departure(4)])
+
+    def test_schedule_change_resets_watermark(self):
+        self.template._generate_trips_until(date.today() + timedelta(days=2))
+        self.template.departure_time = 9.5
+        self.assertFalse(self.template.generated_until)
+
+    def test_exception_model_resets_watermark(self):
+        exception_date = date.today() + timedelta(days=2)
+        exception = self.env['bus.ticket.trip.template.exception'].create({
+            'template_id': self.template.id, 'date': exception_date, 'reason': "Holiday",
+        })
+        horizon = date.today() + timedelta(days=4)
+        self.template._generate_trips_until(horizon)
+        self.assertNotIn(self.departure(2), self._template_trips().mapped('departure_time'))
+
+        exception.unlink()
+        self.assertFalse(self.template.generated_until)
+        self.template._generate_trips_until(horizon)
+        self.assertIn(self.departure(2), self._template_trips().mapped('departure_time'))
+
+        self.env['bus.ticket.trip.template.exception'].create({
+            'template_id': self.template.id, 'date': date.today() + timedelta(days=3),
+        })
+        self.assertFalse(self.template.generated_until)
+        self.template._generate_trips_until(horizon)
+        exception = self.template.exception_date_ids
+        exception.date = date.today() + timedelta(days=5)
+        self.assertFalse(self.template.generated_until)
+
+    def test_cron_skips_templates_at_horizon(self):
+        Template = self.env['bus.ticket.trip.template']
+        horizon = date.today() + timedelta(days=Template._GENERATION_HORIZON_DAYS)
+        self.template.generated_until = horizon
+        Template._cron_generate_trips()
+        self.assertFalse(self._template_trips())
+
+
+@tagged('post_install', '-at_install')
+class TestVirtualDepartures(BusTicketCase):
+
+    def test_virtual_departures_skip_existing_trips(self):
+        Template = self.env['bus.ticket.trip.template']
+        self.create_trip(days=2, trip_template_id=self.template.id)
+        departures = Template._get_virtual_departures(self.route.ids, date.today() + timedelta(days=1), date.today() + timedelta(days=3))
+        self.assertEqual([departure['departure_time'] for departure in departures], [self.departure(1), self.departure(3)])
+        self.assertEqual(departures[0]['arrival_time'], self.departure(1) + timedelta(hours=5))
+        self.assertEqual(departures[0]['ref'], self.template._get_departure_ref(self.departure(1)))
+
+    def test_virtual_departures_stay_in_sales_window(self):
+        Template = self.env['bus.ticket.trip.template']
+        horizon = Template._GENERATION_HORIZON_DAYS
+        departures = Template._get_virtual_departures(self.route.ids, date.today() - timedelta(days=5), date.today() + timedelta(days=horizon + 5))
+        self.assertEqual(len(departures), horizon + 1)
+        self.assertEqual(departures[0]['departure_time'], self.departure(0))
+        self.assertEqual(departures[-1]['departure_time'], self.departure(horizon))
+
+    def test_resolving_ref_materializes_trip_once(self):
+        Trip = self.env['bus.ticket.trip']
+        ref = self.template._get_departure_ref(self.departure(4))
+        trip = Trip._resolve_trip_ref(ref)
+        self.assertEqual((trip.trip_template_id, trip.departure_time, trip.state), (self.template, self.departure(4), 'confirmed'))
+        self.assertEqual(len(trip.seat_ids), 4)
+        self.assertEqual(Trip._resolve_trip_ref(ref), trip)
+        self.assertEqual(Trip._resolve_trip_ref(str(trip.id)), trip)
+
+    def test_refs_outside_sales_window_are_rejected(self):
+        Template = self.env['bus.ticket.trip.template']
+        horizon = Template._GENERATION_HORIZON_DAYS
+        for ref in (
+            self.template._get_departure_ref(self.departure(-1)),
+            self.template._get_departure_ref(self.departure(horizon + 1)),
+            self.template._get_departure_ref(self.departure(4, hour=9)),
+            f"T0-{self.departure(4).strftime(Template._DEPARTURE_REF_FORMAT)}",
+            "T-garbage",
+        ):
+            self.assertEqual(Template._parse_departure_ref(ref), (Template, None), ref)
+            self.assertFalse(self.env['bus.ticket.trip']._resolve_trip_ref(ref))
+        self.template.active = False
+        self.assertFalse(Template._parse_departure_ref(self.template._get_departure_ref(self.departure(4)))[1])
+
+
+@tagged('post_install', '-at_install')
+class TestDisplayGroup(BusTicketCase):
+
+    def test_group_follows_departure_date(self):
+        trips = self.create_trip(days=-2) | self.create_trip(days=0) | self.create_trip(days=3)
+        self.assertEqual(trips.mapped('display_group'), ['past', 'today', 'future'])
+        trips[2].departure_time = self.departure(0, hour=20)
+        self.assertEqual(trips[2].display_group, 'today')
+        Trip = self.env['bus.ticket.trip']
+        # Výchozí řazení: v rámci skupiny od nejpozdějšího odjezdu
+        self.assertEqual(Trip.search([('id', 'in', trips.ids), ('display_group', '=', 'today')]).ids, [trips[2].id, trips[1].id])
+
+    def test_rollover_moves_only_crossed_trips(self):
+        past, today, tomorrow, later = (self.create_trip(days=days) for days in (-1, 0, 1, 3))
+        # Stav po půlnoci: skupiny spočítané ještě včera
+        self.env.flush_all()
+        self.env.cr.execute("UPDATE bus_ticket_trip SET display_group = 'today' WHERE id = %s", [past.id])
+        self.env.cr.execute("UPDATE bus_ticket_trip SET display_group = 'future' WHERE id = %s", [today.id])
+        self.env['bus.ticket.trip'].invalidate_model(['display_group'])
+
+        Trip = self.env['bus.ticket.trip']
+        self.assertEqual(sorted(Trip._cron_rollover_display_group()), sorted([past.id, today.id]))
+        self.assertEqual((past | today | tomorrow | later).mapped('display_group'), ['past', 'today', 'future', 'future'])
+        # Druhý běh už nemá co přeřadit
+        self.assertEqual(Trip._cron_rollover_display_group(), [])
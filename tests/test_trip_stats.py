@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/tests/test_trip_stats.py
+
+from odoo.tests import tagged
+
+from .common import BusTicketCase
+
+
+@tagged('post_install', '-at_install')
+class TestTripStats(BusTicketCase):
+
+    def _commit_stats(self):
+        """Spustí přepočet statistik, který jinak proběhne těsně před commitem transakce."""
+        self.env.flush_all()
+        self.env.cr.precommit.run()
+
+    def test_stats_follow_order_events(self):
+        trip = self.create_trip()
+        draft = self.create_ticket_order(trip.seat_ids[:2])
+        confirmed = self.create_ticket_order(trip.seat_ids[2], self.stop_praha, self.stop_brno)
+        confirmed.action_confirm()
+        self._commit_stats()
+        stats = trip.stats_ids
+        self.assertEqual((stats.order_count, stats.passenger_count, stats.seat_count), (2, 1, 4))
+        self.assertAlmostEqual(stats.revenue, confirmed.amount_total)
+        self.assertAlmostEqual(stats.load_factor, 25.0)
+        self.assertEqual((trip.order_count, trip.total_revenue), (2, stats.revenue))
+
+        draft._action_cancel()
+        self._commit_stats()
+        self.assertEqual((trip.stats_ids.order_count, trip.stats_ids.passenger_count), (1, 1))
+
+    def test_stats_are_rebuilt_once_per_transaction(self):
+        trips = self.create_trip(days=1) | self.create_trip(days=2)
+        for trip in trips:
+            self.create_ticket_order(trip.seat_ids[0]).action_confirm()
+        self.assertFalse(self.env['bus.ticket.trip.stats'].search([('trip_id', 'in', trips.ids)]))
+        self._commit_stats()
+        self.assertEqual(trips.stats_ids.mapped('passenger_count'), [1, 1])
+
+    def test_full_rebuild_fixes_drift(self):
+        trip, idle_trip = self.create_trip(days=1), self.create_trip(days=2)
+        order = self.create_ticket_order(trip.seat_ids[:2])
+        order.action_confirm()
+        self._commit_stats()
+        self.env.cr.execute("UPDATE bus_ticket_trip_stats SET revenue = 999, passenger_count = 0 WHERE trip_id = %s", [trip.id])
+        self.env['bus.ticket.trip.stats'].invalidate_model()
+        self.env['bus.ticket.trip.stats']._cron_rebuild_trip_stats()
+        self.assertEqual(trip.stats_ids.passenger_count, 2)
+        self.assertAlmostEqual(trip.stats_ids.revenue, order.amount_total)
+        self.assertEqual((idle_trip.stats_ids.order_count, idle_trip.stats_ids.load_factor), (0, 0.0))
@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/tools/__init__.py
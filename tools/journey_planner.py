@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/tools/journey_planner.py
+
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+# Časy spojení se drží v sekundách od epochy (porovnání intů je v cyklu skenu výrazně levnější než datetime)
+_EPOCH = datetime(1970, 1, 1)
+_INFINITY = float('inf')
+
+
+def to_seconds(dt):
+    return int((dt - _EPOCH).total_seconds())
+
+
+def from_seconds(seconds):
+    return _EPOCH + timedelta(seconds=seconds)
+
+
+class ConnectionIndex:
+    """Časově seřazené pole elementárních spojení (jeden úsek jednoho spoje mezi sousedními zastávkami).
+
+    Spojení je n-tice (odjezd, příjezd, ze zastávky, do zastávky, klíč spoje). Index se staví jednou
+    z dat v DB a vyhledávání nad ním už do DB nesahá. `trips` nese k popisu výsledků pro každý klíč spoje
+    libovolná data volajícího, `stops_by_city` mapuje normalizované město na id jeho zastávek.
+    """
+
+    def __init__(self, connections, trips=None, stops_by_city=None):
+        self.connections = sorted(connections)
+        self.departures = [connection[0] for connection in self.connections]
+        self.trips = trips or {}
+        self.stops_by_city = stops_by_city or {}
+
+    def __len__(self):
+        return len(self.connections)
+
+    def earliest_arrivals(self, origin_stops, destination_stops, earliest_departure, max_legs=3, min_connection_time=0):
+        """Connection Scan s počítáním spojů: jediný průchod polem spojení od earliest_departure.
+
+        Pro k = 1..max_legs hledá nejdřívější příjezd do cílových zastávek s přesně k spoji (k - 1 přestupů,
+        přestup jen na stejné zastávce a nejdřív po min_connection_time sekundách). Vrací Pareto-optimální
+        itineráře (víc přestupů jen při dřívějším příjezdu) jako seznamy úseků
+        (klíč spoje, ze zastávky, do zastávky, odjezd, příjezd), seřazené podle počtu přestupů.
+        """
+        destination_stops = set(destination_stops)
+        earliest = [dict.fromkeys(origin_stops, earliest_departure)] + [{} for _ in range(max_legs)]
+        boarded = [{} for _ in range(max_legs + 1)]     # k -> {klíč spoje: index nástupního spojení}
+        arrived_by = [{} for _ in range(max_legs + 1)]  # k -> {zastávka: (klíč spoje, nástup, výstup)}
+        best_arrival = _INFINITY
+        connections = self.connections
+        for index in range(bisect_left(self.departures, earliest_departure), len(connections)):
+            departure, arrival, stop_from, stop_to, trip_key = connections[index]
+            if departure > best_arrival:
+                break
+            for legs in range(1, max_legs + 1):
+                trip_boarded = boarded[legs]
+                if trip_key not in trip_boarded:
+                    reached = earliest[legs - 1].get(stop_from)
+                    if reached is None or reached + (min_connection_time if legs > 1 else 0) > departure:
+                        continue
+                    trip_boarded[trip_key] = index
+                if arrival < earliest[legs].get(stop_to, _INFINITY):
+                    earliest[legs][stop_to] = arrival
+                    arrived_by[legs][stop_to] = (trip_key, trip_boarded[trip_key], index)
+                    if stop_to in destination_stops and arrival < best_arrival:
+                        best_arrival = arrival
+
+        journeys = []
+        best_so_far = _INFINITY
+        for legs in range(1, max_legs + 1):
+            reached = [(earliest[legs][stop], stop) for stop in destination_stops if stop in earliest[legs]]
+            if not reached:
+                continue
+            arrival, stop = min(reached)
+            if arrival >= best_so_far:
+                continue
+            best_so_far = arrival
+            journeys.append(self._reconstruct(arrived_by, legs, stop))
+        return journeys
+
+    def _reconstruct(self, arrived_by, legs, stop):
+        journey = []
+        for leg in range(legs, 0, -1):
+            trip_key, board_index, alight_index = arrived_by[leg][stop]
+            boarding, alighting = self.connections[board_index], self.connections[alight_index]
+            journey.append((trip_key, boarding[2], alighting[3], boarding[0], alighting[1]))
+            stop = boarding[2]
+        journey.reverse()
+        return journey
+
+    def plan(self, origin_stops, destination_stops, earliest_departure, latest_departure=None,
+             max_transfers=2, min_connection_time=0, limit=10):
+        """Vyjmenuje až `limit` itinerářů s odjezdem v <earliest_departure, latest_departure>.
+
+        Po každém nalezeném nejlepším itineráři se hledá znovu s odjezdem o sekundu později,
+        takže výsledky pokrývají různé časy odjezdu (každý průchod je jeden sken pole spojení).
+        """
+        journeys, seen = [], set()
+        departure_from = earliest_departure
+        while len(journeys) < limit:
+            found = self.earliest_arrivals(origin_stops, destination_stops, departure_from,
+                                           max_legs=max_transfers + 1, min_connection_time=min_connection_time)
+            if not found:
+                break
+            first_departure = min(journey[0][3] for journey in found)
+            if latest_departure is not None and first_departure > latest_departure:
+                break
+            for journey in found:
+                signature = tuple((leg[0], leg[1], leg[2]) for leg in journey)
+                if signature not in seen and (latest_departure is None or journey[0][3] <= latest_departure):
+                    seen.add(signature)
+                    journeys.append(journey)
+            departure_from = first_departure + 1
+        journeys.sort(key=lambda journey: (journey[0][3], journey[-1][4]))
+        return journeys[:limit]
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/tools/metrics.py
+
+import functools
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+_logger = logging.getLogger(__name__)
+
+# Hranice košů histogramů: doba (s) a počet SQL dotazů
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUERIES_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+# Systémový parametr s prahem (ms) pro log pomalých požadavků; 0 nebo nevyplněno = vypnuto
+SLOW_REQUEST_PARAM = 'bus_ticket_core.slow_request_ms'
+
+
+class Histogram:
+    """Histogram s pevnými koši (kumulativní až při exportu, takže záznam je jen bisect a dvě sčítání)."""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Metriky procesu workeru: histogramy a čítače podle názvu a štítků.
+
+    Každý worker má vlastní hodnoty (stejně jako cache vyhledávání) a /api/v1/metrics vrací jen
+    hodnoty workeru, který požadavek obsloužil. Workery režimu prefork sdílejí jeden HTTP port,
+    takže jednotlivé scrapy trefují náhodné workery a čítače mezi nimi zdánlivě skáčou a nulují se;
+    sčítat je po workerech nelze. Spolehlivé řady dává jen server, kde všechny požadavky API
+    obsluhuje jeden proces (vláknový režim, --workers=0); při více workerech je třeba hodnoty
+    exportovat do sdíleného úložiště (např. statsd nebo multiprocess režim klienta Prometheus).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = defaultdict(float)
+        self._help = {}
+
+    def observe(self, name, value, buckets, help_text='', **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+                self._help.setdefault(name, help_text)
+            histogram.observe(value)
+
+    def increment(self, name, value=1, help_text='', **labels):
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] += value
+            self._help.setdefault(name, help_text)
+
+    def render_prometheus(self):
+        """Vyrenderuje všechny metriky v textovém formátu Prometheus (verze 0.0.4)."""
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            help_texts = dict(self._help)
+        lines, declared = [], set()
+
+        def declare(name, metric_type):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# HELP {name} {help_texts.get(name) or name}")
+                lines.append(f"# TYPE {name} {metric_type}")
+
+        for (name, labels), value in counters:
+            declare(name, 'counter')
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for (name, labels), histogram in histograms:
+            declare(name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    ) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+registry = MetricsRegistry()
+_local = threading.local()
+
+
+class Trace:
+    """Měření jedné operace (požadavku API nebo běhu cronu) rozdělené na pojmenované fáze.
+
+    Každá fáze zaznamená dobu a počet SQL dotazů kurzoru; při ukončení se fáze i celek
+    zapíšou do histogramů registru a pomalá operace se zaloguje i s rozpisem fází.
+    """
+
+    def __init__(self, kind, operation, cr, slow_threshold_ms=0):
+        self.kind = kind
+        self.operation = operation
+        self.cr = cr
+        self.slow_threshold_ms = slow_threshold_ms
+        self.stages = []
+        self.status = 'ok'
+        self._started = self._lap_started = time.perf_counter()
+        self._queries_started = self._lap_queries = self._query_count()
+
+    def _query_count(self):
+        return getattr(self.cr, 'sql_log_count', 0)
+
+    @contextmanager
+    def stage(self, name):
+        started, queries_started = time.perf_counter(), self._query_count()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.perf_counter() - started, self._query_count() - queries_started))
+
+    def checkpoint(self, name):
+        """Uzavře fázi `name` trvající od předchozího checkpointu (nebo začátku operace)."""
+        now, queries = time.perf_counter(), self._query_count()
+        self.stages.append((name, now - self._lap_started, queries - self._lap_queries))
+        self._lap_started, self._lap_queries = now, queries
+
+    def finish(self):
+        status = self.status
+        duration = time.perf_counter() - self._started
+        queries = self._query_count() - self._queries_started
+        labels = {self.kind: self.operation}
+        registry.observe(f'bus_ticket_{self.kind}_duration_seconds', duration, SECONDS_BUCKETS,
+                         f"Duration of bus ticket {self.kind}s.", status=status, **labels)
+        registry.observe(f'bus_ticket_{self.kind}_queries', queries, QUERIES_BUCKETS,
+                         f"SQL queries per bus ticket {self.kind}.", **labels)
+        for name, stage_duration, stage_queries in self.stages:
+            registry.observe('bus_ticket_stage_duration_seconds', stage_duration, SECONDS_BUCKETS,
+                             "Duration of instrumented stages.", stage=name, **labels)
+            registry.observe('bus_ticket_stage_queries', stage_queries, QUERIES_BUCKETS,
+                             "SQL queries of instrumented stages.", stage=name, **labels)
+        if self.slow_threshold_ms and duration * 1000 >= self.slow_threshold_ms:
+            _logger.warning(
+                "Slow %s %s: %.1f ms, %s queries, status %s; stages: %s", self.kind, self.operation,
+                duration * 1000, queries, status,
+                ', '.join(f"{name} {stage_duration * 1000:.1f} ms/{stage_queries} q"
+                          for name, stage_duration, stage_queries in self.stages) or '-',
+            )
+
+
+def current_trace():
+    return getattr(_local, 'trace', None)
+
+
+@contextmanager
+def stage(name):
+    """Změří fázi aktuální operace; mimo instrumentovanou operaci nic nedělá."""
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+    with trace.stage(name):
+        yield
+
+
+def checkpoint(name):
+    """Uzavře fázi aktuální operace od předchozího checkpointu; mimo instrumentovanou operaci nic nedělá."""
+    trace = current_trace()
+    if trace is not None:
+        trace.checkpoint(name)
+
+
+def increment(name, value=1, help_text='', **labels):
+    """Přičte k čítači; štítek s operací se doplní z aktuálního měření, pokud nějaké běží."""
+    trace = current_trace()
+    if trace is not None:
+        labels.setdefault(trace.kind, trace.operation)
+    registry.increment(name, value, help_text, **labels)
+
+
+def _slow_threshold_ms(env):
+    try:
+        return int(env['ir.config_parameter'].sudo().get_param(SLOW_REQUEST_PARAM) or 0)
+    except ValueError:
+        return 0
+
+
+@contextmanager
+def traced(kind, operation, env):
+    """Otevře měření operace; vnořené měření (např. cron volaný z jiného) se započítá do vnějšího."""
+    if current_trace() is not None:
+        with stage(operation):
+            yield current_trace()
+        return
+    trace = _local.trace = Trace(kind, operation, env.cr, _slow_threshold_ms(env))
+    try:
+        yield trace
+    except Exception:
+        trace.status = 'error'
+        raise
+    finally:
+        _local.trace = None
+        trace.finish()
+
+
+def _response_status(result):
+    """Stav odpovědi kontroleru pro štítek metriky: HTTP kód, u JSON-RPC kód z klíče error."""
+    status_code = getattr(result, 'status_code', None)
+    if status_code is not None:
+        return str(status_code)
+    if isinstance(result, dict) and isinstance(result.get('error'), dict):
+        return str(result['error'].get('code', 'error'))
+    return '200'
+
+
+def instrument_request(endpoint):
+    """Dekorátor metody kontroleru: změří celý požadavek (fáze se značí pomocí checkpoint() a stage())."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            from odoo.http import request
+            with traced('request', endpoint, request.env) as trace:
+                result = method(self, *args, **kwargs)
+                trace.status = _response_status(result)
+                return result
+        return wrapper
+    return decorator
+
+
+def instrument_job(job):
+    """Dekorátor metody modelu (cron): změří celý běh."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with traced('job', job, self.env):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
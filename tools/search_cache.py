@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+# soubor: bus_ticket_core/tools/search_cache.py
+
+import threading
+import time
+from collections import OrderedDict, defaultdict, namedtuple
+
+# Výchozí velikost a životnost cache výsledků vyhledávání
+SEARCH_CACHE_MAX_SIZE = 2048
+SEARCH_CACHE_TTL = 60
+# Indexy spojení se drží pro několik dní hledání dopředu, každý pokrývá celou síť
+CONNECTION_INDEX_CACHE_SIZE = 8
+
+# Log zneplatnění sdílený workery: každá transakce, která zneplatnila výsledky, do něj při commitu
+# zapíše jeden řádek s dotčenými trasami a spoji a se svým xid
+INVALIDATION_LOG_TABLE = 'bus_ticket_search_invalidation'
+
+
+class Snapshot(namedtuple('Snapshot', ['xmin', 'xmax', 'xip'])):
+    """Snímek transakce PostgreSQL (txid_current_snapshot) pro test viditelnosti xid bez dotazu."""
+
+    @classmethod
+    def parse(cls, text):
+        xmin, xmax, xip = text.split(':')
+        return cls(int(xmin), int(xmax), frozenset(int(xid) for xid in xip.split(',') if xid))
+
+    def is_visible(self, xid):
+        """Stejně jako txid_visible_in_snapshot: transakce skončila před pořízením snímku."""
+        return xid < self.xmin or (xid < self.xmax and xid not in self.xip)
+
+
+class SearchResultCache:
+    """LRU cache serializovaných výsledků /api/v1/trips/search s omezenou životností (TTL).
+
+    Každý záznam si pamatuje trasy a spoje, ze kterých vznikl, aby šel zneplatnit přesně
+    při změně kteréhokoli z nich. Cache žije v procesu workeru; změny z jiných workerů
+    načte sync() z logu zneplatnění (INVALIDATION_LOG_TABLE) na začátku každého požadavku.
+
+    Log se čte podle xid, ne podle pořadí řádků: transakce s xid pod xmin snímku jsou jistě
+    ukončené a jejich řádky už viditelné, takže stačí číst řádky od xmin posledního zpracovaného
+    snímku. Řádky ještě běžících transakcí se zpracují, až budou viditelné.
+    """
+
+    def __init__(self, max_size=SEARCH_CACHE_MAX_SIZE, ttl=SEARCH_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._entries = OrderedDict()   # key -> (expires_at, payload, route_ids, trip_ids)
+        self._keys_by_route = defaultdict(set)
+        self._keys_by_trip = defaultdict(set)
+        self._synced_xmin = None        # xmin snímku, do kterého je log zneplatnění zpracovaný
+        self._applied = OrderedDict()   # id řádku logu -> (zpracováno v, xid, route_ids, trip_ids)
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] < time.monotonic():
+                self._remove(key)
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, payload, route_ids=(), trip_ids=(), snapshot=None):
+        """Uloží výsledek. snapshot (z sync()) je snímek, ze kterého výsledek vznikl: výsledek se
+        neuloží, pokud už cache zpracovala zneplatnění jeho tras nebo spojů z transakce, kterou tento
+        snímek neviděl (jinak by zastaralý výsledek přežil až do TTL).
+        """
+        with self._lock:
+            if snapshot is not None and any(
+                not snapshot.is_visible(xid) and (not route_ids_.isdisjoint(route_ids) or not trip_ids_.isdisjoint(trip_ids))
+                for _applied_at, xid, route_ids_, trip_ids_ in self._applied.values()
+            ):
+                return
+            if key in self._entries:
+                self._remove(key)
+            route_ids, trip_ids = frozenset(route_ids), frozenset(trip_ids)
+            self._entries[key] = (time.monotonic() + self.ttl, payload, route_ids, trip_ids)
+            for route_id in route_ids:
+                self._keys_by_route[route_id].add(key)
+            for trip_id in trip_ids:
+                self._keys_by_trip[trip_id].add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, route_ids=(), trip_ids=()):
+        """Zahodí všechny záznamy, které závisí na některé z tras nebo spojů."""
+        with self._lock:
+            keys = set()
+            for route_id in route_ids:
+                keys.update(self._keys_by_route.get(route_id, ()))
+            for trip_id in trip_ids:
+                keys.update(self._keys_by_trip.get(trip_id, ()))
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+
+    def sync(self, cr):
+        """Zpracuje řádky logu zneplatnění, které od posledního volání zapsaly jiné workery.
+
+        Vrací aktuální snímek kurzoru (Snapshot); volající ho předá do put() s výsledkem spočítaným
+        v tomtéž snímku.
+        """
+        cr.execute("SELECT txid_current_snapshot()::text")
+        snapshot = Snapshot.parse(cr.fetchone()[0])
+        with self._lock:
+            synced_xmin = self._synced_xmin
+        if synced_xmin is None:
+            # Prázdná cache nemá co zneplatnit, log stačí číst od tohoto snímku
+            rows = []
+        else:
+            cr.execute(f"SELECT id, xid, route_ids, trip_ids FROM {INVALIDATION_LOG_TABLE} WHERE xid >= %s",
+                       [synced_xmin])
+            rows = cr.fetchall()
+        with self._lock:
+            for log_id, xid, route_ids, trip_ids in rows:
+                if log_id not in self._applied:
+                    self.invalidate(route_ids, trip_ids)
+                    self._mark_applied(log_id, xid, route_ids, trip_ids)
+            self._synced_xmin = max(snapshot.xmin, self._synced_xmin or snapshot.xmin)
+            self._prune_applied()
+        return snapshot
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_route.clear()
+            self._keys_by_trip.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries), 'max_size': self.max_size, 'ttl': self.ttl,
+                'hits': self.hits, 'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions, 'invalidations': self.invalidations,
+            }
+
+    def _mark_applied(self, log_id, xid, route_ids, trip_ids):
+        self._applied[log_id] = (time.monotonic(), xid, frozenset(route_ids), frozenset(trip_ids))
+
+    def _prune_applied(self):
+        """Zapomene zpracované řádky, které už sync() nenačte (xid pod xmin) a jsou starší než TTL."""
+        expired = time.monotonic() - self.ttl
+        for log_id, (applied_at, xid, _route_ids, _trip_ids) in list(self._applied.items()):
+            if applied_at >= expired:
+                break
+            if xid < self._synced_xmin:
+                del self._applied[log_id]
+
+    def _remove(self, key):
+        _expires_at, _payload, route_ids, trip_ids = self._entries.pop(key)
+        for route_id in route_ids:
+            self._discard(self._keys_by_route, route_id, key)
+        for trip_id in trip_ids:
+            self._discard(self._keys_by_trip, trip_id, key)
+
+    @staticmethod
+    def _discard(index, item_id, key):
+        keys = index.get(item_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del index[item_id]
+
+
+class ConnectionIndexCache(SearchResultCache):
+    """Cache indexů spojení plánovače cest (klíč: datum), oddělená od výsledků vyhledávání i v jejich statistice.
+
+    Index pokrývá všechny trasy, takže ho zneplatní změna kterékoli trasy, včetně nového spoje
+    na trase, která dosud žádné odjezdy neměla. Zneplatnění jen podle spojů (prodej sedadel
+    mění čítače, ne jízdní řád) index nechávají.
+    """
+
+    def __init__(self, max_size=CONNECTION_INDEX_CACHE_SIZE, ttl=SEARCH_CACHE_TTL):
+        super().__init__(max_size, ttl)
+
+    def put(self, key, payload, snapshot=None):
+        with self._lock:
+            if snapshot is not None and any(
+                route_ids and not snapshot.is_visible(xid) for _applied_at, xid, route_ids, _trip_ids in self._applied.values()
+            ):
+                return
+            super().put(key, payload)
+
+    def invalidate(self, route_ids=(), trip_ids=()):
+        if not route_ids:
+            return
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self.clear()
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def _get_cache(dbname, cache_class):
+    with _caches_lock:
+        if (cache_class, dbname) not in _caches:
+            _caches[cache_class, dbname] = cache_class()
+        return _caches[cache_class, dbname]
+
+
+def get_search_cache(dbname):
+    """Vrátí cache výsledků vyhledávání pro danou databázi."""
+    return _get_cache(dbname, SearchResultCache)
+
+
+def get_connection_index_cache(dbname):
+    """Vrátí cache indexů spojení plánovače cest pro danou databázi."""
+    return _get_cache(dbname, ConnectionIndexCache)
+
+
+def invalidate_search_cache(env, route_ids=(), trip_ids=()):
+    """Zneplatní výsledky závislé na trasách/spojích hned i po commitu transakce a ostatním
+    workerům přes log zneplatnění.
+
+    Druhé zneplatnění po commitu zahodí výsledky, které si mezitím uložil souběžný
+    požadavek ještě ze starých (necommitnutých) dat. Všechna zneplatnění transakce se do logu
+    zapíšou jedním řádkem těsně před commitem.
+    """
+    route_ids, trip_ids = tuple(route_ids), tuple(trip_ids)
+    if not route_ids and not trip_ids:
+        return
+    caches = (get_search_cache(env.cr.dbname), get_connection_index_cache(env.cr.dbname))
+
+    def invalidate():
+        for cache in caches:
+            cache.invalidate(route_ids, trip_ids)
+    invalidate()
+    env.cr.postcommit.add(invalidate)
+
+    pending = env.cr.precommit.data.get(INVALIDATION_LOG_TABLE)
+    if pending is None:
+        pending = env.cr.precommit.data[INVALIDATION_LOG_TABLE] = {'route_ids': set(), 'trip_ids': set()}
+        env.cr.precommit.add(lambda: _write_invalidation_log(env.cr, caches, pending))
+    pending['route_ids'].update(route_ids)
+    pending['trip_ids'].update(trip_ids)
+
+
+def _write_invalidation_log(cr, caches, pending):
+    route_ids, trip_ids = sorted(pending['route_ids']), sorted(pending['trip_ids'])
+    cr.execute(f"""
+        INSERT INTO {INVALIDATION_LOG_TABLE} (route_ids, trip_ids) VALUES (%s, %s)
+        RETURNING id, xid
+    """, [route_ids, trip_ids])
+    log_id, xid = cr.fetchone()
+    # Vlastní worker zneplatnil lokálně už při zápisu, sync() ten řádek přeskočí
+
+    def mark_applied():
+        for cache in caches:
+            with cache._lock:
+                cache._mark_applied(log_id, xid, route_ids, trip_ids)
+    cr.postcommit.add(mark_applied)
+
+
+def create_invalidation_log(cr):
+    """Vytvoří tabulku logu zneplatnění (volá se z init() modelu spojů)."""
+    cr.execute(f"""
+        CREATE TABLE IF NOT EXISTS {INVALIDATION_LOG_TABLE} (
+            id bigserial PRIMARY KEY,
+            xid bigint NOT NULL DEFAULT txid_current(),
+            route_ids integer[] NOT NULL DEFAULT '{{}}',
+            trip_ids integer[] NOT NULL DEFAULT '{{}}',
+            create_date timestamp NOT NULL DEFAULT (now() AT TIME ZONE 'UTC')
+        );
+        CREATE INDEX IF NOT EXISTS {INVALIDATION_LOG_TABLE}_xid_index ON {INVALIDATION_LOG_TABLE} (xid);
+    """)
+
+
+def prune_invalidation_log(cr, max_age_seconds):
+    """Smaže řádky logu starší než max_age_seconds; výsledky, kterých se týkaly, už vypršely (TTL)."""
+    cr.execute(f"DELETE FROM {INVALIDATION_LOG_TABLE} WHERE create_date < (now() AT TIME ZONE 'UTC') - make_interval(secs => %s)",
+               [max_age_seconds])